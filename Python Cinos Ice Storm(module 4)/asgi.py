@@ -0,0 +1,412 @@
+# ASGI version of the ordering API, for running on an asyncio event loop.
+# It serves the same routes as the Flask app in main.py and shares its order
+# store, item types, and catalog, so both can be run against the same code.
+#
+# With a write-ahead log attached (or the SQLite store), using the store can
+# wait on an fsync or a database lock, so those calls run in a thread with
+# asyncio.to_thread instead of holding up the event loop. That also lets
+# requests at the same time share one fsync through group commit.
+#
+# Command to run it: uvicorn asgi:app
+# Command to compare it with the Flask app: python benchmarks/bench_asgi.py
+
+import asyncio
+import hashlib
+import json
+from functools import partial
+from urllib.parse import parse_qsl
+
+import main
+
+# Most bytes a request body can be
+maxBodySize = 1 << 20
+
+# Message for each item route that adds one item
+addedMessages = {
+    "drink": "Drink added successfully.",
+    "food": "Food added successfully.",
+    "ice storm": "Ice Storm added successfully.",
+}
+
+# Last part of the URL for each item route that adds one item
+itemRoutes = {
+    (): "drink",
+    ("food",): "food",
+    ("ice-storm",): "ice storm",
+}
+
+
+async def read_body(receive):
+    """
+    Reads the whole request body without blocking the event loop.
+
+    Args:
+        receive (callable): ASGI receive function.
+
+    Returns:
+        bytes: the body, or None if it's bigger than maxBodySize.
+    """
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return b""
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > maxBodySize:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def send_json(send, status, body, etag=None, replayed=False):
+    """
+    Sends a JSON response.
+
+    Args:
+        send (callable): ASGI send function.
+        status (int): HTTP status.
+        body (dict): response body, or None for no body.
+        etag (str): ETag to send, without quotes.
+        replayed (bool): whether it's a remembered response for an Idempotency-Key.
+    """
+    await send_data(send, status, b"" if body is None else json.dumps(body).encode(), etag, replayed)
+
+
+async def send_data(send, status, data, etag=None, replayed=False):
+    """
+    Sends a response body that's already JSON encoded.
+
+    Args:
+        send (callable): ASGI send function.
+        status (int): HTTP status.
+        data (bytes): the encoded body, empty for no body.
+        etag (str): ETag to send, without quotes.
+        replayed (bool): whether it's a remembered response for an Idempotency-Key.
+    """
+    headers = [(b"content-length", str(len(data)).encode())]
+    if data:
+        headers.append((b"content-type", b"application/json"))
+    if etag:
+        headers.append((b"etag", f'"{etag}"'.encode()))
+    if replayed:
+        headers.append((b"idempotent-replayed", b"true"))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": data})
+
+
+async def run_store(function, *args):
+    """
+    Runs a function that uses the order store, in a thread if the store can
+    block on disk.
+
+    Args:
+        function (callable): the function.
+        *args: arguments for it.
+
+    Returns:
+        whatever the function returns.
+    """
+    store = main.store
+    if store.log is None and not store.shared:
+        return function(*args)
+    return await asyncio.to_thread(function, *args)
+
+
+def parse_json(body):
+    """
+    Parses a JSON request body.
+
+    Args:
+        body (bytes): the request body.
+
+    Returns:
+        dict: the parsed body, or None if it isn't a JSON object.
+    """
+    try:
+        data = json.loads(body or b"null")
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def split_path(path):
+    """
+    Splits a URL path into the order id and the rest of the path.
+
+    Args:
+        path (str): URL path.
+
+    Returns:
+        tuple: order id and the rest of the path as a tuple, or (None, None)
+            if the path isn't an order path.
+    """
+    parts = tuple(part for part in path.split("/") if part)
+    if parts[:1] == ("order",):
+        return main.DEFAULT_ORDER_ID, parts[1:]
+    if parts[:1] == ("orders",) and len(parts) >= 2:
+        return parts[1], parts[2:]
+    return None, None
+
+
+def get_order(order_id, query, headers):
+    """
+    Gets an order, like GET /order in main.py.
+
+    Args:
+        order_id (str): id of the order.
+        query (dict): query parameters.
+        headers (dict): request headers.
+
+    Returns:
+        tuple: status, body, and ETag.
+    """
+    paged = any(arg in query for arg in ("limit", "cursor", "type"))
+    if paged:
+        limit, cursor, itemType, error = main.read_page_args(query)
+        if error:
+            return 400, {"error": error}, None
+
+    with main.store.checkout(order_id, write=False) as order:
+        if order is None:
+            return 404, {"error": "Order not found"}, None
+        etag = order.get_etag()
+        if f'"{etag}"' in headers.get("if-none-match", ""):
+            return 304, None, etag
+        body = {}
+        if paged:
+            body["items"], body["next_cursor"] = order.get_receipt_page(limit, cursor, itemType)
+        else:
+            body["items"] = order.get_receipt()
+        body["totals"] = order.get_total_after_tax()
+        body["subtotals"] = order.get_subtotals()
+        body["num_items"] = len(order)
+    return 200, body, etag
+
+
+def add_items(order_id, kind, data):
+    """
+    Adds one item or a batch of items to an order.
+
+    Args:
+        order_id (str): id of the order.
+        kind (str): item type tag, or "batch".
+        data (dict): the request body.
+
+    Returns:
+        tuple: status and body.
+    """
+    if kind == "batch":
+        payloads = data.get("items")
+        if not isinstance(payloads, list) or not payloads:
+            return 400, {"error": "Items are required"}
+        items, errors = main.build_items(payloads)
+        if errors:
+            return 400, {"errors": errors}
+    else:
+        item, errors = main.itemDefinitions[kind].validate(data)
+        if errors:
+            return 400, main.itemDefinitions[kind].error_body(data, errors)
+        items = [item]
+
+    with main.store.checkout(order_id) as order:
+        if order is None:
+            return 404, {"error": "Order not found"}
+        order.add_items(items)
+        numItems = len(order)
+    if kind == "batch":
+        return 201, {"message": "Items added successfully.", "num_added": len(items), "num_items": numItems}
+    return 201, {"message": addedMessages[kind]}
+
+
+def add_route(order_id, rest, body):
+    """
+    Handles a POST item route.
+
+    Args:
+        order_id (str): id of the order.
+        rest (tuple): the rest of the path, a key of itemRoutes or ("batch",).
+        body (bytes): the request body.
+
+    Returns:
+        tuple: status and body.
+    """
+    data = parse_json(body)
+    if data is None:
+        return 400, {"error": "Request body must be a JSON object"}
+    return add_items(order_id, itemRoutes.get(rest, "batch"), data)
+
+
+def add_route_encoded(order_id, rest, body):
+    """
+    Handles a POST item route, giving the response the way the
+    Idempotency-Key caches keep it, like the Flask app's.
+
+    Args:
+        order_id (str): id of the order.
+        rest (tuple): the rest of the path, a key of itemRoutes or ("batch",).
+        body (bytes): the request body.
+
+    Returns:
+        tuple: encoded body and status.
+    """
+    status, data = add_route(order_id, rest, body)
+    return json.dumps(data).encode(), status
+
+
+def remove_item(order_id, rest):
+    """
+    Removes an item by index or by id.
+
+    Args:
+        order_id (str): id of the order.
+        rest (tuple): "<index>" or "items", "<id>".
+
+    Returns:
+        tuple: status and body, or None if the path isn't a remove route.
+    """
+    if len(rest) == 1 and rest[0].isdigit():
+        byId = False
+        number = int(rest[0])
+    elif len(rest) == 2 and rest[0] == "items" and rest[1].isdigit():
+        byId = True
+        number = int(rest[1])
+    else:
+        return None
+
+    with main.store.checkout(order_id) as order:
+        if order is None:
+            return 404, {"error": "Order not found"}
+        error = order.remove_item_by_id(number) if byId else order.remove_item(number)
+    if error:
+        return 400, {"error": error}
+    return 200, {"message": "Item removed successfully."}
+
+
+def remove_items(order_id, body):
+    """
+    Removes several items at once, like DELETE /order/items in main.py.
+
+    Args:
+        order_id (str): id of the order.
+        body (bytes): the request body.
+
+    Returns:
+        tuple: status and body.
+    """
+    data = parse_json(body) or {}
+    indexes = data.get("indexes")
+    itemType = data.get("type")
+    if (indexes is None) == (itemType is None):
+        return 400, {"error": "Either indexes or type is required"}
+    if indexes is not None and not isinstance(indexes, list):
+        return 400, {"error": "Invalid index"}
+    if itemType is not None and not isinstance(itemType, str):
+        return 400, {"error": "Invalid type"}
+
+    with main.store.checkout(order_id) as order:
+        if order is None:
+            return 404, {"error": "Order not found"}
+        numBefore = len(order)
+        error = order.remove_items(indexes, itemType)
+        if error:
+            return 400, {"error": error}
+        numItems = len(order)
+        totals = order.get_total_after_tax()
+    return 200, {
+        "message": "Items removed successfully.",
+        "num_removed": numBefore - numItems,
+        "num_items": numItems,
+        "totals": totals,
+    }
+
+
+async def app(scope, receive, send):
+    """
+    The ASGI application.
+
+    Args:
+        scope (dict): ASGI connection scope.
+        receive (callable): ASGI receive function.
+        send (callable): ASGI send function.
+    """
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+    try:
+        await handle_http(scope, receive, send)
+    except main.StoreUnavailable:
+        await send_json(send, 503, {"error": "Orders can't be saved right now"})
+
+
+async def handle_http(scope, receive, send):
+    """
+    Answers one HTTP request.
+
+    Args:
+        scope (dict): ASGI connection scope.
+        receive (callable): ASGI receive function.
+        send (callable): ASGI send function.
+    """
+    method = scope["method"]
+    path = scope["path"]
+    headers = {name.decode().lower(): value.decode() for name, value in scope.get("headers", [])}
+    if path == "/" and method == "GET":
+        return await send_json(send, 200, {"message": "add /order in the url to use"})
+    if path.rstrip("/") == "/orders" and method == "POST":
+        return await send_json(send, 201, {"order_id": await run_store(main.store.create_order)})
+
+    order_id, rest = split_path(path)
+    if order_id is None:
+        return await send_json(send, 404, {"error": "Not found"})
+
+    if method == "GET" and not rest:
+        query = dict(parse_qsl(scope.get("query_string", b"").decode()))
+        status, body, etag = await run_store(get_order, order_id, query, headers)
+        return await send_json(send, status, body, etag)
+
+    if method == "POST" and (rest in itemRoutes or rest == ("batch",)):
+        body = await read_body(receive)
+        if body is None:
+            return await send_json(send, 413, {"error": "Request body is too large"})
+        key = headers.get("idempotency-key")
+        if key is not None and main.idempotencyCache.maxEntries:
+            if not key or len(key) > 255:
+                return await send_json(send, 400, {"error": "Invalid Idempotency-Key"})
+            fingerprint = hashlib.blake2b(body, digest_size=16).digest()
+            compute = partial(add_route_encoded, order_id, rest, body)
+            saved, replayed, error = await run_store(main.idempotency_cache().run, (path, key), fingerprint, compute)
+            if error:
+                return await send_json(send, 422, {"error": error})
+            return await send_data(send, saved[1], saved[0], replayed=replayed)
+        return await send_json(send, *await run_store(add_route, order_id, rest, body))
+
+    if method == "DELETE":
+        if not rest and path.startswith("/orders/"):
+            if not await run_store(main.store.delete_order, order_id):
+                return await send_json(send, 404, {"error": "Order not found"})
+            return await send_json(send, 200, {"message": "Order deleted successfully."})
+        if rest == ("items",):
+            body = await read_body(receive)
+            if body is None:
+                return await send_json(send, 413, {"error": "Request body is too large"})
+            return await send_json(send, *await run_store(remove_items, order_id, body))
+        result = await run_store(remove_item, order_id, rest)
+        if result is not None:
+            return await send_json(send, *result)
+
+    await send_json(send, 404, {"error": "Not found"})
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app)
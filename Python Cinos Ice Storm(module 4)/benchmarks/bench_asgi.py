@@ -0,0 +1,181 @@
+# Compares the Flask app with the ASGI app on the same workload.
+#
+# Both apps are called in process through their raw callables, WSGI with a
+# hand built environ and ASGI with a hand built scope, so neither pays for a
+# test client or server the other doesn't. The numbers are the cost of the
+# apps, not of a network. Both run one cart at a time, and then the ASGI app
+# runs again with many carts at once.
+#
+# Command to run: python benchmarks/bench_asgi.py [number of carts]
+
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asgi  # noqa: E402
+import main  # noqa: E402
+
+# Requests made for each cart, after the cart is created
+cartRequests = [
+    ("POST", "", {"size": "large", "base": "sbrite", "flavors": ["lemon", "lime"]}),
+    ("POST", "/food", {"foodType": "nacho chips", "toppings": ["nacho cheese", "chili"]}),
+    ("POST", "/ice-storm", {"flavor": "mint chocolate chip", "mix_ins": ["cherry", "storios"]}),
+    ("GET", "", None),
+    ("DELETE", "/0", None),
+    ("DELETE", "/items", {"type": "drink"}),
+    ("GET", "", None),
+]
+
+
+def call_wsgi(method, path, body=None):
+    """
+    Sends one request to the Flask app's WSGI callable.
+
+    Args:
+        method (str): HTTP method.
+        path (str): URL path.
+        body (dict): JSON body.
+
+    Returns:
+        bytes: the response body.
+    """
+    data = json.dumps(body).encode() if body is not None else b""
+    environ = {
+        "REQUEST_METHOD": method,
+        "PATH_INFO": path,
+        "QUERY_STRING": "",
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "CONTENT_LENGTH": str(len(data)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(data),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": False,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    if body is not None:
+        environ["CONTENT_TYPE"] = "application/json"
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    result = main.app(environ, start_response)
+    try:
+        return b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+
+
+def run_flask(numCarts):
+    """
+    Runs the workload against the Flask app, one cart at a time.
+
+    Args:
+        numCarts (int): number of carts to make.
+
+    Returns:
+        int: number of requests made.
+    """
+    count = 0
+    for _ in range(numCarts):
+        order_id = json.loads(call_wsgi("POST", "/orders"))["order_id"]
+        count += 1
+        for method, suffix, body in cartRequests:
+            call_wsgi(method, f"/orders/{order_id}{suffix}", body)
+            count += 1
+    return count
+
+
+async def call_asgi(method, path, body=None):
+    """
+    Sends one request to the ASGI app.
+
+    Args:
+        method (str): HTTP method.
+        path (str): URL path.
+        body (dict): JSON body.
+
+    Returns:
+        bytes: the response body.
+    """
+    data = json.dumps(body).encode() if body is not None else b""
+    messages = [{"type": "http.request", "body": data, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop() if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": b"", "headers": []}
+    await asgi.app(scope, receive, send)
+    return sent[-1]["body"]
+
+
+async def asgi_cart():
+    """
+    Makes one cart on the ASGI app.
+
+    Returns:
+        int: number of requests made.
+    """
+    order_id = json.loads(await call_asgi("POST", "/orders"))["order_id"]
+    for method, suffix, body in cartRequests:
+        await call_asgi(method, f"/orders/{order_id}{suffix}", body)
+    return len(cartRequests) + 1
+
+
+async def run_asgi(numCarts, concurrency=100):
+    """
+    Runs the workload against the ASGI app, many carts at once.
+
+    Args:
+        numCarts (int): number of carts to make.
+        concurrency (int): carts in flight at the same time.
+
+    Returns:
+        int: number of requests made.
+    """
+    count = 0
+    for start in range(0, numCarts, concurrency):
+        batch = min(concurrency, numCarts - start)
+        count += sum(await asyncio.gather(*(asgi_cart() for _ in range(batch))))
+    return count
+
+
+def report(name, count, seconds):
+    """
+    Prints the result for one app.
+
+    Args:
+        name (str): name of the app.
+        count (int): number of requests made.
+        seconds (float): time taken.
+    """
+    print(f"{name:>17}: {count} requests in {seconds:.2f}s = {count / seconds:,.0f} req/s")
+
+
+if __name__ == '__main__':
+    numCarts = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    start = time.perf_counter()
+    count = run_flask(numCarts)
+    report("Flask", count, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    count = asyncio.run(run_asgi(numCarts, concurrency=1))
+    report("ASGI", count, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    count = asyncio.run(run_asgi(numCarts))
+    report("ASGI, 100 at once", count, time.perf_counter() - start)
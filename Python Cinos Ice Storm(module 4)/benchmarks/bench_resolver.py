@@ -0,0 +1,57 @@
+# Times name resolution as the menu grows.
+#
+# Exact names are one dict lookup. Names that aren't exact are folded and
+# looked up once, then come from the LRU cache. Did-you-mean suggestions
+# look up the deletions of the input in the deletion index ("suggest" is
+# without the cache, "cached" with it), so none of these get slower with
+# more names on the menu.
+#
+# Command to run: python benchmarks/bench_resolver.py [number of rounds]
+
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def make_section(size):
+    """
+    Makes a section of random menu names.
+
+    Args:
+        size (int): number of names.
+
+    Returns:
+        dict: normalized name to MenuEntry.
+    """
+    rng = random.Random(size)
+    names = set()
+    while len(names) < size:
+        words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 8))) for _ in range(rng.randint(1, 2))]
+        names.add(" ".join(words))
+    return {name: main.MenuEntry(code, name, 0) for code, name in enumerate(sorted(names))}
+
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for size in (10, 1000, 10000):
+        section = make_section(size)
+        resolver = main.NameResolver("names", section)
+        name = next(iter(section))
+        loose = name.upper() + "s"
+        typo = name[1:] + "q"
+        cases = (
+            ("exact", lambda: section.get(main.normalize(name))),
+            ("folded", lambda: resolver.resolve(loose)),
+            ("suggest", lambda: resolver._suggest.__wrapped__(main.fold(typo))),
+            ("cached", lambda: resolver.suggest(typo)),
+        )
+        for label, function in cases:
+            number = rounds if label != "suggest" else rounds // 10
+            seconds = min(timeit.repeat(function, number=number, repeat=5))
+            print(f"{size:>6} names {label:>8}: {seconds / number * 1e6:.2f} us")
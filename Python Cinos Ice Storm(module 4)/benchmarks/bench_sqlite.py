@@ -0,0 +1,84 @@
+# Compares the SQLite order store with the in-memory one on the Flask app.
+#
+# The cart workload from bench_asgi.py is run from several threads at once
+# (like a threaded server would), first on the in-memory store and then on
+# a SQLite store in a temporary file, plus a batch workload that adds 20
+# items per request to show the batched inserts.
+#
+# Command to run: python benchmarks/bench_sqlite.py [number of carts] [number of threads]
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from bench_asgi import report, run_flask  # noqa: E402
+from sqlite_store import SqliteStore  # noqa: E402
+
+# Items added by each batch request
+batchItems = [
+    {"type": "drink", "size": "large", "base": "sbrite", "flavors": ["lemon", "lime"]},
+    {"type": "food", "foodType": "nacho chips", "toppings": ["nacho cheese", "chili"]},
+    {"type": "ice storm", "flavor": "mint chocolate chip", "mix_ins": ["cherry", "storios"]},
+    {"type": "food", "foodType": "hotdog", "toppings": ["chili"]},
+] * 5
+
+
+def run_batches(numCarts):
+    """
+    Makes carts with one batch request each.
+
+    Args:
+        numCarts (int): number of carts to make.
+
+    Returns:
+        int: number of requests made.
+    """
+    client = main.app.test_client()
+    for _ in range(numCarts):
+        order_id = client.post("/orders").get_json()["order_id"]
+        client.post(f"/orders/{order_id}/batch", json={"items": batchItems})
+    return numCarts * 2
+
+
+def run_threads(workload, numCarts, numThreads):
+    """
+    Runs a workload split across threads.
+
+    Args:
+        workload (callable): takes a number of carts, returns the requests made.
+        numCarts (int): number of carts in total.
+        numThreads (int): number of threads.
+
+    Returns:
+        tuple: number of requests made and seconds taken.
+    """
+    counts = []
+
+    def worker():
+        counts.append(workload(numCarts // numThreads))
+
+    threads = [threading.Thread(target=worker) for _ in range(numThreads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts), time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    numCarts = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    numThreads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    with tempfile.TemporaryDirectory() as folder:
+        stores = [("memory", main.OrderStore()), ("SQLite", SqliteStore(os.path.join(folder, "orders.db")))]
+        for name, store in stores:
+            main.store = store
+            report(f"{name} carts", *run_threads(run_flask, numCarts, numThreads))
+            report(f"{name} batches", *run_threads(run_batches, numCarts, numThreads))
+        stores[1][1].close()
@@ -0,0 +1,160 @@
+# Bulk pricing for re-pricing lots of order lines at once with NumPy.
+#
+# Lines are given as columns instead of Drink/Food/IceStorm objects:
+#   item type code (see typeCodes), base code and modifier bitmask from the
+#   catalog, and the order each line belongs to.
+# Prices come from the same precomputed catalog tables the item classes use,
+# so the results match the per object path to the cent.
+
+from functools import lru_cache
+
+import numpy as np
+
+import main
+
+# Code for each item type in the item type column
+typeCodes = {
+    "drink": 0,
+    "food": 1,
+    "ice storm": 2,
+}
+
+
+@lru_cache(maxsize=4)
+def _flat_table(catalog):
+    """
+    Flattens the catalog's price tables into one array for gathering.
+
+    Args:
+        catalog (Catalog): catalog to price with.
+
+    Returns:
+        tuple: flat price array in cents, offset of each item type, number of
+            base codes for each item type, and modifier bits for each item type.
+    """
+    tables = [catalog.price_table(main.itemDefinitions[tag]) for tag in typeCodes]
+    offsets = []
+    numBases = []
+    bits = []
+    parts = []
+    offset = 0
+    for table in tables:
+        width = len(table[0]) if table else 1
+        offsets.append(offset)
+        numBases.append(len(table))
+        bits.append(width.bit_length() - 1)
+        parts.append(np.asarray(table, dtype=np.int64).reshape(-1))
+        offset += len(table) * width
+    return (
+        np.concatenate(parts),
+        np.asarray(offsets, dtype=np.int64),
+        np.asarray(numBases, dtype=np.int64),
+        np.asarray(bits, dtype=np.int64),
+    )
+
+
+def price_lines(itemTypes, baseCodes, masks, catalog=None):
+    """
+    Prices every line in cents.
+
+    Args:
+        itemTypes (array): item type code of each line.
+        baseCodes (array): base code of each line (size, food type, or flavor).
+        masks (array): modifier bitmask of each line.
+        catalog (Catalog): catalog to price with, the current one if not given.
+
+    Returns:
+        ndarray: price of each line in cents.
+
+    Raises:
+        ValueError: if a line has a code that isn't in the catalog.
+    """
+    prices, offsets, numBases, bits = _flat_table(catalog or main.catalog)
+    itemTypes = np.asarray(itemTypes, dtype=np.int64)
+    baseCodes = np.asarray(baseCodes, dtype=np.int64)
+    masks = np.asarray(masks, dtype=np.int64)
+
+    if np.any((itemTypes < 0) | (itemTypes >= len(offsets))):
+        raise ValueError("Invalid item type code")
+    if np.any((baseCodes < 0) | (baseCodes >= numBases[itemTypes])):
+        raise ValueError("Invalid base code")
+    lineBits = bits[itemTypes]
+    if np.any((masks < 0) | (masks >> lineBits != 0)):
+        raise ValueError("Invalid modifier bitmask")
+
+    return prices[offsets[itemTypes] + (baseCodes << lineBits) + masks]
+
+
+def price_orders(itemTypes, baseCodes, masks, orderIndexes, numOrders=None, catalog=None):
+    """
+    Prices every line and adds them up into order totals with tax.
+
+    Args:
+        itemTypes (array): item type code of each line.
+        baseCodes (array): base code of each line.
+        masks (array): modifier bitmask of each line.
+        orderIndexes (array): which order each line belongs to, from 0.
+        numOrders (int): number of orders, one more than the biggest index if not given.
+        catalog (Catalog): catalog to price with, the current one if not given.
+
+    Returns:
+        dict: line totals, subtotals, tax, and totals after tax, all in cents.
+
+    Raises:
+        ValueError: if a line has a code that isn't in the catalog, there
+            isn't one order index per line, or an order index isn't in
+            [0, numOrders).
+    """
+    catalog = catalog or main.catalog
+    lineTotals = price_lines(itemTypes, baseCodes, masks, catalog)
+    orderIndexes = np.asarray(orderIndexes, dtype=np.int64)
+    if orderIndexes.shape != lineTotals.shape:
+        raise ValueError("There must be one order index per line")
+    if numOrders is None:
+        numOrders = int(orderIndexes.max()) + 1 if len(orderIndexes) else 0
+    if np.any((orderIndexes < 0) | (orderIndexes >= numOrders)):
+        raise ValueError("Invalid order index")
+
+    subtotals = np.zeros(numOrders, dtype=np.int64)
+    np.add.at(subtotals, orderIndexes, lineTotals)
+    # Same half cent up rounding as main.calculate_tax
+    tax = (subtotals * catalog.taxBasisPoints + 5000) // 10000
+    return {
+        "line_totals": lineTotals,
+        "subtotals": subtotals,
+        "tax": tax,
+        "totals_after_tax": subtotals + tax,
+    }
+
+
+def columns_from_orders(orders):
+    """
+    Turns Order objects into the columns the bulk pricer takes.
+
+    Items without a base (which cost nothing) are left out.
+
+    Args:
+        orders (list): orders to convert.
+
+    Returns:
+        tuple: item type, base code, modifier bitmask, and order index arrays.
+    """
+    itemTypes = []
+    baseCodes = []
+    masks = []
+    orderIndexes = []
+    for i, order in enumerate(orders):
+        for item in order.get_items():
+            baseCode, mask = item.get_codes()
+            if baseCode is None:
+                continue  # Items without a base are free
+            itemTypes.append(typeCodes[item.itemType])
+            baseCodes.append(baseCode)
+            masks.append(mask)
+            orderIndexes.append(i)
+    return (
+        np.asarray(itemTypes, dtype=np.int64),
+        np.asarray(baseCodes, dtype=np.int64),
+        np.asarray(masks, dtype=np.int64),
+        np.asarray(orderIndexes, dtype=np.int64),
+    )
@@ -4,13 +4,53 @@
 # Command to add different food to order: curl -X POST http://127.0.0.1:5000/order/food \-H "Content-Type: application/json" \-d '{"foodType": "nacho chips", "toppings": ["nacho cheese", "chili"]}'
 # Command to add ice storm to order: curl -X POST http://127.0.0.1:5000/order/ice-storm \-H "Content-Type: application/json" \-d '{"flavor": "mint chocolate chip", "mix_ins": ["cherry", "storios"]}'
 # Command to delete a specific item in the order: curl -X DELETE http://127.0.0.1:5000/order/0
-
-from flask import Flask, request, jsonify
+# Command to add several items at once: curl -X POST http://127.0.0.1:5000/order/batch \-H "Content-Type: application/json" \-d '{"items": [{"type": "drink", "size": "small", "base": "water"}, {"type": "food", "foodType": "hotdog", "toppings": ["chili"]}]}'
+# Command to delete an item by the id on the receipt: curl -X DELETE http://127.0.0.1:5000/order/items/0
+# Command to delete several items at once: curl -X DELETE http://127.0.0.1:5000/order/items \-H "Content-Type: application/json" \-d '{"indexes": [0, 2]}'
+# Command to run with several worker processes: python serve.py --workers 4
+# Command to keep orders across restarts: CINOS_WAL_PATH=orders.wal python main.py
+# Command to keep orders in SQLite: python sqlite_store.py orders.db
+# Command to add drink safely when retrying: curl -X POST http://127.0.0.1:5000/order \-H "Idempotency-Key: <unique key>" \-H "Content-Type: application/json" \-d '{"size": "small", "base": "water"}'
+# Command to save a snapshot (with CINOS_SNAPSHOT_DIR set): curl -X POST http://127.0.0.1:5000/admin/snapshot
+# Command to use a menu file and reload it after changing prices: CINOS_MENU_PATH=menu.toml python main.py, then curl -X POST http://127.0.0.1:5000/admin/menu/reload
+# Command to add drink with names that aren't exact: curl -X POST http://127.0.0.1:5000/order \-H "Content-Type: application/json" \-d '{"size": "Large", "base": "Mr Salt", "flavors": ["lemons"]}'
+# Command to start a separate order: curl -X POST http://127.0.0.1:5000/orders
+# Command to add drink to a separate order: curl -X POST http://127.0.0.1:5000/orders/<order_id> \-H "Content-Type: application/json" \-d '{"size": "small", "base": "water"}'
+# Command to stream a big order: curl -X GET "http://127.0.0.1:5000/order?stream=true"
+# Command to get one page of the foods in an order: curl -X GET "http://127.0.0.1:5000/order?type=food&limit=10&cursor=0"
+# Command to get a separate order: curl -X GET http://127.0.0.1:5000/orders/<order_id>
+
+import hashlib
+import itertools
+import json
+import os
+import re
+import threading
+import time
+import uuid
+import zlib
+from bisect import bisect_left
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from types import MappingProxyType
+
+try:
+    import tomllib
+except ImportError:  # Python before 3.11, menus can still be JSON
+    tomllib = None
+
+from flask import Flask, Response, request, jsonify
+
+from snapshot import BackgroundSaver, load_store
+from wal import WriteAheadLog, read_log
 
 # Initialize Flask
 app = Flask(__name__)
 
 # All the available drinks, foods, and icestorms with costs and modifictions
+# This is the built in menu, set CINOS_MENU_PATH to a menu file (like
+# menu.toml) to use that instead and change prices without a redeploy
 
 iceStorms = {
     "mint chocolate chip": 4.00, 
@@ -60,387 +100,2362 @@ sizes = {
     "mega": 2.15
 }
 
+# Other names customers use for menu items, by catalog section
+aliases = {
+    "bases": {
+        "sprite": "sbrite",
+        "coke": "pokeacola",
+        "coca cola": "pokeacola",
+        "dr pepper": "mr. salt",
+        "mountain dew": "hill fog",
+        "root beer": "leaf wine",
+    },
+    "mixIns": {
+        "oreos": "storios",
+        "m&ms": "t&t's",
+    },
+}
+
 # Additional costs
 flavorCost = 0.15  # Cost for additional flavors
 taxRate = 0.0725   # Tax rate
 
-# Module 1-2 stuff
-class Drink:
+# Money stuff
+# All pricing is done in whole cents so totals never drift, and only turned
+# back into dollars for the JSON output.
+def to_cents(dollars):
+    """
+    Converts a dollar amount to whole cents.
+
+    Args:
+        dollars (float): amount in dollars.
+
+    Returns:
+        int: amount in cents.
+    """
+    return int(round(dollars * 100))
+
+
+def to_dollars(cents):
+    """
+    Converts whole cents to a dollar amount.
+
+    Args:
+        cents (int): amount in cents.
+
+    Returns:
+        float: amount in dollars.
+    """
+    return cents / 100
+
+
+def calculate_tax(subtotalCents):
+    """
+    Calculates the tax on a subtotal, rounding half a cent up.
+
+    Args:
+        subtotalCents (int): subtotal in cents.
+
+    Returns:
+        int: tax in cents.
+    """
+    return (subtotalCents * catalog.taxBasisPoints + 5000) // 10000
+
+
+# Catalog stuff
+# One item on the menu: a small code unique within its section, the
+# normalized name, and the price in cents
+MenuEntry = namedtuple("MenuEntry", ["code", "name", "price"])
+
+
+def normalize(name):
+    """
+    Turns a name from the user into the form the catalog uses.
+
+    Args:
+        name (str): name to normalize.
+
+    Returns:
+        str: normalized name.
+    """
+    return name.lower()
+
+
+def fold(name):
+    """
+    Turns a name into a loose form for matching names that aren't written
+    exactly like the menu: lowercase, without punctuation or spaces, and
+    without a plural s on each word.
+
+    Args:
+        name (str): name to fold.
+
+    Returns:
+        str: folded name.
+    """
+    words = re.findall(r"[a-z0-9&]+", name.lower())
+    return "".join(word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word for word in words)
+
+
+def deletions(word, maxDistance):
+    """
+    Makes every string that's word with up to maxDistance letters deleted.
+
+    Args:
+        word (str): the word.
+        maxDistance (int): most letters to delete.
+
+    Returns:
+        set: the strings, including word itself.
+    """
+    result = {word}
+    layer = {word}
+    for _ in range(maxDistance):
+        layer = {item[:i] + item[i + 1:] for item in layer for i in range(len(item))}
+        result |= layer
+    return result
+
+
+def edit_distance(a, b, limit=None):
     """
-    Each drink in the order.
+    Counts the letters inserted, deleted, changed, or swapped with their
+    neighbor to turn one string into another.
+
+    With a limit, only the cells within limit of the diagonal are worked
+    out, and it stops as soon as the distance must be over the limit.
+
+    Args:
+        a (str): first string.
+        b (str): second string.
+        limit (int): largest distance that matters, None for no limit.
+
+    Returns:
+        int: the distance, or limit + 1 if it's over the limit.
+    """
+    if limit is None:
+        limit = max(len(a), len(b))
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    over = limit + 1
+    before = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        row = [over] * (len(b) + 1)
+        if i <= limit:
+            row[0] = i
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            if a[i - 1] == b[j - 1]:
+                cost = previous[j - 1]
+            else:
+                cost = min(previous[j], row[j - 1], previous[j - 1]) + 1
+                if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1] and before[j - 2] + 1 < cost:
+                    cost = before[j - 2] + 1
+            row[j] = cost if cost < over else over
+        if min(row) > limit:
+            return over
+        before, previous = previous, row
+    return previous[len(b)]
+
+
+class NameResolver:
+    """
+    Finds the menu entry for a name that isn't written exactly like the
+    menu, for one catalog section.
+
+    Names match if they fold the same (so "Mr Salt" is "mr. salt" and
+    "tater tot" is "tater tots"), or if they're in the alias table (so
+    "sprite" is "sbrite"). Resolved inputs are kept in an LRU cache.
+
+    Names that still don't match can get did-you-mean suggestions from a
+    deletion index: every folded name with up to two letters deleted points
+    back to it, so close names are found by looking up the deletions of the
+    input, however big the menu gets.
 
     Attributes:
-        _base (str): base of the drink.
-        _flavors (list): list for flavors added to the drink.
-        _size (str): size of the drink.
+        sectionName (str): name of the section.
+        _folded (dict): folded name or alias to its MenuEntry. Folded forms
+            that more than one entry share are left out.
+        _deletions (dict): folded name with letters deleted to the folded
+            names it came from.
+        _lookup (callable): LRU cached version of _resolve.
     """
 
-    def __init__(self, size):
+    # Longest input that's looked at, longer ones never match
+    maxLength = 64
+
+    def __init__(self, sectionName, section, sectionAliases=None):
         """
-        Initializes the drink object, requires a size.
+        Builds the lookup tables for a section.
 
         Args:
-            size (str): size of the drink.
+            sectionName (str): name of the section.
+            section (mappingproxy): normalized name to MenuEntry.
+            sectionAliases (dict): other name to the menu name it means.
+        """
+        self.sectionName = sectionName
+        folded = {}
+        shared = set()
+        for name, entry in section.items():
+            key = fold(name)
+            if key in folded and folded[key] is not entry:
+                shared.add(key)
+            folded[key] = entry
+        for key in shared:
+            del folded[key]
+        for alias, name in (sectionAliases or {}).items():
+            entry = section.get(normalize(name))
+            if entry is None:
+                raise ValueError(f"Alias {alias!r} is for {name!r}, which isn't on the menu")
+            folded.setdefault(fold(alias), entry)
+        self._folded = folded
+
+        self._deletions = {}
+        for key in folded:
+            for deleted in deletions(key, self._max_distance(key)):
+                self._deletions.setdefault(deleted, set()).add(key)
+        self._lookup = lru_cache(maxsize=1024)(self._resolve)
+        self._suggest = lru_cache(maxsize=1024)(self._suggest)
+
+    @staticmethod
+    def _max_distance(key):
         """
-        self._base = None
-        self._flavors = []
-        self._size = None
-        self.set_size(size)
+        Returns how many typos a name can have and still be suggested.
 
-    def get_base(self):
+        Args:
+            key (str): folded name.
+
+        Returns:
+            int: most edits.
         """
-        Returns base of the drink.
+        return 1 if len(key) <= 4 else 2
+
+    def resolve(self, name):
+        """
+        Finds the entry a name means, by its folded form or an alias. Only
+        names up to maxLength go through the cache, so long inputs can't
+        fill it up.
+
+        Args:
+            name (str): name from the user.
 
         Returns:
-            str: base of the drink, or none if not set.
+            MenuEntry: the entry, or None if there isn't one.
         """
-        return self._base.lower() if self._base else None
+        if not isinstance(name, str) or len(name) > self.maxLength:
+            return None
+        return self._lookup(name)
 
-    def get_flavors(self):
+    def _resolve(self, name):
         """
-        Returns list of flavors added to the drink.
+        Finds the entry a name means, without the cache.
+
+        Args:
+            name (str): name from the user.
 
         Returns:
-            list: the list of flavors.
+            MenuEntry: the entry, or None if there isn't one.
         """
-        return self._flavors
+        return self._folded.get(fold(name))
 
-    def set_base(self, base):
+    def suggest(self, name, limit=3):
         """
-        Sets the base of the drink if it's valid.
+        Finds the menu names closest to a name that didn't match.
 
         Args:
-            base (str): the base.
+            name (str): name from the user.
+            limit (int): most names to return.
 
         Returns:
-            str: invalid base if the base isn't in the list of available bases.
+            list: menu names, closest first.
         """
-        if base.lower() in bases:
-            self._base = base
-        else:
-            return "Invalid base"
+        if not isinstance(name, str) or len(name) > self.maxLength:
+            return []
+        return list(self._suggest(fold(name))[:limit])
 
-    def add_flavor(self, flavor):
+    def _suggest(self, key):
         """
-        Adds a flavor to the drink if it's valid and not been added already.
+        Finds the menu names close to a folded name, through the deletion
+        index. Cached per instance by __init__.
 
         Args:
-            flavor (str): flavor to add.
+            key (str): folded name from the user.
 
         Returns:
-            str: invalid flavor if the flavor isn't in the flavors list.
+            tuple: menu names, closest first.
         """
-        if flavor.lower() in flavors and flavor.lower() not in self._flavors:
-            self._flavors.append(flavor.lower())
-        elif flavor.lower() not in flavors:
-            return "Invalid flavor"
+        maxDistance = self._max_distance(key)
+        found = {}
+        for deleted in deletions(key, maxDistance):
+            for candidate in self._deletions.get(deleted, ()):
+                if candidate not in found:
+                    limit = max(maxDistance, self._max_distance(candidate))
+                    found[candidate] = edit_distance(key, candidate, limit), limit
+        best = {}
+        for candidate, (distance, limit) in found.items():
+            if distance <= limit:
+                entryName = self._folded[candidate].name
+                best[entryName] = min(best.get(entryName, distance), distance)
+        return tuple(sorted(best, key=lambda entryName: (best[entryName], entryName)))
+
+
+class Catalog:
+    """
+    The compiled menu, built once from the menu dictionaries.
 
-    def set_size(self, size):
+    Every section maps a normalized name to a MenuEntry in a read only hash
+    table, so checking and pricing an item is a single lookup.
+
+    Attributes:
+        sizes (mappingproxy): drink sizes.
+        bases (mappingproxy): drink bases, which are free.
+        flavors (mappingproxy): extra drink flavors.
+        foods (mappingproxy): food types.
+        toppings (mappingproxy): food toppings.
+        iceStorms (mappingproxy): Ice Storm flavors.
+        mixIns (mappingproxy): Ice Storm mix ins.
+        sections (mappingproxy): section name to the section.
+        byCode (mappingproxy): section name to its entries in code order.
+        resolvers (mappingproxy): section name to its NameResolver.
+        generation (int): number that's different for every catalog built.
+        flavorCost (int): cost of each extra flavor in cents.
+        taxBasisPoints (int): tax rate in hundredths of a percent.
+        _priceTables (dict): price tables already built, by sections used.
+        _validators (dict): item validators already compiled, by item type.
+        _aliases (dict): section name to other names for its entries.
+        _kept (dict): copies of the catalog made by keeping, by names kept.
+    """
+
+    # Most entries in a section used for modifiers, since every combination gets priced
+    maxModifiers = 16
+    _generations = itertools.count(1)
+
+    def __init__(self, sizes, bases, flavors, flavorCost, foods, toppings, iceStorms, mixIns, taxRate, aliases=None):
         """
-        Sets the size of the drink if it's valid.
+        Compiles the catalog from menu dictionaries priced in dollars.
 
         Args:
-            size (str): size to set.
+            sizes (dict): drink size to price.
+            bases (list): drink bases.
+            flavors (list): extra drink flavors.
+            flavorCost (float): cost of each extra flavor.
+            foods (dict): food type to price.
+            toppings (dict): topping to price.
+            iceStorms (dict): Ice Storm flavor to price.
+            mixIns (dict): mix in to price.
+            taxRate (float): tax rate.
+            aliases (dict): section name to other names for its entries.
+
+        Raises:
+            ValueError: if a name is on a section twice, an alias is for a
+                name that isn't on the menu, or a modifier section is too big.
+        """
+        self.sizes = self._compile(sizes)
+        self.bases = self._compile(dict.fromkeys(bases, 0))
+        self.flavors = self._compile(dict.fromkeys(flavors, flavorCost))
+        self.foods = self._compile(foods)
+        self.toppings = self._compile(toppings)
+        self.iceStorms = self._compile(iceStorms)
+        self.mixIns = self._compile(mixIns)
+        self.sections = MappingProxyType({
+            "sizes": self.sizes,
+            "bases": self.bases,
+            "flavors": self.flavors,
+            "foods": self.foods,
+            "toppings": self.toppings,
+            "iceStorms": self.iceStorms,
+            "mixIns": self.mixIns,
+        })
+        self.byCode = MappingProxyType({name: tuple(section.values()) for name, section in self.sections.items()})
+        aliases = aliases or {}
+        self._aliases = aliases
+        self._kept = {}
+        self.resolvers = MappingProxyType({
+            name: NameResolver(name, section, aliases.get(name)) for name, section in self.sections.items()
+        })
+        self.generation = next(self._generations)
+        self.flavorCost = to_cents(flavorCost)
+        self.taxBasisPoints = int(round(taxRate * 10000))
+
+        # Every item has a finite number of setups, so price all of them now
+        self._priceTables = {}
+        self._validators = {}
+        for kind in itemDefinitions.values():
+            if len(self.sections[kind.modifiers.section]) > self.maxModifiers:
+                raise ValueError(f"{kind.modifiers.section} can't have more than {self.maxModifiers} entries")
+            self.price_table(kind)
+
+    @classmethod
+    def from_menu(cls, menu):
+        """
+        Compiles a catalog from a menu read from a file, checking it first.
+
+        The menu has the same names as the menu dictionaries in this file:
+        sizes, foods, toppings, iceStorms, and mixIns map names to prices,
+        bases and flavors are lists of names, flavorCost and taxRate are
+        numbers, and aliases is optional.
+
+        Args:
+            menu (dict): the menu.
 
         Returns:
-            str: invalid size if the size isn't in the size list.
+            Catalog: the new catalog.
+
+        Raises:
+            ValueError: if something is missing or has the wrong type.
         """
-        if size.lower() in sizes:
-            self._size = size.lower()
-        else:
-            return "Invalid size"
+        if not isinstance(menu, dict):
+            raise ValueError("Menu must be an object")
+        unknown = set(menu) - set(menuPriceSections) - set(menuNameSections) - {"flavorCost", "taxRate", "aliases"}
+        if unknown:
+            raise ValueError(f"Unknown menu keys: {', '.join(sorted(unknown))}")
+
+        def is_price(value):
+            return isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+
+        for key in menuPriceSections:
+            section = menu.get(key)
+            if not isinstance(section, dict) or not all(isinstance(name, str) and name and is_price(price) for name, price in section.items()):
+                raise ValueError(f"{key} must map names to prices")
+        for key in menuNameSections:
+            names = menu.get(key)
+            if not isinstance(names, list) or not all(isinstance(name, str) and name for name in names):
+                raise ValueError(f"{key} must be a list of names")
+        for key in ("flavorCost", "taxRate"):
+            if not is_price(menu.get(key)):
+                raise ValueError(f"{key} must be a number that isn't negative")
+        if menu["taxRate"] >= 1:
+            raise ValueError("taxRate must be less than 1")
+        menuAliases = menu.get("aliases", {})
+        if not isinstance(menuAliases, dict) or not all(
+            key in menuPriceSections + menuNameSections and isinstance(section, dict)
+            and all(isinstance(alias, str) and isinstance(name, str) for alias, name in section.items())
+            for key, section in menuAliases.items()
+        ):
+            raise ValueError("aliases must map section names to other names for their entries")
+
+        return cls(
+            menu["sizes"], menu["bases"], menu["flavors"], menu["flavorCost"], menu["foods"],
+            menu["toppings"], menu["iceStorms"], menu["mixIns"], menu["taxRate"], menuAliases,
+        )
+
+    @staticmethod
+    def _compile(prices):
+        """
+        Builds one read only section of the catalog.
 
-    def get_size(self):
+        Args:
+            prices (dict): name to price in dollars.
+
+        Returns:
+            mappingproxy: normalized name to MenuEntry.
+
+        Raises:
+            ValueError: if two names are the same once normalized.
         """
-        Returns the size of the drink.
+        section = {}
+        for name, price in prices.items():
+            name = normalize(name)
+            if name in section:
+                raise ValueError(f"{name!r} is on the menu twice")
+            section[name] = MenuEntry(len(section), name, to_cents(price))
+        return MappingProxyType(section)
+
+    def price_table(self, kind):
+        """
+        Returns the price of every combination of an item type's main choice
+        and modifiers, building it the first time it's asked for.
+
+        Args:
+            kind (ItemType): the item type.
 
         Returns:
-            str: size of the drink.
+            tuple: one tuple per main choice code, indexed by modifier bitmask.
+        """
+        key = (kind.main.section, kind.modifiers.section)
+        table = self._priceTables.get(key)
+        if table is None:
+            modifierSums = subset_sums(self.byCode[kind.modifiers.section])
+            table = tuple(
+                tuple(entry.price + modifierSum for modifierSum in modifierSums)
+                for entry in self.sections[kind.main.section].values()
+            )
+            self._priceTables[key] = table
+        return table
+
+    def keeping(self, names):
         """
-        return self._size
+        Returns a copy of the catalog that still has names which have come
+        off the menu, so items ordered before the menu changed can be
+        rebuilt. The kept names are free, since restored items keep the
+        price they were ordered at anyway.
 
-    def get_total(self):
+        Args:
+            names (tuple): sorted (section name, normalized name) pairs.
+
+        Returns:
+            Catalog: the copy, made once for each set of names.
+
+        Raises:
+            ValueError: if keeping the names makes a modifier section too big.
+        """
+        kept = self._kept.get(names)
+        if kept is None:
+            def section_prices(sectionName):
+                prices = {entry.name: entry.price / 100 for entry in self.byCode[sectionName]}
+                prices.update((name, 0) for keptSection, name in names if keptSection == sectionName)
+                return prices
+
+            kept = self._kept[names] = Catalog(
+                section_prices("sizes"), list(section_prices("bases")), list(section_prices("flavors")),
+                self.flavorCost / 100, section_prices("foods"), section_prices("toppings"),
+                section_prices("iceStorms"), section_prices("mixIns"), self.taxBasisPoints / 10000, self._aliases,
+            )
+        return kept
+
+    def find(self, sectionName, name):
         """
-        Calculates the total cost of the drink based on size and added flavors.
+        Finds the entry for a name in a section, by its exact name, its
+        folded form, or an alias.
+
+        Args:
+            sectionName (str): name of the section.
+            name (str): name from the user.
 
         Returns:
-            float: total drink cost.
+            MenuEntry: the entry, or None if it isn't on the menu.
         """
-        if not self._size:
-            return 0
-        sizeCost = sizes[self._size]
-        flavorCostTotal = len(self._flavors) * flavorCost
-        return round(sizeCost + flavorCostTotal, 2)
+        entry = self.sections[sectionName].get(normalize(name))
+        if entry is None:
+            entry = self.resolvers[sectionName].resolve(name)
+        return entry
 
-# Module 3 stuff
-class Food:
+    def validator(self, kind):
+        """
+        Returns the payload validator for an item type, compiling it the
+        first time it's asked for.
+
+        Args:
+            kind (ItemType): the item type.
+
+        Returns:
+            ItemValidator: the validator.
+        """
+        validator = self._validators.get(kind)
+        if validator is None:
+            validator = self._validators[kind] = ItemValidator(kind, self)
+        return validator
+
+
+def decode_names(entriesByCode, mask):
     """
-    Represents food item in the order.
+    Turns a bitmask of menu codes back into a list of names.
+
+    Args:
+        entriesByCode (tuple): menu entries in code order.
+        mask (int): bit n is set if the entry with code n is included.
+
+    Returns:
+        list: names of the included entries, in code order.
+    """
+    names = []
+    while mask:
+        lowest = mask & -mask
+        names.append(entriesByCode[lowest.bit_length() - 1].name)
+        mask ^= lowest
+    return names
+
+
+def subset_sums(entriesByCode):
+    """
+    Adds up the prices for every bitmask of menu codes.
+
+    Args:
+        entriesByCode (tuple): menu entries in code order.
+
+    Returns:
+        list: total price in cents for each bitmask, indexed by bitmask.
+    """
+    sums = [0] * (1 << len(entriesByCode))
+    for mask in range(1, len(sums)):
+        lowest = mask & -mask
+        sums[mask] = sums[mask ^ lowest] + entriesByCode[lowest.bit_length() - 1].price
+    return sums
+
+
+# Item type registry stuff
+# Every kind of menu item is described by an ItemType, and Order, the routes,
+# and pricing only ever go through the registry, so a new menu category is
+# just a new ItemType.
+itemDefinitions = {}     # Type tag to ItemType
+receiptSerializers = {}  # Type tag to the function that makes its receipt fields
+
+# One field of an item: its JSON key, the catalog section its names come
+# from, the error when it's missing (None if it isn't required), and the
+# error when a name isn't on the menu
+ItemField = namedtuple("ItemField", ["key", "section", "required", "invalid"])
+
+
+class ItemType:
+    """
+    Definition of one kind of menu item.
+
+    An item is one priced main choice (like a drink size or a food type),
+    any number of free single choices (like a drink base), and a set of
+    priced modifiers (like toppings). Modifiers are priced from their catalog
+    section, so a flat cost per modifier is just a section where every
+    modifier has the same price (like drink flavors and flavorCost).
 
     Attributes:
-        _type (str): type of food.
-        _toppings (list): toppings added to the food.
+        tag (str): type tag used in receipts and batches.
+        main (ItemField): the priced main choice.
+        modifiers (ItemField): the priced modifiers.
+        options (tuple): free single choices, as ItemFields.
+        itemClass (type): class used for items of this type.
+        _optionIndex (dict): option key to its place in options.
     """
 
-    def __init__(self, foodType):
+    def __init__(self, tag, main, modifiers, options=(), itemClass=None):
         """
-        Initializes food object.
+        Initializes the item type.
 
         Args:
-            foodType (str): type of food.
+            tag (str): type tag.
+            main (ItemField): the priced main choice.
+            modifiers (ItemField): the priced modifiers.
+            options (tuple): free single choices.
+            itemClass (type): class for the items, Item if not given.
         """
-        self._type = None
-        self._toppings = []
-        self.set_type(foodType)
-
-    def set_type(self, foodType):
+        self.tag = tag
+        self.main = main
+        self.modifiers = modifiers
+        self.options = tuple(options)
+        self.itemClass = itemClass or Item
+        self._optionIndex = {field.key: i for i, field in enumerate(self.options)}
+
+    def make(self, main):
         """
-        Sets the type of food if valid.
+        Makes a new item of this type.
 
         Args:
-            foodType (str): sets type of food.
+            main (str): name of the main choice.
 
         Returns:
-            str: invalid foor type if food type isn't in foods array.
+            Item: the new item.
         """
-        if foodType.lower() in foods:
-            self._type = foodType.lower()
-        else:
-            return "Invalid food type"
+        return self.itemClass(main, self)
 
-    def get_type(self):
+    def validate(self, data):
         """
-        Returns the type of food.
+        Makes an item of this type from a JSON payload, checking every field
+        with the current catalog's compiled validator.
+
+        Args:
+            data (dict): payload with the item's fields.
 
         Returns:
-            str: type of food.
+            tuple: the item and an empty list, or None and every error message.
         """
-        return self._type
+        return catalog.validator(self)(data)
 
-    def add_topping(self, topping):
+    def error_body(self, data, errors):
         """
-        Adds a topping to the food if valid.
+        Makes the response body for a payload that didn't validate, with
+        did-you-mean suggestions for misspelled names if there are any.
 
         Args:
-            topping (str): topping to add.
+            data (dict): payload with the item's fields.
+            errors (list): every error message.
 
         Returns:
-            str: invalid topping if not in toppings list.
+            dict: the first error, every error, and any suggestions.
         """
-        if topping.lower() in toppings and topping.lower() not in self._toppings:
-            self._toppings.append(topping.lower())
-        elif topping.lower() not in toppings:
-            return "Invalid topping"
+        body = {"error": errors[0], "errors": errors}
+        suggestions = catalog.validator(self).suggest(data)
+        if suggestions:
+            body["suggestions"] = suggestions
+        return body
 
-    def get_toppings(self):
+    def from_json(self, data):
         """
-        Returns the list of toppings.
+        Makes an item of this type from a JSON payload.
+
+        Args:
+            data (dict): payload with the item's fields.
 
         Returns:
-            list: list of toppings.
+            tuple: the item and None, or None and the first error message.
         """
-        return self._toppings
+        item, errors = self.validate(data)
+        return item, (errors[0] if errors else None)
 
-    def get_total(self):
+    def restore(self, data):
         """
-        Calculates the total cost of a food item.
+        Rebuilds an item from its receipt fields, like when replaying the
+        write-ahead log. Options that weren't set are left unset.
+
+        Names are matched exactly. A name that has come off the menu since
+        the item was ordered is still kept, from a copy of the catalog that
+        has it, so the order shows the item the way it was ordered.
+
+        Args:
+            data (dict): the item's receipt fields.
 
         Returns:
-            float: cost of the food item.
+            Item: the rebuilt item.
+
+        Raises:
+            ValueError: if the fields aren't names or the main choice is missing.
         """
-        if not self._type:
-            return 0
-        baseCost = foods[self._type]
-        toppingCost = sum(toppings[topping] for topping in self._toppings)
-        return round(baseCost + toppingCost, 2)
+        mainName = data.get(self.main.key)
+        optionNames = [data.get(field.key) or None for field in self.options]
+        modifierNames = data.get(self.modifiers.key) or []
+        if not isinstance(mainName, str) or not mainName or not isinstance(modifierNames, list):
+            raise ValueError(f"Can't restore {self.tag} from {data!r}")
+        names = [(self.main.section, mainName)]
+        names += [(field.section, name) for field, name in zip(self.options, optionNames) if name is not None]
+        names += [(self.modifiers.section, name) for name in modifierNames]
+        if not all(isinstance(name, str) for _, name in names):
+            raise ValueError(f"Can't restore {self.tag} from {data!r}")
+
+        missing = tuple(sorted({
+            (sectionName, normalize(name)) for sectionName, name in names
+            if normalize(name) not in catalog.sections[sectionName]
+        }))
+        itemCatalog = catalog.keeping(missing) if missing else catalog
+        sections = itemCatalog.sections
+        main = sections[self.main.section][normalize(mainName)]
+        options = [
+            sections[field.section][normalize(name)] if name is not None else None
+            for field, name in zip(self.options, optionNames)
+        ]
+        mask = 0
+        for name in modifierNames:
+            mask |= 1 << sections[self.modifiers.section][normalize(name)].code
+        return self.itemClass.from_parts(self, itemCatalog, main, itemCatalog.price_table(self)[main.code], options, mask)
+
+
+def register_item_type(kind):
+    """
+    Adds an item type to the registry.
 
-# Module 4 stuff
-class IceStorm:
+    Args:
+        kind (ItemType): the item type.
+
+    Returns:
+        ItemType: the same item type.
+    """
+    itemDefinitions[kind.tag] = kind
+    receiptSerializers[kind.tag] = kind.itemClass.to_receipt
+    return kind
+
+
+class ItemValidator:
     """
-    Represents each Ice Storm in the order.
+    Turns JSON payloads for one item type into items, compiled from one
+    catalog ahead of time.
+
+    Every field is checked in one pass with one normalize per name, and
+    every problem is collected instead of stopping at the first. The lookup
+    tables already hold what the item needs (the price row for each main
+    choice and the bit for each modifier), so a good payload becomes an item
+    without any more catalog lookups. Names that aren't exact go through
+    the catalog's NameResolver before they count as errors.
 
     Attributes:
-        _flavor (str): flavor of the ice cream.
-        _mix_ins (list): mix ins added to the ice cream.
+        kind (ItemType): the item type.
+        catalog (Catalog): catalog the tables were compiled from.
+        _mains (dict): normalized main choice to its MenuEntry and price row.
+        _options (tuple): key, section, resolver, and error messages of each option.
+        _modifierBits (dict): normalized modifier to its bit.
+        _mainResolver (NameResolver): resolver for the main choice's section.
+        _modifierResolver (NameResolver): resolver for the modifiers' section.
     """
 
-    def __init__(self, flavor):
+    def __init__(self, kind, itemCatalog):
         """
-        Initializes Ice Storm object.
+        Compiles the validator.
 
         Args:
-            flavor (str): flavor of the ice cream.
+            kind (ItemType): the item type.
+            itemCatalog (Catalog): catalog to check names against.
         """
-        self._flavor = None
-        self._mix_ins = []
-        self.set_flavor(flavor)
+        self.kind = kind
+        self.catalog = itemCatalog
+        table = itemCatalog.price_table(kind)
+        self._mains = {
+            name: (entry, table[entry.code])
+            for name, entry in itemCatalog.sections[kind.main.section].items()
+        }
+        # A missing option gets its required message, or its invalid one if it has none
+        self._options = tuple(
+            (field.key, itemCatalog.sections[field.section], itemCatalog.resolvers[field.section],
+             field.required or field.invalid, field.invalid)
+            for field in kind.options
+        )
+        self._modifierBits = {
+            name: 1 << entry.code
+            for name, entry in itemCatalog.sections[kind.modifiers.section].items()
+        }
+        self._mainResolver = itemCatalog.resolvers[kind.main.section]
+        self._modifierResolver = itemCatalog.resolvers[kind.modifiers.section]
 
-    def set_flavor(self, flavor):
+    def __call__(self, data):
         """
-        Sets the flavor of the ice cream if valid.
+        Checks a payload and makes the item.
 
         Args:
-            flavor (str): flavor of the ice cream.
+            data (dict): payload with the item's fields.
 
         Returns:
-            str: "Invalid flavor" if the flavor isn't in the iceStorms list.
+            tuple: the item and an empty list, or None and every error message.
         """
-        if flavor.lower() in iceStorms:
-            self._flavor = flavor.lower()
+        if not isinstance(data, dict):
+            return None, ["Item must be an object"]
+        kind = self.kind
+        errors = []
+
+        name = data.get(kind.main.key)
+        main = None
+        if not name:
+            errors.append(kind.main.required)
         else:
-            return "Invalid flavor"
+            main = self._mains.get(normalize(name)) if isinstance(name, str) else None
+            if main is None and isinstance(name, str):
+                entry = self._mainResolver.resolve(name)
+                if entry is not None:
+                    main = self._mains[entry.name]
+            if main is None:
+                errors.append(kind.main.invalid)
+
+        options = []
+        for key, section, resolver, missing, invalid in self._options:
+            name = data.get(key)
+            if not name:
+                errors.append(missing)
+                options.append(None)
+                continue
+            entry = None
+            if isinstance(name, str):
+                entry = section.get(normalize(name)) or resolver.resolve(name)
+            if entry is None:
+                errors.append(invalid)
+            options.append(entry)
+
+        mask = 0
+        names = data.get(kind.modifiers.key) or []
+        if isinstance(names, list):
+            bits = self._modifierBits
+            for name in names:
+                bit = bits.get(normalize(name)) if isinstance(name, str) else None
+                if bit is None and isinstance(name, str):
+                    entry = self._modifierResolver.resolve(name)
+                    if entry is not None:
+                        bit = 1 << entry.code
+                if bit is None:
+                    if kind.modifiers.invalid not in errors:
+                        errors.append(kind.modifiers.invalid)
+                else:
+                    mask |= bit
+        else:
+            errors.append(kind.modifiers.invalid)
 
-    def get_flavor(self):
+        if errors:
+            return None, errors
+        return kind.itemClass.from_parts(kind, self.catalog, main[0], main[1], options, mask), []
+
+    def suggest(self, data):
         """
-        Returns the flavor of the ice cream.
+        Finds did-you-mean suggestions for the names in a payload that
+        aren't on the menu. Only called once a payload has errors.
+
+        Args:
+            data (dict): payload with the item's fields.
 
         Returns:
-            str: flavor of the ice cream.
+            list: a dict with the field, the value sent, and the closest
+                menu names, for each name that has any.
         """
-        return self._flavor
+        if not isinstance(data, dict):
+            return []
+        kind = self.kind
+        fields = [(kind.main.key, data.get(kind.main.key), self._mainResolver)]
+        fields += [(key, data.get(key), resolver) for key, _, resolver, _, _ in self._options]
+        names = data.get(kind.modifiers.key)
+        if isinstance(names, list):
+            fields += [(kind.modifiers.key, name, self._modifierResolver) for name in names]
+
+        suggestions = []
+        for key, name, resolver in fields:
+            if not isinstance(name, str) or not name or self.catalog.find(resolver.sectionName, name):
+                continue
+            closest = resolver.suggest(name)
+            if closest:
+                suggestions.append({"field": key, "value": name, "did_you_mean": closest})
+        return suggestions
+
+
+class Item:
+    """
+    One item in an order, of any item type.
 
-    def add_mix_in(self, mix_in):
+    Attributes:
+        _kind (ItemType): type of the item.
+        _catalog (Catalog): catalog the item was made from.
+        _main (MenuEntry): the main choice.
+        _prices (tuple): price of the main choice with each modifier bitmask.
+        _options (list): MenuEntry for each option, None if not set.
+        _modifiers (int): bitmask of the modifier codes added to the item.
+    """
+
+    __slots__ = ("_kind", "_catalog", "_main", "_prices", "_options", "_modifiers")
+    kind = None  # Item type used when a subclass doesn't pass one
+
+    def __init__(self, main, kind=None):
         """
-        Adds a mix in to the ice cream if valid.
+        Initializes the item, requires the main choice.
 
         Args:
-            mix_in (str): mix in to add.
+            main (str): name of the main choice.
+            kind (ItemType): type of the item, the class's kind if not given.
+        """
+        self._kind = kind or self.kind
+        self._catalog = catalog
+        self._main = None
+        self._prices = None
+        self._options = [None] * len(self._kind.options)
+        self._modifiers = 0
+        self.set_main(main)
+
+    @classmethod
+    def from_parts(cls, kind, itemCatalog, main, prices, options, modifiers):
+        """
+        Makes an item from parts that have already been looked up in the
+        catalog, like an ItemValidator does, without looking them up again.
+
+        Args:
+            kind (ItemType): type of the item.
+            itemCatalog (Catalog): catalog the parts came from.
+            main (MenuEntry): the main choice.
+            prices (tuple): price of the main choice with each modifier bitmask.
+            options (list): MenuEntry for each option.
+            modifiers (int): bitmask of the modifier codes.
 
         Returns:
-            str: "Invalid mix in" if the mix in isn't in the mixIns list.
+            Item: the new item.
         """
-        if mix_in.lower() in mixIns and mix_in.lower() not in self._mix_ins:
-            self._mix_ins.append(mix_in.lower())
-        elif mix_in.lower() not in mixIns:
-            return "Invalid mix in"
-
-    def get_mix_ins(self):
+        item = cls.__new__(cls)
+        item._kind = kind
+        item._catalog = itemCatalog
+        item._main = main
+        item._prices = prices
+        item._options = options
+        item._modifiers = modifiers
+        return item
+
+    @property
+    def itemType(self):
         """
-        Returns the list of mix ins.
+        Returns the type tag of the item.
 
         Returns:
-            list: list of mix ins.
+            str: type tag.
         """
-        return self._mix_ins
+        return self._kind.tag
 
-    def get_total(self):
+    def set_main(self, name):
         """
-        Calculates the total cost of the Ice Storm.
+        Sets the main choice if it's valid.
+
+        Args:
+            name (str): name of the main choice.
 
         Returns:
-            float: total cost of the Ice Storm.
+            str: the item type's invalid message if it isn't on the menu.
         """
-        if not self._flavor:
-            return 0
-        baseCost = iceStorms[self._flavor]
-        mixInCost = sum(mixIns[mix_in] for mix_in in self._mix_ins)
-        return round(baseCost + mixInCost, 2)
+        entry = self._catalog.find(self._kind.main.section, name)
+        if entry:
+            self._main = entry
+            self._prices = self._catalog.price_table(self._kind)[entry.code]
+        else:
+            return self._kind.main.invalid
 
-# Module 1-3 stuff
-class Order:
-    """
-    The total order of drinks and food.
+    def get_main(self):
+        """
+        Returns the main choice.
 
-    Attributes:
-        _items (list): both drinks and food in the order.
-    """
+        Returns:
+            str: name of the main choice, or None if not set.
+        """
+        return self._main.name if self._main else None
 
-    def __init__(self):
+    def set_option(self, key, name):
         """
-        Initializes order object with no items.
+        Sets one of the free choices if it's valid.
+
+        Args:
+            key (str): key of the option.
+            name (str): name of the choice.
+
+        Returns:
+            str: the option's invalid message if it isn't on the menu.
         """
-        self._items = []
+        i = self._kind._optionIndex[key]
+        field = self._kind.options[i]
+        entry = self._catalog.find(field.section, name)
+        if entry:
+            self._options[i] = entry
+        else:
+            return field.invalid
 
-    def add_item(self, item):
+    def get_option(self, key):
         """
-        Adds an item to the order.
+        Returns one of the free choices.
 
         Args:
-            item: item to add.
+            key (str): key of the option.
+
+        Returns:
+            str: name of the choice, or None if not set.
         """
-        self._items.append(item)
+        entry = self._options[self._kind._optionIndex[key]]
+        return entry.name if entry else None
 
-    def remove_item(self, index):
+    def add_modifier(self, name):
         """
-        Removes an item from the order using the list index.
+        Adds a modifier if it's valid. Adding one twice does nothing.
 
         Args:
-            index (int): item to remove based on index.
+            name (str): name of the modifier.
 
         Returns:
-            str: "Invalid index" if the number isn't in the correct range.
+            str: the item type's invalid message if it isn't on the menu.
         """
-        if index >= 0 and index < len(self._items):
-            self._items.pop(index)
-        else:
-            return "Invalid index"
+        entry = self._catalog.find(self._kind.modifiers.section, name)
+        if not entry:
+            return self._kind.modifiers.invalid
+        self._modifiers |= 1 << entry.code
 
-    def get_receipt(self):
+    def get_modifiers(self):
         """
-        Makes a receipt for the order.
+        Returns the modifiers added to the item.
 
         Returns:
-            list: information for each item in the order.
+            list: names of the modifiers, in menu order.
         """
-        receipt = []
-        for i, item in enumerate(self._items):
-            if isinstance(item, Drink):
-                receipt.append({
-                    "index": i,
-                    "type": "drink",
-                    "base": item.get_base(),
-                    "size": item.get_size(),
-                    "flavors": item.get_flavors(),
-                    "total": item.get_total()
-                })
-            # Module 3 stuff
-            elif isinstance(item, Food):
-                receipt.append({
-                    "type": "food",
-                    "foodType": item.get_type(),
-                    "toppings": item.get_toppings(),
-                    "index": i,
-                    "total": item.get_total()
-                })
-                # Module 4 stuff
-            elif isinstance(item, IceStorm):
-                receipt.append({
-                    "index": i,
-                    "type": "ice storm",
-                    "flavor": item.get_flavor(),
-                    "mix_ins": item.get_mix_ins(),
-                    "total": item.get_total()
-                })
-        return receipt
+        return decode_names(self._catalog.byCode[self._kind.modifiers.section], self._modifiers)
 
-    def get_total(self):
+    def get_total_cents(self):
         """
-        Calculates total cost of the order before tax.
+        Returns the total cost of the item from the catalog's price table.
 
         Returns:
-            float: total cost of the order.
+            int: total cost in cents.
         """
-        return round(sum(item.get_total() for item in self._items), 2)
+        if not self._main:
+            return 0
+        return self._prices[self._modifiers]
 
-    def get_total_after_tax(self):
+    def get_total(self):
         """
-        Calculates total cost after tax.
+        Returns the total cost of the item.
 
         Returns:
-            dict: contains the subtotal, tax, and total after tax.
+            float: total cost.
         """
-        total = self.get_total()
-        tax = round(total * taxRate, 2)
-        return {
-            "subtotal": total,
-            "tax": tax,
-            "total_after_tax": round(total + tax, 2)
-        }
+        return to_dollars(self.get_total_cents())
 
+    def get_codes(self):
+        """
+        Returns the catalog codes of the item.
+
+        Returns:
+            tuple: main code (or None if not set) and modifier bitmask.
+        """
+        return (self._main.code if self._main else None), self._modifiers
+
+    def to_receipt(self):
+        """
+        Returns the receipt fields for the item.
+
+        Returns:
+            dict: fields that describe the item, keyed like its JSON payload.
+        """
+        kind = self._kind
+        line = {kind.main.key: self.get_main()}
+        for field, entry in zip(kind.options, self._options):
+            line[field.key] = entry.name if entry else None
+        line[kind.modifiers.key] = self.get_modifiers()
+        return line
+
+# Module 1-2 stuff
+class Drink(Item):
+    """
+    Each drink in the order. The size is the main choice, the base is a
+    free option, and flavors are the modifiers.
+    """
+
+    __slots__ = ()
+
+    def get_base(self):
+        """
+        Returns base of the drink.
+
+        Returns:
+            str: base of the drink, or none if not set.
+        """
+        return self.get_option("base")
+
+    def get_flavors(self):
+        """
+        Returns list of flavors added to the drink.
+
+        Returns:
+            list: the list of flavors, in menu order.
+        """
+        return self.get_modifiers()
+
+    def set_base(self, base):
+        """
+        Sets the base of the drink if it's valid.
+
+        Args:
+            base (str): the base.
+
+        Returns:
+            str: invalid base if the base isn't in the list of available bases.
+        """
+        return self.set_option("base", base)
+
+    def add_flavor(self, flavor):
+        """
+        Adds a flavor to the drink if it's valid and not been added already.
+
+        Args:
+            flavor (str): flavor to add.
+
+        Returns:
+            str: invalid flavor if the flavor isn't in the flavors list.
+        """
+        return self.add_modifier(flavor)
+
+    def set_size(self, size):
+        """
+        Sets the size of the drink if it's valid.
+
+        Args:
+            size (str): size to set.
+
+        Returns:
+            str: invalid size if the size isn't in the size list.
+        """
+        return self.set_main(size)
+
+    def get_size(self):
+        """
+        Returns the size of the drink.
+
+        Returns:
+            str: size of the drink.
+        """
+        return self.get_main()
+
+# Module 3 stuff
+class Food(Item):
+    """
+    Represents food item in the order. The food type is the main choice and
+    toppings are the modifiers.
+    """
+
+    __slots__ = ()
+
+    def set_type(self, foodType):
+        """
+        Sets the type of food if valid.
+
+        Args:
+            foodType (str): sets type of food.
+
+        Returns:
+            str: invalid foor type if food type isn't in foods array.
+        """
+        return self.set_main(foodType)
+
+    def get_type(self):
+        """
+        Returns the type of food.
+
+        Returns:
+            str: type of food.
+        """
+        return self.get_main()
+
+    def add_topping(self, topping):
+        """
+        Adds a topping to the food if valid.
+
+        Args:
+            topping (str): topping to add.
+
+        Returns:
+            str: invalid topping if not in toppings list.
+        """
+        return self.add_modifier(topping)
+
+    def get_toppings(self):
+        """
+        Returns the list of toppings.
+
+        Returns:
+            list: list of toppings, in menu order.
+        """
+        return self.get_modifiers()
+
+# Module 4 stuff
+class IceStorm(Item):
+    """
+    Represents each Ice Storm in the order. The ice cream flavor is the main
+    choice and mix ins are the modifiers.
+    """
+
+    __slots__ = ()
+
+    def set_flavor(self, flavor):
+        """
+        Sets the flavor of the ice cream if valid.
+
+        Args:
+            flavor (str): flavor of the ice cream.
+
+        Returns:
+            str: "Invalid flavor" if the flavor isn't in the iceStorms list.
+        """
+        return self.set_main(flavor)
+
+    def get_flavor(self):
+        """
+        Returns the flavor of the ice cream.
+
+        Returns:
+            str: flavor of the ice cream.
+        """
+        return self.get_main()
+
+    def add_mix_in(self, mix_in):
+        """
+        Adds a mix in to the ice cream if valid.
+
+        Args:
+            mix_in (str): mix in to add.
+
+        Returns:
+            str: "Invalid mix in" if the mix in isn't in the mixIns list.
+        """
+        return self.add_modifier(mix_in)
+
+    def get_mix_ins(self):
+        """
+        Returns the list of mix ins.
+
+        Returns:
+            list: list of mix ins, in menu order.
+        """
+        return self.get_modifiers()
+
+# The built in item types
+drinkType = register_item_type(ItemType(
+    "drink",
+    main=ItemField("size", "sizes", "Size is required", "Invalid size"),
+    modifiers=ItemField("flavors", "flavors", None, "Invalid flavor"),
+    options=(ItemField("base", "bases", None, "Invalid base"),),
+    itemClass=Drink,
+))
+foodType = register_item_type(ItemType(
+    "food",
+    main=ItemField("foodType", "foods", "Food type is required", "Invalid food type"),
+    modifiers=ItemField("toppings", "toppings", None, "Invalid topping"),
+    itemClass=Food,
+))
+iceStormType = register_item_type(ItemType(
+    "ice storm",
+    main=ItemField("flavor", "iceStorms", "Flavor is required", "Invalid flavor"),
+    modifiers=ItemField("mix_ins", "mixIns", None, "Invalid mix in"),
+    itemClass=IceStorm,
+))
+Drink.kind = drinkType
+Food.kind = foodType
+IceStorm.kind = iceStormType
+
+# Menu file stuff
+# A catalog never changes once it's built. Reloading the menu builds a whole
+# new catalog off to the side and then points the global catalog at it, which
+# is one atomic assignment, like RCU. Requests read the global once and keep
+# using the catalog they got, so they never take a lock or see half of a new
+# menu, and items keep the catalog (and prices) they were made from.
+menuPriceSections = ("sizes", "foods", "toppings", "iceStorms", "mixIns")
+menuNameSections = ("bases", "flavors")
+
+
+def read_menu(path):
+    """
+    Reads a menu file, TOML if the name ends in .toml and JSON otherwise.
+
+    Args:
+        path (str): path of the menu file.
+
+    Returns:
+        dict: the menu.
+
+    Raises:
+        OSError: if the file can't be read.
+        ValueError: if the file isn't valid JSON or TOML.
+    """
+    with open(path, "rb") as f:
+        if path.endswith(".toml"):
+            if tomllib is None:
+                raise ValueError("TOML menus need Python 3.11 or newer")
+            return tomllib.load(f)
+        return json.load(f)
+
+
+def load_catalog(path):
+    """
+    Builds a catalog from a menu file, with every price table and item
+    validator ready so the first requests using it don't have to build them.
+
+    Args:
+        path (str): path of the menu file.
+
+    Returns:
+        Catalog: the new catalog.
+
+    Raises:
+        OSError: if the file can't be read.
+        ValueError: if the menu isn't valid.
+    """
+    newCatalog = Catalog.from_menu(read_menu(path))
+    for kind in itemDefinitions.values():
+        newCatalog.validator(kind)
+    return newCatalog
+
+
+# Only one reload runs at a time, requests never take this lock
+catalogLock = threading.Lock()
+
+
+def reload_catalog(path=None):
+    """
+    Loads a menu file and swaps its catalog in for the current one. If the
+    menu isn't valid, the current catalog is kept.
+
+    Args:
+        path (str): path of the menu file, menuPath if not given.
+
+    Returns:
+        Catalog: the new catalog.
+
+    Raises:
+        OSError: if the file can't be read.
+        ValueError: if there's no menu file or the menu isn't valid.
+    """
+    global catalog
+    path = path or menuPath
+    if not path:
+        raise ValueError("No menu file is set")
+    with catalogLock:
+        newCatalog = load_catalog(path)
+        catalog = newCatalog
+    return newCatalog
+
+
+class MenuWatcher:
+    """
+    Reloads the menu when its file changes, checking every few seconds from
+    a background thread.
+
+    Attributes:
+        path (str): path of the menu file.
+        interval (float): seconds between checks.
+        lastError (str): why the last reload failed, None if it didn't.
+        _seen (tuple): modified time and size of the file when last checked.
+        _stop (Event): set to stop the thread.
+        _thread (Thread): the watching thread.
+    """
+
+    def __init__(self, path, interval=1.0):
+        """
+        Initializes the watcher, the file as it is now counts as loaded.
+
+        Args:
+            path (str): path of the menu file.
+            interval (float): seconds between checks.
+        """
+        self.path = path
+        self.interval = interval
+        self.lastError = None
+        self._seen = self._stat()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _stat(self):
+        """
+        Returns what's checked to tell if the file changed.
+
+        Returns:
+            tuple: modified time and size, None if the file isn't there.
+        """
+        try:
+            info = os.stat(self.path)
+        except OSError:
+            return None
+        return info.st_mtime_ns, info.st_size
+
+    def check(self):
+        """
+        Reloads the menu if the file changed since the last check.
+
+        Returns:
+            bool: True if a new catalog was swapped in.
+        """
+        seen = self._stat()
+        if seen is None or seen == self._seen:
+            return False
+        self._seen = seen
+        try:
+            reload_catalog(self.path)
+        except (OSError, ValueError) as error:
+            self.lastError = str(error)
+            return False
+        self.lastError = None
+        return True
+
+    def _run(self):
+        """
+        Checks the file until stopped.
+        """
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self):
+        """
+        Starts watching in a daemon thread.
+
+        Returns:
+            MenuWatcher: this watcher.
+        """
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops watching.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+# Build the catalog from the menu file if there is one, or the menu above if not.
+# Setting CINOS_MENU_WATCH_SECONDS also reloads it whenever the file changes.
+menuPath = os.environ.get("CINOS_MENU_PATH")
+catalog = load_catalog(menuPath) if menuPath else Catalog(sizes, bases, flavors, flavorCost, foods, toppings, iceStorms, mixIns, taxRate, aliases)
+menuWatchSeconds = float(os.environ.get("CINOS_MENU_WATCH_SECONDS", "0"))
+menuWatcher = MenuWatcher(menuPath, menuWatchSeconds).start() if menuPath and menuWatchSeconds > 0 else None
+
+# Module 1-3 stuff
+class Order:
+    """
+    The total order of drinks and food.
+
+    Item prices are captured when an item is added, and the subtotals are
+    kept up to date on every add and remove, so items should be fully set
+    up before they go into the order.
+
+    Every item gets an id when it's added that never changes. Removing by
+    id leaves a tombstone (None) in its slot instead of shifting the later
+    items, and the tombstones are compacted away once there are enough of
+    them or when list indexes are needed.
+
+    Attributes:
+        _items (list): both drinks and food in the order, None for removed items.
+        _prices (list): price of each item in cents, in the same order as _items.
+        _ids (list): id of each item, in the same order as _items (always sorted).
+        _slotById (dict): id of each item still in the order to its place in _items.
+        _nextId (int): id the next added item gets.
+        _subtotal (int): running total of every item price in cents.
+        _subtotals (dict): running total in cents for each item type.
+        _byType (dict): sorted ids of the items of each item type.
+        _token (str): random id for this order object, used in ETags.
+        _version (int): goes up by one every time the order changes.
+        _journal (callable): called with an op and its data on every change, None if not logged.
+        _lastLsn (int): LSN of the last change sent to the journal.
+    """
+
+    def __init__(self):
+        """
+        Initializes order object with no items.
+        """
+        self._items = []
+        self._prices = []
+        self._ids = []
+        self._slotById = {}
+        self._nextId = 0
+        self._subtotal = 0
+        self._subtotals = dict.fromkeys(itemDefinitions, 0)
+        self._byType = {itemType: [] for itemType in itemDefinitions}
+        self._token = uuid.uuid4().hex[:16]
+        self._version = 0
+        self._journal = None
+        self._lastLsn = 0
+
+    def __len__(self):
+        """
+        Returns the number of items in the order.
+
+        Returns:
+            int: number of items.
+        """
+        return len(self._slotById)
+
+    def add_item(self, item, itemId=None, price=None):
+        """
+        Adds an item to the order.
+
+        Args:
+            item: item to add.
+            itemId (int): id to give the item when replaying the log, must be
+                higher than every id the order has used. The next id if not given.
+            price (int): price in cents the item was added at, when replaying
+                the log, so a menu change since doesn't change the order. The
+                item's price from its catalog if not given.
+
+        Returns:
+            int: id of the item in the order.
+
+        Raises:
+            ValueError: if itemId isn't higher than every id already used.
+        """
+        if itemId is None:
+            itemId = self._nextId
+        elif itemId < self._nextId:
+            raise ValueError(f"Item id {itemId} is already used")
+        if price is None:
+            price = item.get_total_cents()
+        itemType = item.itemType
+        self._nextId = itemId + 1
+        self._slotById[itemId] = len(self._items)
+        self._byType.setdefault(itemType, []).append(itemId)
+        self._items.append(item)
+        self._prices.append(price)
+        self._ids.append(itemId)
+        self._subtotal += price
+        self._subtotals[itemType] = self._subtotals.get(itemType, 0) + price
+        self._version += 1
+        if self._journal is not None:
+            record = {"type": itemType}
+            record.update(item.to_receipt())
+            self._lastLsn = self._journal("add", {"id": itemId, "price": price, "item": record})
+        return itemId
+
+    def add_items(self, items):
+        """
+        Adds several items to the order.
+
+        Args:
+            items (list): items to add.
+
+        Returns:
+            list: ids of the items in the order.
+        """
+        return [self.add_item(item) for item in items]
+
+    def remove_item(self, index):
+        """
+        Removes an item from the order using the list index.
+
+        Args:
+            index (int): item to remove based on index.
+
+        Returns:
+            str: "Invalid index" if the number isn't in the correct range.
+        """
+        if index >= 0 and index < len(self):
+            self._compact()
+            self.remove_item_by_id(self._ids[index])
+        else:
+            return "Invalid index"
+
+    def remove_item_by_id(self, itemId):
+        """
+        Removes an item from the order using its id.
+
+        Args:
+            itemId (int): id of the item to remove.
+
+        Returns:
+            str: "Invalid item id" if there's no item with that id.
+        """
+        slot = self._slotById.pop(itemId, None)
+        if slot is None:
+            return "Invalid item id"
+        item = self._items[slot]
+        price = self._prices[slot]
+        self._items[slot] = None
+        self._subtotal -= price
+        self._subtotals[item.itemType] -= price
+        self._version += 1
+        if self._journal is not None:
+            self._lastLsn = self._journal("remove", {"ids": [itemId]})
+        if len(self._items) - len(self._slotById) > max(32, len(self._slotById)):
+            self._compact()
+
+    def remove_items(self, indexes=None, itemType=None):
+        """
+        Removes several items from the order at once.
+
+        Every index is checked against the order as it is before anything
+        is removed, then all of the items are dropped in one pass.
+
+        Args:
+            indexes (list): list indexes of the items to remove.
+            itemType (str): remove every item of this type instead.
+
+        Returns:
+            str: "Invalid index" or "Invalid type" if nothing was removed because of bad input.
+        """
+        self._compact()
+        if itemType is not None:
+            if itemType not in itemDefinitions:
+                return "Invalid type"
+            slots = {self._slotById[itemId] for itemId in self._byType.get(itemType, [])}
+        else:
+            slots = set()
+            for index in indexes:
+                if type(index) is not int or index < 0 or index >= len(self._items):
+                    return "Invalid index"
+                slots.add(index)
+        if not slots:
+            return
+
+        for slot in slots:
+            item = self._items[slot]
+            price = self._prices[slot]
+            del self._slotById[self._ids[slot]]
+            self._items[slot] = None
+            self._subtotal -= price
+            self._subtotals[item.itemType] -= price
+        self._version += 1
+        if self._journal is not None:
+            self._lastLsn = self._journal("remove", {"ids": sorted(self._ids[slot] for slot in slots)})
+        self._compact()
+
+    def _compact(self):
+        """
+        Drops the tombstones left by removed items in one pass.
+        """
+        if len(self._items) == len(self._slotById):
+            return
+        keep = [slot for slot, item in enumerate(self._items) if item is not None]
+        self._items = [self._items[slot] for slot in keep]
+        self._prices = [self._prices[slot] for slot in keep]
+        self._ids = [self._ids[slot] for slot in keep]
+        self._slotById = {itemId: slot for slot, itemId in enumerate(self._ids)}
+        for itemType, ids in self._byType.items():
+            self._byType[itemType] = [itemId for itemId in ids if itemId in self._slotById]
+
+    def get_items(self):
+        """
+        Returns the items in the order.
+
+        Returns:
+            list: the items, in the order they were added.
+        """
+        return [item for item in self._items if item is not None]
+
+    @staticmethod
+    def _receipt_line(i, itemId, item, price):
+        """
+        Makes the receipt entry for one item.
+
+        Args:
+            i (int): index of the item in the order.
+            itemId (int): id of the item in the order.
+            item: the item.
+            price (int): price of the item in cents.
+
+        Returns:
+            dict: information for the item.
+        """
+        line = receiptSerializers[item.itemType](item)
+        line["index"] = i
+        line["id"] = itemId
+        line["type"] = item.itemType
+        line["total"] = to_dollars(price)
+        return line
+
+    def get_receipt(self):
+        """
+        Makes a receipt for the order.
+
+        Returns:
+            list: information for each item in the order.
+        """
+        return list(self.iter_receipt())
+
+    def get_receipt_page(self, limit=None, cursor=0, itemType=None):
+        """
+        Makes part of the receipt, optionally only for one item type.
+
+        Only the items on the page are looked at, using the per type indexes
+        when filtering.
+
+        Args:
+            limit (int): most items to return, or None for all of them.
+            cursor (int): id of the item to start from.
+            itemType (str): only return items of this type, or None for all.
+
+        Returns:
+            tuple: information for each item on the page, and the cursor for
+                the next page (None if this is the last page).
+        """
+        self._compact()
+        ids = self._ids if itemType is None else self._byType.get(itemType, [])
+        start = bisect_left(ids, cursor)
+        end = len(ids) if limit is None else min(start + limit, len(ids))
+        page = []
+        for itemId in ids[start:end]:
+            slot = self._slotById[itemId]
+            page.append(self._receipt_line(slot, itemId, self._items[slot], self._prices[slot]))
+        nextCursor = ids[end - 1] + 1 if end < len(ids) else None
+        return page, nextCursor
+
+    def iter_receipt(self):
+        """
+        Makes the receipt one item at a time.
+
+        The order's items are copied when this is called (only the references,
+        not the receipt entries), so the entries can be made later without
+        holding the order's lock.
+
+        Returns:
+            generator: information for each item in the order.
+        """
+        items = self._items[:]
+        prices = self._prices[:]
+        ids = self._ids[:]
+        live = (slot for slot, item in enumerate(items) if item is not None)
+        return (self._receipt_line(i, ids[slot], items[slot], prices[slot]) for i, slot in enumerate(live))
+
+    def get_version(self):
+        """
+        Returns the version of the order, which goes up on every change.
+
+        Returns:
+            int: version of the order.
+        """
+        return self._version
+
+    def get_etag(self):
+        """
+        Returns a strong ETag for the current contents of the order. The
+        catalog's generation is part of it, since the tax comes from the
+        current catalog.
+
+        Returns:
+            str: ETag, without quotes.
+        """
+        return f"{self._token}-{self._version}-{catalog.generation}"
+
+    def get_total(self):
+        """
+        Returns the total cost of the order before tax.
+
+        Returns:
+            float: total cost of the order.
+        """
+        return to_dollars(self._subtotal)
+
+    def get_subtotals(self):
+        """
+        Returns the total cost of each item type in the order before tax.
+
+        Returns:
+            dict: item type mapped to its total cost.
+        """
+        return {itemType: to_dollars(subtotal) for itemType, subtotal in self._subtotals.items()}
+
+    def get_total_after_tax(self):
+        """
+        Calculates total cost after tax.
+
+        Returns:
+            dict: contains the subtotal, tax, and total after tax.
+        """
+        tax = calculate_tax(self._subtotal)
+        return {
+            "subtotal": to_dollars(self._subtotal),
+            "tax": to_dollars(tax),
+            "total_after_tax": to_dollars(self._subtotal + tax)
+        }
+
+# Order store stuff
+class StoreUnavailable(Exception):
+    """
+    Raised when the store can't save changes, like after its write-ahead
+    log failed. The routes turn it into a 503.
+    """
+
+
+class OrderStore:
+    """
+    Holds every open order, sharded by order id across locked buckets.
+
+    Each bucket has its own lock, so registers working on different orders
+    only contend when their ids land in the same bucket.
+
+    With a write-ahead log attached, every change is appended to the log
+    while the bucket lock is held (so the log has them in the same order),
+    and the caller waits for the log to be on disk after the lock is let go,
+    so other registers aren't held up by the fsync. Once the log fails,
+    changes are refused before they're made, since they couldn't be saved.
+
+    Attributes:
+        _buckets (list): dicts mapping order id to Order, one per bucket.
+        _locks (list): one lock per bucket.
+        log (WriteAheadLog): log every change is written to, None if not logged.
+        shared (bool): always False, the orders are only in this process.
+    """
+
+    shared = False
+
+    def __init__(self, numBuckets=64, log=None):
+        """
+        Initializes the store with empty buckets.
+
+        Args:
+            numBuckets (int): number of independently locked buckets.
+            log (WriteAheadLog): log to write every change to.
+        """
+        self._buckets = [{} for _ in range(numBuckets)]
+        self._locks = [threading.Lock() for _ in range(numBuckets)]
+        self.log = None
+        if log is not None:
+            self.attach_log(log)
+
+    def attach_log(self, log):
+        """
+        Starts writing every change to a write-ahead log, including changes
+        to orders already in the store (like ones just replayed from it).
+
+        Args:
+            log (WriteAheadLog): the log.
+        """
+        self.log = log
+        for i, bucket in enumerate(self._buckets):
+            with self._locks[i]:
+                for order_id, order in bucket.items():
+                    self._watch(order_id, order)
+
+    def _watch(self, order_id, order):
+        """
+        Points an order's journal at the log. The bucket lock must be held.
+
+        Args:
+            order_id (str): id of the order.
+            order (Order): the order.
+        """
+        log = self.log
+        if log is not None:
+            order._journal = lambda op, data: log.append(op, order_id, data)
+
+    def replay(self, records):
+        """
+        Rebuilds orders from write-ahead log records. Call it before
+        attach_log, so the replayed changes aren't logged again.
+
+        Args:
+            records (iterable): LSN, op, order id, and data of each record, like read_log gives.
+
+        Returns:
+            int: LSN of the last record replayed, 0 if there weren't any.
+        """
+        lastLsn = 0
+        for lsn, op, order_id, data in records:
+            lastLsn = lsn
+            if op == "create":
+                self.create_order(order_id)
+            elif op == "delete":
+                self.delete_order(order_id)
+            else:
+                with self.checkout(order_id) as order:
+                    if order is None:
+                        continue
+                    if op == "add":
+                        kind = itemDefinitions.get(data["item"].get("type"))
+                        if kind is not None:
+                            order.add_item(kind.restore(data["item"]), data["id"], data.get("price"))
+                    elif op == "remove":
+                        for itemId in data["ids"]:
+                            order.remove_item_by_id(itemId)
+        return lastLsn
+
+    @contextmanager
+    def pause(self):
+        """
+        Holds every bucket lock, so nothing in the store can change while
+        the caller looks at all of it.
+        """
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in self._locks:
+                lock.release()
+
+    def dump(self):
+        """
+        Reads out every order for a snapshot. Only call it while nothing can
+        change the store, like with pause held or in a forked child.
+
+        Yields:
+            tuple: order id, token, version, next item id, and a list of the
+                id, type tag, price in cents, and receipt fields of each item.
+        """
+        for bucket in self._buckets:
+            for order_id, order in bucket.items():
+                items = [
+                    (itemId, item.itemType, price, item.to_receipt())
+                    for itemId, item, price in zip(order._ids, order._items, order._prices)
+                    if item is not None
+                ]
+                yield order_id, order._token, order._version, order._nextId, items
+
+    def restore(self, orders):
+        """
+        Adds orders read out of a snapshot. Like replay, call it before
+        attach_log.
+
+        Args:
+            orders (iterable): orders in the form dump gives.
+
+        Returns:
+            int: number of orders added.
+        """
+        count = 0
+        for order_id, token, version, nextId, items in orders:
+            order = Order()
+            for itemId, itemType, price, fields in items:
+                kind = itemDefinitions.get(itemType)
+                if kind is not None:
+                    order.add_item(kind.restore(fields), itemId, price)
+            order._token = token
+            order._version = version
+            order._nextId = max(order._nextId, nextId)
+            i = self._bucket_index(order_id)
+            with self._locks[i]:
+                self._buckets[i][order_id] = order
+            count += 1
+        return count
+
+    def _bucket_index(self, order_id):
+        """
+        Returns the bucket that an order id belongs to.
+
+        Args:
+            order_id (str): id of the order.
+
+        Returns:
+            int: index of the bucket.
+        """
+        return zlib.crc32(order_id.encode()) % len(self._buckets)
+
+    def create_order(self, order_id=None):
+        """
+        Creates a new empty order.
+
+        Args:
+            order_id (str): id to use, a random one is made if not given.
+
+        Returns:
+            str: id of the new order, or None if the id is already taken.
+        """
+        if order_id is None:
+            order_id = uuid.uuid4().hex
+        self._check_log()
+        i = self._bucket_index(order_id)
+        lsn = 0
+        with self._locks[i]:
+            if order_id in self._buckets[i]:
+                return None
+            order = self._buckets[i][order_id] = Order()
+            if self.log is not None:
+                self._watch(order_id, order)
+                lsn = self.log.append("create", order_id)
+        if lsn:
+            self._wait_log(lsn)
+        return order_id
+
+    def delete_order(self, order_id):
+        """
+        Deletes an order from the store.
+
+        Args:
+            order_id (str): id of the order.
+
+        Returns:
+            bool: True if the order existed.
+        """
+        self._check_log()
+        i = self._bucket_index(order_id)
+        lsn = 0
+        with self._locks[i]:
+            if self._buckets[i].pop(order_id, None) is None:
+                return False
+            if self.log is not None:
+                lsn = self.log.append("delete", order_id)
+        if lsn:
+            self._wait_log(lsn)
+        return True
+
+    def _check_log(self):
+        """
+        Makes sure changes can still be saved before making one.
+
+        Raises:
+            StoreUnavailable: if the log has failed.
+        """
+        if self.log is not None:
+            try:
+                self.log.check()
+            except OSError as error:
+                raise StoreUnavailable(str(error)) from error
+
+    def _wait_log(self, lsn):
+        """
+        Waits for a change to be on disk.
+
+        Args:
+            lsn (int): LSN of the change's record.
+
+        Raises:
+            StoreUnavailable: if the log failed before the change was saved.
+        """
+        try:
+            self.log.wait(lsn)
+        except OSError as error:
+            raise StoreUnavailable(str(error)) from error
+
+    @contextmanager
+    def checkout(self, order_id, write=True):
+        """
+        Holds the lock for an order while the caller reads or changes it.
+        With a log attached, it then waits for the changes to be on disk.
+
+        Args:
+            order_id (str): id of the order.
+            write (bool): whether the caller might change the order. Reads
+                still take the lock, since making a receipt can compact the
+                order, but don't wait on the log.
+
+        Yields:
+            Order: the order, or None if there is no order with that id.
+
+        Raises:
+            StoreUnavailable: if the log has failed, before anything changes,
+                or if it fails before the changes are saved.
+        """
+        if write:
+            self._check_log()
+        i = self._bucket_index(order_id)
+        with self._locks[i]:
+            order = self._buckets[i].get(order_id)
+            yield order
+        if write and order is not None and self.log is not None:
+            self._wait_log(order._lastLsn)
+
+    def __len__(self):
+        """
+        Returns the number of orders in the store.
+
+        Returns:
+            int: number of orders.
+        """
+        return sum(len(bucket) for bucket in self._buckets)
+
+
+def build_items(payloads):
+    """
+    Makes every item in a batch, collecting the errors by position.
+
+    Args:
+        payloads (list): JSON payloads, each with a type and the item fields.
+
+    Returns:
+        tuple: list of items, and list of errors with the index of the bad payload.
+    """
+    items = []
+    errors = []
+    for i, data in enumerate(payloads):
+        if not isinstance(data, dict):
+            errors.append({"index": i, "error": "Item must be an object"})
+            continue
+        itemType = data.get("type")
+        kind = itemDefinitions.get(itemType) if isinstance(itemType, str) else None
+        if kind is None:
+            errors.append({"index": i, "error": "Invalid item type"})
+            continue
+        item, itemErrors = kind.validate(data)
+        if itemErrors:
+            errors.extend({"index": i, "error": error} for error in itemErrors)
+        else:
+            items.append(item)
+    return items, errors
+
+
+# Receipt cache stuff
+class ReceiptCache:
+    """
+    Keeps the encoded GET /order response for recent order versions.
+
+    Entries are keyed by order and query string, and remember which order
+    version (the ETag) they were made from, so a change to the order or to
+    the catalog makes its entries stale. The least recently used entries are dropped to stay under the
+    byte budget.
+
+    Attributes:
+        maxBytes (int): most bytes of responses to keep, 0 turns the cache off.
+        _entries (OrderedDict): key to (version, encoded response), oldest first.
+        _size (int): bytes of responses currently kept.
+        _lock (Lock): guards the entries.
+    """
+
+    def __init__(self, maxBytes=0):
+        """
+        Initializes an empty cache.
+
+        Args:
+            maxBytes (int): most bytes of responses to keep.
+        """
+        self.maxBytes = maxBytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """
+        Returns the encoded response for a key if it's for the given version.
+
+        Args:
+            key (tuple): order token and query string.
+            version (str): current ETag of the order.
+
+        Returns:
+            bytes: the encoded response, or None if there isn't a current one.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, version, data):
+        """
+        Keeps an encoded response, dropping old ones if over budget.
+
+        Args:
+            key (tuple): order token and query string.
+            version (str): ETag of the order the response was made from.
+            data (bytes): the encoded response.
+        """
+        if len(data) > self.maxBytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (version, data)
+            self._size += len(data)
+            while self._size > self.maxBytes:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        """
+        Removes an entry. The lock must be held.
+
+        Args:
+            key (tuple): key to remove.
+        """
+        self._size -= len(self._entries.pop(key)[1])
+
+    def __len__(self):
+        """
+        Returns the number of responses kept.
+
+        Returns:
+            int: number of entries.
+        """
+        return len(self._entries)
+
+
+class IdempotencyCache:
+    """
+    Remembers the responses to requests sent with an Idempotency-Key, so a
+    retried request gets the first response back instead of running again.
+
+    A request that comes in while the first one with its key is still
+    running waits for it and gets its response. Keys are forgotten after
+    ttl seconds, and the least recently used ones are dropped to stay under
+    maxEntries.
+
+    Attributes:
+        maxEntries (int): most keys to remember, 0 turns the cache off.
+        ttl (float): seconds a key is remembered for.
+        _entries (OrderedDict): key to [request fingerprint, expiry time,
+            Event set when done, response or None while running], oldest first.
+        _lock (Lock): guards the entries.
+    """
+
+    def __init__(self, maxEntries=10000, ttl=86400):
+        """
+        Initializes an empty cache.
+
+        Args:
+            maxEntries (int): most keys to remember.
+            ttl (float): seconds a key is remembered for.
+        """
+        self.maxEntries = maxEntries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def run(self, key, fingerprint, compute):
+        """
+        Runs compute for the first request with a key, and gives every
+        later request with the key the same response.
+
+        If compute raises, nothing is remembered, so the request can be
+        retried.
+
+        Args:
+            key (tuple): route and Idempotency-Key.
+            fingerprint (bytes): hash of the request body.
+            compute (callable): makes the response.
+
+        Returns:
+            tuple: the response, whether it was replayed, and an error
+                message if the key was already used for a different request.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                entry = self._entries.get(key)
+                if entry is not None and entry[3] is not None and entry[1] <= now:
+                    del self._entries[key]
+                    entry = None
+                if entry is None:
+                    entry = [fingerprint, now + self.ttl, threading.Event(), None]
+                    self._entries[key] = entry
+                    self._evict()
+                    break
+                if entry[0] != fingerprint:
+                    return None, False, "Idempotency-Key was already used for a different request"
+                self._entries.move_to_end(key)
+                if entry[3] is not None:
+                    return entry[3], True, None
+                done = entry[2]
+            # Wait for the first request, then look again (it may have failed)
+            done.wait()
+
+        try:
+            response = compute()
+        except BaseException:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            entry[2].set()
+            raise
+        with self._lock:
+            entry[3] = response
+        entry[2].set()
+        return response, False, None
+
+    def _evict(self):
+        """
+        Drops the least recently used finished keys while over maxEntries.
+        Keys still running are kept so their waiters aren't run again. The
+        lock must be held.
+        """
+        excess = len(self._entries) - self.maxEntries
+        if excess <= 0:
+            return
+        stale = []
+        for key, entry in self._entries.items():
+            if len(stale) == excess:
+                break
+            if entry[3] is not None:
+                stale.append(key)
+        for key in stale:
+            del self._entries[key]
+
+    def __len__(self):
+        """
+        Returns the number of keys remembered.
+
+        Returns:
+            int: number of entries.
+        """
+        return len(self._entries)
+
+
+# Opt in by setting CINOS_RECEIPT_CACHE_BYTES to the memory budget in bytes
+receiptCache = ReceiptCache(int(os.environ.get("CINOS_RECEIPT_CACHE_BYTES", "0")))
+
+# Keys remembered for the POST item routes, 0 turns Idempotency-Key support off
+idempotencyCache = IdempotencyCache(int(os.environ.get("CINOS_IDEMPOTENCY_KEYS", "10000")))
+
+
+def idempotency_cache():
+    """
+    Returns where Idempotency-Key responses are kept. A store shared between
+    processes keeps them itself, since a retry can reach any worker.
+
+    Returns:
+        the store's cache if it's shared, idempotencyCache if not.
+    """
+    return store.idempotency if store.shared else idempotencyCache
+
+# Opt in to keeping orders across restarts by setting CINOS_WAL_PATH to a log file,
+# and to background snapshots by setting CINOS_SNAPSHOT_DIR to a folder for them
+DEFAULT_ORDER_ID = "default"
+walPath = os.environ.get("CINOS_WAL_PATH")
+snapshotDir = os.environ.get("CINOS_SNAPSHOT_DIR")
+snapshotSaver = BackgroundSaver(snapshotDir) if snapshotDir else None
+
+
+def open_store():
+    """
+    Makes the order store, loading the newest snapshot and replaying the log
+    after it when those are turned on, plus the default order the /order
+    routes use. Only one process at a time should have the log open.
+
+    Returns:
+        OrderStore: the store.
+    """
+    newStore = OrderStore()
+    snapshotLsn = load_store(newStore, snapshotDir) if snapshotDir else 0
+    if walPath:
+        newStore.replay(read_log(walPath, snapshotLsn))
+        newStore.attach_log(WriteAheadLog(walPath, startLsn=snapshotLsn))
+    newStore.create_order(DEFAULT_ORDER_ID)
+    return newStore
+
+
+store = open_store()
 
-# Create an order object
-order = Order()
-
 # Module 1-3 stuff
 @app.route('/')
 def home():
@@ -453,115 +2468,404 @@ def home():
     return jsonify({"message": "add /order in the url to use"})
 
 
-@app.route('/order', methods=['GET'])
-def get_order():
+def order_not_found():
     """
-    Gets the current order, including receipt and totals.
+    Error response for an order id that isn't in the store.
 
     Returns:
-        dict: receipt, totals, and the number of items in the order.
+        tuple: error message and 404 status.
     """
-    return jsonify({
-        "items": order.get_receipt(),
-        "totals": order.get_total_after_tax(),
-        "num_items": len(order._items)
-    })
+    return jsonify({"error": "Order not found"}), 404
 
 
-@app.route('/order', methods=['POST'])
-def add_drink():
+@app.errorhandler(StoreUnavailable)
+def store_unavailable(error):
     """
-    Adds a new drink to the order.
+    Error response for a change the store can't save.
+
+    Args:
+        error (StoreUnavailable): why it can't be saved.
 
     Returns:
-        dict: success or error message depending on if input is valid.
+        tuple: error message and 503 status.
     """
-    data = request.json
-    size = data.get("size")
-    if not size:
-        return jsonify({"error": "Size is required"}), 400
+    return jsonify({"error": "Orders can't be saved right now"}), 503
 
-    drink = Drink(size)
-    baseError = drink.set_base(data.get("base"))
-    if baseError:
-        return jsonify({"error": baseError}), 400
 
-    for flavor in data.get("flavors", []):
-        flavorError = drink.add_flavor(flavor)
-        if flavorError:
-            return jsonify({"error": flavorError}), 400
+def idempotent(route):
+    """
+    Makes a POST route answer a retried request (same Idempotency-Key
+    header and body) with the response it gave the first time, without
+    checking or adding the items again.
 
-    order.add_item(drink)
-    return jsonify({"message": "Drink added successfully."}), 201
+    Args:
+        route (callable): the route function.
+
+    Returns:
+        callable: the wrapped route.
+    """
+    @wraps(route)
+    def wrapper(order_id):
+        key = request.headers.get("Idempotency-Key")
+        if key is None or not idempotencyCache.maxEntries:
+            return route(order_id)
+        if not key or len(key) > 255:
+            return jsonify({"error": "Invalid Idempotency-Key"}), 400
+
+        def compute():
+            response = app.make_response(route(order_id))
+            return response.get_data(), response.status_code
+
+        fingerprint = hashlib.blake2b(request.get_data(), digest_size=16).digest()
+        saved, replayed, error = idempotency_cache().run((request.path, key), fingerprint, compute)
+        if error:
+            return jsonify({"error": error}), 422
+        response = Response(saved[0], status=saved[1], mimetype="application/json")
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return response
+    return wrapper
+
+
+# Order store stuff
+@app.route('/orders', methods=['POST'])
+def create_order():
+    """
+    Creates a new empty order.
+
+    Returns:
+        dict: id of the new order.
+    """
+    order_id = store.create_order()
+    return jsonify({"order_id": order_id}), 201
 
 
-@app.route('/order/food', methods=['POST'])
-def add_food():
+@app.route('/admin/snapshot', methods=['POST'])
+def save_snapshot():
     """
-    Adds a new food to the order.
+    Starts saving a snapshot of every order in the background.
 
     Returns:
-        dict: success or error message depending on if the input is valid.
+        dict: message saying the snapshot started, or an error if snapshots
+            aren't turned on (or the store isn't the in-memory one) or one is
+            already being saved.
     """
-    data = request.json
-    foodType = data.get("foodType")
-    if not foodType:
-        return jsonify({"error": "Food type is required"}), 400
+    if snapshotSaver is None:
+        return jsonify({"error": "Snapshots are not turned on"}), 400
+    if store.shared:
+        return jsonify({"error": "Snapshots only work with the in-memory order store"}), 400
+    if snapshotSaver.start(store) is None:
+        return jsonify({"error": "A snapshot is already being saved"}), 409
+    return jsonify({"message": "Snapshot started."}), 202
+
+
+@app.route('/admin/menu/reload', methods=['POST'])
+def reload_menu():
+    """
+    Reloads the menu file and swaps the new catalog in. With several worker
+    processes this only reloads the one that gets the request, so send the
+    server SIGHUP or use CINOS_MENU_WATCH_SECONDS instead.
+
+    Returns:
+        dict: message and the new catalog's generation, or an error if no
+            menu file is set or the menu isn't valid.
+    """
+    try:
+        newCatalog = reload_catalog()
+    except (OSError, ValueError) as error:
+        return jsonify({"error": f"Menu not reloaded: {error}"}), 400
+    return jsonify({"message": "Menu reloaded.", "generation": newCatalog.generation}), 200
+
+
+@app.route('/orders/<order_id>', methods=['DELETE'])
+def delete_order(order_id):
+    """
+    Deletes a whole order with the id in the URL.
+
+    Returns:
+        dict: success or an error message.
+    """
+    if not store.delete_order(order_id):
+        return order_not_found()
+    return jsonify({"message": "Order deleted successfully."}), 200
+
+
+def read_page_args(args):
+    """
+    Reads the paging and filter query parameters for an order.
+
+    Args:
+        args (dict): query parameters with optional limit, cursor, and type.
+
+    Returns:
+        tuple: limit, cursor, item type, and an error message or None.
+    """
+    limit = args.get("limit")
+    if limit is not None:
+        if not limit.isdigit() or int(limit) < 1:
+            return None, None, None, "Invalid limit"
+        limit = int(limit)
+    cursor = args.get("cursor", "0")
+    if not cursor.isdigit():
+        return None, None, None, "Invalid cursor"
+    itemType = args.get("type")
+    if itemType is not None and itemType not in itemDefinitions:
+        return None, None, None, "Invalid type"
+    return limit, int(cursor), itemType, None
+
+
+def stream_order(receipt, body):
+    """
+    Writes an order as JSON a piece at a time, so the whole receipt is never
+    in memory at once.
+
+    Args:
+        receipt (generator): receipt entries for each item.
+        body (dict): the rest of the order (totals and item count).
+
+    Yields:
+        str: pieces of the JSON document.
+    """
+    yield '{"items": ['
+    for i, line in enumerate(receipt):
+        yield (", " if i else "") + json.dumps(line)
+    yield "], " + json.dumps(body)[1:]
+
+
+@app.route('/order', methods=['GET'], defaults={"order_id": DEFAULT_ORDER_ID})
+@app.route('/orders/<order_id>', methods=['GET'])
+def get_order(order_id):
+    """
+    Gets the current order, including receipt and totals.
+
+    Answers 304 Not Modified without building anything if the client
+    already has the current version of the order (If-None-Match). When the
+    receipt cache is on, an unchanged order is answered with the bytes
+    encoded the last time.
+
+    Returns:
+        dict: receipt, totals, and the number of items in the order.
+    """
+    stream = request.args.get("stream", "").lower() in ("1", "true")
+    paged = any(arg in request.args for arg in ("limit", "cursor", "type"))
+    if paged:
+        limit, cursor, itemType, error = read_page_args(request.args)
+        if error:
+            return jsonify({"error": error}), 400
+
+    cached = None
+    cacheKey = None
+    with store.checkout(order_id, write=False) as order:
+        if order is None:
+            return order_not_found()
+        etag = order.get_etag()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        if receiptCache.maxBytes and not (stream and not paged):
+            cacheKey = (order._token, request.query_string)
+            cached = receiptCache.get(cacheKey, etag)
+        if cached is None:
+            body = {}
+            if paged:
+                receipt, body["next_cursor"] = order.get_receipt_page(limit, cursor, itemType)
+            elif stream:
+                receipt = order.iter_receipt()
+            else:
+                receipt = order.get_receipt()
+            body["totals"] = order.get_total_after_tax()
+            body["subtotals"] = order.get_subtotals()
+            body["num_items"] = len(order)
+    if cached is not None:
+        response = Response(cached, mimetype="application/json")
+    elif stream and not paged:
+        response = Response(stream_order(receipt, body), mimetype="application/json")
+    else:
+        body["items"] = receipt
+        response = jsonify(body)
+        if cacheKey:
+            receiptCache.put(cacheKey, etag, response.get_data())
+    response.set_etag(etag)
+    return response
+
+
+@app.route('/order', methods=['POST'], defaults={"order_id": DEFAULT_ORDER_ID})
+@app.route('/orders/<order_id>', methods=['POST'])
+@idempotent
+def add_drink(order_id):
+    """
+    Adds a new drink to the order.
+
+    Returns:
+        dict: success or error message depending on if input is valid.
+    """
+    drink, errors = drinkType.validate(request.json)
+    if errors:
+        return jsonify(drinkType.error_body(request.json, errors)), 400
+
+    with store.checkout(order_id) as order:
+        if order is None:
+            return order_not_found()
+        order.add_item(drink)
+    return jsonify({"message": "Drink added successfully."}), 201
 
-    food = Food(foodType)
-    typeError = food.set_type(foodType)
-    if typeError:
-        return jsonify({"error": typeError}), 400
 
-    for topping in data.get("toppings", []):
-        toppingError = food.add_topping(topping)
-        if toppingError:
-            return jsonify({"error": toppingError}), 400
+@app.route('/order/food', methods=['POST'], defaults={"order_id": DEFAULT_ORDER_ID})
+@app.route('/orders/<order_id>/food', methods=['POST'])
+@idempotent
+def add_food(order_id):
+    """
+    Adds a new food to the order.
 
-    order.add_item(food)
+    Returns:
+        dict: success or error message depending on if the input is valid.
+    """
+    food, errors = foodType.validate(request.json)
+    if errors:
+        return jsonify(foodType.error_body(request.json, errors)), 400
+
+    with store.checkout(order_id) as order:
+        if order is None:
+            return order_not_found()
+        order.add_item(food)
     return jsonify({"message": "Food added successfully."}), 201
 
 # Module 4 stuff
-@app.route('/order/ice-storm', methods=['POST'])
-def add_iceStorm():
+@app.route('/order/ice-storm', methods=['POST'], defaults={"order_id": DEFAULT_ORDER_ID})
+@app.route('/orders/<order_id>/ice-storm', methods=['POST'])
+@idempotent
+def add_iceStorm(order_id):
     """
     Adds a new Ice Storm to the order.
 
     Returns:
         dict: success or error message depending on if the input is valid.
     """
-    data = request.json
-    flavor = data.get("flavor")
-    if not flavor:
-        return jsonify({"error": "Flavor is required"}), 400
+    iceStorm, errors = iceStormType.validate(request.json)
+    if errors:
+        return jsonify(iceStormType.error_body(request.json, errors)), 400
+
+    with store.checkout(order_id) as order:
+        if order is None:
+            return order_not_found()
+        order.add_item(iceStorm)
+    return jsonify({"message": "Ice Storm added successfully."}), 201
+
+@app.route('/order/items/<int:item_id>', methods=['DELETE'], defaults={"order_id": DEFAULT_ORDER_ID})
+@app.route('/orders/<order_id>/items/<int:item_id>', methods=['DELETE'])
+def remove_item_by_id(order_id, item_id):
+    """
+    Removes an item from the order with the item id in the URL.
 
-    iceStorm = IceStorm(flavor)
-    flavorError = iceStorm.set_flavor(flavor)
-    if flavorError:
-        return jsonify({"error": flavorError}), 400
+    Unlike the index, an item's id doesn't change when other items are
+    removed.
 
-    for mix_in in data.get("mix_ins", []):
-        mixInError = iceStorm.add_mix_in(mix_in)
-        if mixInError:
-            return jsonify({"error": mixInError}), 400
+    Returns:
+        dict: success or an error message.
+    """
+    with store.checkout(order_id) as order:
+        if order is None:
+            return order_not_found()
+        error = order.remove_item_by_id(item_id)
+    if error:
+        return jsonify({"error": error}), 400
+    return jsonify({"message": "Item removed successfully."}), 200
 
-    order.add_item(iceStorm)
-    return jsonify({"message": "Ice Storm added successfully."}), 201
+
+@app.route('/order/items', methods=['DELETE'], defaults={"order_id": DEFAULT_ORDER_ID})
+@app.route('/orders/<order_id>/items', methods=['DELETE'])
+def remove_items(order_id):
+    """
+    Removes several items from the order at once, either a list of indexes
+    or every item of one type.
+
+    The indexes all refer to the order before anything is removed, so they
+    can be given in any order.
+
+    Returns:
+        dict: number of items removed, the new number of items, and totals.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    indexes = data.get("indexes")
+    itemType = data.get("type")
+    if (indexes is None) == (itemType is None):
+        return jsonify({"error": "Either indexes or type is required"}), 400
+    if indexes is not None and not isinstance(indexes, list):
+        return jsonify({"error": "Invalid index"}), 400
+    if itemType is not None and not isinstance(itemType, str):
+        return jsonify({"error": "Invalid type"}), 400
+
+    with store.checkout(order_id) as order:
+        if order is None:
+            return order_not_found()
+        numBefore = len(order)
+        error = order.remove_items(indexes, itemType)
+        if error:
+            return jsonify({"error": error}), 400
+        numItems = len(order)
+        totals = order.get_total_after_tax()
+    return jsonify({
+        "message": "Items removed successfully.",
+        "num_removed": numBefore - numItems,
+        "num_items": numItems,
+        "totals": totals
+    }), 200
+
+
+@app.route('/order/batch', methods=['POST'], defaults={"order_id": DEFAULT_ORDER_ID})
+@app.route('/orders/<order_id>/batch', methods=['POST'])
+@idempotent
+def add_batch(order_id):
+    """
+    Adds a list of drinks, foods, and Ice Storms to the order in one go.
+
+    Every item is checked first, and nothing is added unless all of them
+    are valid.
+
+    Returns:
+        dict: number of items added, or the errors for each bad item.
+    """
+    data = request.json
+    payloads = data.get("items") if isinstance(data, dict) else None
+    if not isinstance(payloads, list) or not payloads:
+        return jsonify({"error": "Items are required"}), 400
+
+    items, errors = build_items(payloads)
+    if errors:
+        return jsonify({"errors": errors}), 400
+
+    with store.checkout(order_id) as order:
+        if order is None:
+            return order_not_found()
+        order.add_items(items)
+        numItems = len(order)
+    return jsonify({
+        "message": "Items added successfully.",
+        "num_added": len(items),
+        "num_items": numItems
+    }), 201
 
 # Module 1 stuff
-@app.route('/order/<int:index>', methods=['DELETE'])
-def remove_item(index):
+@app.route('/order/<int:index>', methods=['DELETE'], defaults={"order_id": DEFAULT_ORDER_ID})
+@app.route('/orders/<order_id>/<int:index>', methods=['DELETE'])
+def remove_item(order_id, index):
     """
     Removes an item from the order with index in the URL.
 
     Returns:
         dict: success or an error message.
     """
-    error = order.remove_item(index)
+    with store.checkout(order_id) as order:
+        if order is None:
+            return order_not_found()
+        error = order.remove_item(index)
     if error:
         return jsonify({"error": error}), 400
     return jsonify({"message": "Item removed successfully."}), 200
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
@@ -0,0 +1,335 @@
+# Production server for the Flask app: one master process that pre-forks
+# worker processes which all accept from one shared listening socket.
+#
+# The catalog and app are loaded and warmed once in the master, then
+# gc.freeze() moves them out of the garbage collector's view so the workers
+# share those memory pages copy-on-write instead of each touching (and so
+# copying) them.
+#
+# Each worker has its own order store, nothing is shared between workers.
+# With the default in-memory store that means only one worker, and it's
+# never restarted (no --max-requests, and SIGHUP only reloads the menu in
+# the master), since a new worker would start with no orders. The
+# write-ahead log (CINOS_WAL_PATH) lets a worker be restarted, but still
+# only works with one worker, since a log file can only have one writer. With the log on, the
+# master closes it before forking and each new worker rebuilds its store
+# from the log (and snapshot) and opens the log itself, and on SIGHUP the
+# old worker is stopped before the new one starts. To share orders between
+# workers, use the SQLite store with --db instead.
+#
+# The menu is the same: POST /admin/menu/reload only reloads the worker that
+# gets it. SIGHUP reloads the menu file (CINOS_MENU_PATH) in the master before
+# the new workers are forked, and with CINOS_MENU_WATCH_SECONDS set every
+# worker watches the file itself.
+#
+# Signals to the master:
+#   SIGHUP          reload the menu file, start a new set of workers, then gracefully stop the old ones
+#                   (only with --db or CINOS_WAL_PATH, so no orders are lost)
+#   SIGTERM/SIGINT  gracefully stop all workers and exit
+#
+# Command to run: python serve.py --port 5000
+# Command to run with orders in SQLite: python serve.py --workers 4 --db orders.db --max-requests 10000
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+from werkzeug.serving import make_server
+
+import main
+
+# Seconds a worker waits for a connection before checking if it should stop
+pollInterval = 0.5
+
+
+def make_socket(host, port, backlog=1024):
+    """
+    Makes the listening socket the workers share.
+
+    SO_REUSEPORT lets a new server bind the same port while this one is
+    still running, so the server itself can be replaced without downtime.
+
+    Args:
+        host (str): address to listen on.
+        port (int): port to listen on.
+        backlog (int): most connections waiting to be accepted.
+
+    Returns:
+        socket: the listening socket.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, "SO_REUSEPORT"):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def warm_up():
+    """
+    Loads everything the workers need before forking, then freezes it.
+    """
+    for kind in main.itemDefinitions.values():
+        main.catalog.price_table(kind)
+    main.app.test_client().get("/")
+    gc.collect()
+    gc.freeze()
+
+
+def run_worker(sock, host, port, maxRequests):
+    """
+    Serves requests in a worker process until told to stop or until it has
+    served maxRequests requests.
+
+    Args:
+        sock (socket): the shared listening socket.
+        host (str): address the socket listens on.
+        port (int): port the socket listens on.
+        maxRequests (int): requests to serve before exiting, 0 for no limit.
+    """
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    # The store the master loaded is from startup, so pick up where the last worker left off
+    if main.walPath:
+        main.store = main.open_store()
+
+    # Threads don't survive the fork, so each worker watches the menu itself
+    if main.menuPath and main.menuWatchSeconds > 0:
+        main.menuWatcher = main.MenuWatcher(main.menuPath, main.menuWatchSeconds).start()
+
+    server = make_server(host, port, main.app, fd=sock.fileno())
+    server.timeout = pollInterval
+    timedOut = False
+
+    def on_timeout():
+        nonlocal timedOut
+        timedOut = True
+
+    # handle_request calls handle_timeout instead when nothing came in
+    server.handle_timeout = on_timeout
+    served = 0
+    while not stopping and (not maxRequests or served < maxRequests):
+        timedOut = False
+        server.handle_request()
+        if not timedOut:
+            served += 1
+    if main.store.log is not None:
+        main.store.log.close()
+
+
+class Master:
+    """
+    Starts, watches, and replaces the worker processes.
+
+    Attributes:
+        sock (socket): the shared listening socket.
+        host (str): address the socket listens on.
+        port (int): port the socket listens on.
+        numWorkers (int): number of workers to keep running.
+        maxRequests (int): requests each worker serves before it's replaced.
+        workers (set): pids of the current workers.
+        retiring (set): pids of old workers that are stopping.
+        exclusive (bool): whether only one worker can run at a time, like
+            with the write-ahead log, so old ones stop before new ones start.
+        restartable (bool): whether workers can be replaced without losing
+            orders, SIGHUP doesn't restart them if not.
+        _reload (bool): set when a reload has been asked for.
+        _stop (bool): set when the server should shut down.
+    """
+
+    def __init__(self, sock, host, port, numWorkers, maxRequests, exclusive=False, restartable=True):
+        """
+        Initializes the master.
+
+        Args:
+            sock (socket): the shared listening socket.
+            host (str): address the socket listens on.
+            port (int): port the socket listens on.
+            numWorkers (int): number of workers to keep running.
+            maxRequests (int): requests each worker serves before it's replaced.
+            exclusive (bool): whether only one worker can run at a time.
+            restartable (bool): whether workers can be replaced without losing orders.
+        """
+        self.sock = sock
+        self.host = host
+        self.port = port
+        self.numWorkers = numWorkers
+        self.maxRequests = maxRequests
+        self.workers = set()
+        self.retiring = set()
+        self.exclusive = exclusive
+        self.restartable = restartable
+        self._reload = False
+        self._stop = False
+
+    def spawn(self):
+        """
+        Forks one new worker.
+        """
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.sock, self.host, self.port, self.maxRequests)
+            except Exception:
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers.add(pid)
+
+    def reap(self):
+        """
+        Collects workers that have exited, and replaces current ones.
+        """
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.retiring.discard(pid)
+            if pid in self.workers:
+                self.workers.discard(pid)
+                if not self._stop:
+                    self.spawn()
+
+    def reload(self):
+        """
+        Reloads the menu file if there is one, starts a full set of new
+        workers, then asks the old ones to stop once they finish the request
+        they're on. If the menu isn't valid, the new workers keep the old one.
+        When exclusive, the old workers are stopped first instead, and when
+        not restartable, the workers aren't replaced at all.
+        """
+        if not self.restartable:
+            print("Workers not restarted, their orders are only in memory. "
+                  "Use POST /admin/menu/reload to reload the menu.", file=sys.stderr)
+            return
+        if main.menuPath:
+            try:
+                main.reload_catalog()
+            except (OSError, ValueError) as error:
+                print(f"Menu not reloaded: {error}", file=sys.stderr)
+        old = self.workers
+        self.workers = set()
+        if self.exclusive:
+            for pid in old:
+                self.signal(pid, signal.SIGTERM)
+            for pid in old:
+                try:
+                    os.waitpid(pid, 0)
+                except ChildProcessError:
+                    pass
+            old = set()
+        for _ in range(self.numWorkers):
+            self.spawn()
+        for pid in old:
+            self.signal(pid, signal.SIGTERM)
+        self.retiring |= old
+
+    @staticmethod
+    def signal(pid, signum):
+        """
+        Sends a signal to a worker that might have already exited.
+
+        Args:
+            pid (int): pid of the worker.
+            signum (int): signal to send.
+        """
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def run(self):
+        """
+        Runs the master until it's told to stop.
+        """
+        signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, "_reload", True))
+        signal.signal(signal.SIGTERM, lambda signum, frame: setattr(self, "_stop", True))
+        signal.signal(signal.SIGINT, lambda signum, frame: setattr(self, "_stop", True))
+
+        for _ in range(self.numWorkers):
+            self.spawn()
+        while not self._stop:
+            if self._reload:
+                self._reload = False
+                self.reload()
+            self.reap()
+            time.sleep(0.1)
+
+        for pid in self.workers | self.retiring:
+            self.signal(pid, signal.SIGTERM)
+        for pid in self.workers | self.retiring:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+
+
+def serve(host="127.0.0.1", port=5000, numWorkers=None, maxRequests=0):
+    """
+    Runs the app with pre-forked worker processes.
+
+    Args:
+        host (str): address to listen on.
+        port (int): port to listen on.
+        numWorkers (int): number of workers, one per CPU with a shared store
+            (like --db) and one otherwise if not given.
+        maxRequests (int): requests each worker serves before it's replaced, 0 for no limit.
+
+    Raises:
+        ValueError: if the orders are only in memory and there's more than one
+            worker or workers get restarted, or the write-ahead log is on and
+            there's more than one worker.
+    """
+    shared = main.store.shared
+    log = main.store.log
+    numWorkers = numWorkers or ((os.cpu_count() or 1) if shared else 1)
+    if not shared and log is None:
+        if numWorkers > 1:
+            raise ValueError("Orders are only kept in each worker's memory, so more than one worker needs --db")
+        if maxRequests:
+            raise ValueError("Restarting the worker would lose its orders, so --max-requests needs --db or CINOS_WAL_PATH")
+    if log is not None and numWorkers > 1:
+        raise ValueError("The write-ahead log only works with one worker")
+    sock = make_socket(host, port)
+    warm_up()
+    if log is not None:
+        # Workers open the log themselves, the master never writes to it
+        log.close()
+    Master(sock, host, port, numWorkers, maxRequests, exclusive=log is not None, restartable=shared or log is not None).run()
+    sock.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the ordering API with pre-forked workers.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: one per CPU with --db, otherwise one)")
+    parser.add_argument("--max-requests", type=int, default=0, help="restart a worker after this many requests (default: never, needs --db or CINOS_WAL_PATH)")
+    parser.add_argument("--db", default=None, help="keep orders in this SQLite file, shared by every worker")
+    args = parser.parse_args()
+    try:
+        if args.db:
+            import sqlite_store
+            sqlite_store.use_sqlite(args.db)
+        serve(args.host, args.port, args.workers, args.max_requests)
+    except ValueError as error:
+        parser.error(str(error))
+    sys.exit(0)
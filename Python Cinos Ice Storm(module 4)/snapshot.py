@@ -0,0 +1,451 @@
+# Background snapshots of the order store, like Redis's BGSAVE.
+#
+# To save, the store is paused just long enough to note the log's LSN and
+# fork. The child writes every order out of its copy-on-write view of the
+# parent's memory while the parent goes straight back to serving requests,
+# so a full checkpoint never holds up the request path for longer than a
+# fork takes.
+#
+# The log is rotated at the same moment (only the rename happens while
+# paused, the fsyncs after), and once the snapshot is saved the log segments
+# every kept snapshot covers are deleted. At startup the newest snapshot that
+# isn't damaged is read through mmap, and then only the log records after its
+# LSN are replayed (see wal.py).
+#
+# File layout (all numbers little endian):
+#   header   magic (8 bytes), LSN (8 bytes), string count (4 bytes), order count (4 bytes)
+#   strings  each a 2 byte length and UTF-8 bytes, item fields refer to them by index
+#   orders   id (2 byte length and UTF-8), token (16 bytes), version (8 bytes),
+#            next item id (8 bytes), item count (4 bytes), then the items
+#   items    id (8 bytes), price in cents (8 bytes), type string (2 bytes), field count (1 byte), then
+#            each field's key string (2 bytes) and value: 0 for None, 1 and a
+#            string for a name, or 2, a count (1 byte), and strings for a list
+#   footer   crc32 of everything before it (4 bytes)
+
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+MAGIC = b"CINOSNP2"
+
+headerFormat = struct.Struct("<8sQII")
+orderFormat = struct.Struct("<16sQQI")
+itemFormat = struct.Struct("<QQHB")
+fieldFormat = struct.Struct("<HB")
+countFormat = struct.Struct("<B")
+lengthFormat = struct.Struct("<H")
+footerFormat = struct.Struct("<I")
+
+# Kinds of field values
+NONE_VALUE = 0
+NAME_VALUE = 1
+LIST_VALUE = 2
+
+
+def snapshot_name(lsn):
+    """
+    Makes the file name for a snapshot, so names sort oldest to newest.
+
+    Args:
+        lsn (int): LSN of the last log record the snapshot has.
+
+    Returns:
+        str: file name.
+    """
+    return f"snapshot-{lsn:020d}-{time.time_ns():020d}.snap"
+
+
+def list_snapshots(folder):
+    """
+    Finds the snapshots in a folder.
+
+    Args:
+        folder (str): folder with the snapshots.
+
+    Returns:
+        list: paths of the snapshots, oldest first.
+    """
+    if not os.path.isdir(folder):
+        return []
+    names = sorted(name for name in os.listdir(folder) if name.startswith("snapshot-") and name.endswith(".snap"))
+    return [os.path.join(folder, name) for name in names]
+
+
+def latest_snapshot(folder):
+    """
+    Finds the newest snapshot in a folder.
+
+    Args:
+        folder (str): folder with the snapshots.
+
+    Returns:
+        str: path of the snapshot, or None if there isn't one.
+    """
+    paths = list_snapshots(folder)
+    return paths[-1] if paths else None
+
+
+def encode_snapshot(lsn, orders):
+    """
+    Makes the bytes of a snapshot.
+
+    Args:
+        lsn (int): LSN of the last log record the orders have.
+        orders (list): orders in the form OrderStore.dump gives.
+
+    Returns:
+        bytearray: the snapshot.
+    """
+    strings = {}
+
+    def ref(name):
+        if name not in strings:
+            strings[name] = len(strings)
+        return strings[name]
+
+    body = bytearray()
+    for order_id, token, version, nextId, items in orders:
+        encodedId = order_id.encode()
+        body += lengthFormat.pack(len(encodedId)) + encodedId
+        body += orderFormat.pack(token.encode(), version, nextId, len(items))
+        for itemId, itemType, price, fields in items:
+            body += itemFormat.pack(itemId, price, ref(itemType), len(fields))
+            for key, value in fields.items():
+                if value is None:
+                    body += fieldFormat.pack(ref(key), NONE_VALUE)
+                elif isinstance(value, str):
+                    body += fieldFormat.pack(ref(key), NAME_VALUE) + lengthFormat.pack(ref(value))
+                else:
+                    body += fieldFormat.pack(ref(key), LIST_VALUE) + countFormat.pack(len(value))
+                    body += b"".join(lengthFormat.pack(ref(name)) for name in value)
+
+    data = bytearray(headerFormat.pack(MAGIC, lsn, len(strings), len(orders)))
+    for name in strings:
+        encoded = name.encode()
+        data += lengthFormat.pack(len(encoded)) + encoded
+    data += body
+    data += footerFormat.pack(zlib.crc32(data))
+    return data
+
+
+def write_snapshot(folder, lsn, orders):
+    """
+    Writes a snapshot to a temporary file and then renames it into place,
+    so a half written snapshot is never mistaken for a finished one.
+
+    Args:
+        folder (str): folder to write it in.
+        lsn (int): LSN of the last log record the orders have.
+        orders (list): orders in the form OrderStore.dump gives.
+
+    Returns:
+        str: path of the snapshot.
+    """
+    path = os.path.join(folder, snapshot_name(lsn))
+    temp = path + ".tmp"
+    data = encode_snapshot(lsn, orders)
+    fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.rename(temp, path)
+    folderFd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(folderFd)
+    finally:
+        os.close(folderFd)
+    return path
+
+
+def snapshot_lsn(path):
+    """
+    Reads the LSN of a snapshot from its file name.
+
+    Args:
+        path (str): path of the snapshot.
+
+    Returns:
+        int: LSN of the last log record the snapshot has.
+    """
+    return int(os.path.basename(path).split("-")[1])
+
+
+class SnapshotReader:
+    """
+    Reads a snapshot through mmap, one order at a time.
+
+    Attributes:
+        path (str): path of the snapshot.
+        lsn (int): LSN of the last log record the snapshot has.
+        numOrders (int): number of orders in the snapshot.
+        _file (file): the open snapshot file.
+        _map (mmap): the file's bytes.
+        _strings (list): the string table.
+        _offset (int): where the orders start.
+    """
+
+    def __init__(self, path):
+        """
+        Opens a snapshot and checks it.
+
+        Args:
+            path (str): path of the snapshot.
+
+        Raises:
+            ValueError: if the file isn't a whole snapshot.
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError("Snapshot is empty")
+        size = len(self._map)
+        view = memoryview(self._map)
+        try:
+            valid = (
+                size >= headerFormat.size + footerFormat.size
+                and self._map[:len(MAGIC)] == MAGIC
+                and footerFormat.unpack_from(self._map, size - footerFormat.size)[0] == zlib.crc32(view[:size - footerFormat.size])
+            )
+        finally:
+            view.release()
+        if not valid:
+            self.close()
+            raise ValueError("Snapshot is damaged")
+
+        _, self.lsn, numStrings, self.numOrders = headerFormat.unpack_from(self._map, 0)
+        offset = headerFormat.size
+        self._strings = []
+        for _ in range(numStrings):
+            length, = lengthFormat.unpack_from(self._map, offset)
+            offset += lengthFormat.size
+            self._strings.append(self._map[offset:offset + length].decode())
+            offset += length
+        self._offset = offset
+
+    def __iter__(self):
+        """
+        Reads the orders.
+
+        Yields:
+            tuple: orders in the form OrderStore.dump gives.
+        """
+        data = self._map
+        strings = self._strings
+        offset = self._offset
+        for _ in range(self.numOrders):
+            length, = lengthFormat.unpack_from(data, offset)
+            offset += lengthFormat.size
+            order_id = data[offset:offset + length].decode()
+            offset += length
+            token, version, nextId, numItems = orderFormat.unpack_from(data, offset)
+            offset += orderFormat.size
+            items = []
+            for _ in range(numItems):
+                itemId, price, typeRef, numFields = itemFormat.unpack_from(data, offset)
+                offset += itemFormat.size
+                fields = {}
+                for _ in range(numFields):
+                    keyRef, kind = fieldFormat.unpack_from(data, offset)
+                    offset += fieldFormat.size
+                    if kind == NAME_VALUE:
+                        fields[strings[keyRef]] = strings[lengthFormat.unpack_from(data, offset)[0]]
+                        offset += lengthFormat.size
+                    elif kind == LIST_VALUE:
+                        count, = countFormat.unpack_from(data, offset)
+                        offset += countFormat.size
+                        refs = struct.unpack_from(f"<{count}H", data, offset)
+                        offset += 2 * count
+                        fields[strings[keyRef]] = [strings[i] for i in refs]
+                    else:
+                        fields[strings[keyRef]] = None
+                items.append((itemId, strings[typeRef], price, fields))
+            yield order_id, token.decode(), version, nextId, items
+
+    def close(self):
+        """
+        Closes the snapshot.
+        """
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        """
+        Returns the reader for use in a with block.
+
+        Returns:
+            SnapshotReader: this reader.
+        """
+        return self
+
+    def __exit__(self, *exc):
+        """
+        Closes the snapshot at the end of a with block.
+        """
+        self.close()
+
+
+class BackgroundSaver:
+    """
+    Saves snapshots of an order store from a forked child process.
+
+    Attributes:
+        folder (str): folder the snapshots go in.
+        keep (int): number of snapshots to keep, older ones are deleted.
+        lastSavedLsn (int): LSN of the last snapshot that finished, None if none has.
+        lastError (str): why the last save failed, None if it didn't.
+        _pid (int): pid of the child that's saving, None if none is.
+        _reaper (Thread): thread waiting for the child.
+        _lock (Lock): guards _pid.
+    """
+
+    def __init__(self, folder, keep=2):
+        """
+        Initializes the saver, making the folder if it isn't there.
+
+        Args:
+            folder (str): folder the snapshots go in.
+            keep (int): number of snapshots to keep.
+        """
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.keep = keep
+        self.lastSavedLsn = None
+        self.lastError = None
+        self._pid = None
+        self._reaper = None
+        self._lock = threading.Lock()
+
+    def start(self, store):
+        """
+        Starts saving a snapshot in the background.
+
+        The store is paused only while the log's file is swapped (which
+        gives the LSN) and the process forks. The swapped out file is
+        written and synced after the pause.
+        The child only reads its copy of the store and writes with plain os
+        calls, since locks other threads held at the fork stay locked in it.
+
+        Args:
+            store (OrderStore): store to save.
+
+        Returns:
+            int: pid of the child, or None if a save is already running.
+        """
+        with self._lock:
+            if self._pid is not None:
+                return None
+            log = store.log
+            rotating = False
+            try:
+                with store.pause():
+                    lsn = 0
+                    if log is not None:
+                        try:
+                            lsn = log.begin_rotate()
+                            rotating = True
+                        except OSError:
+                            # Still save, the segments just aren't dropped this time
+                            lsn = log.last_lsn()
+                    pid = os.fork()
+                    if pid == 0:
+                        code = 1
+                        try:
+                            write_snapshot(self.folder, lsn, list(store.dump()))
+                            code = 0
+                        finally:
+                            os._exit(code)
+            finally:
+                if rotating:
+                    try:
+                        log.finish_rotate()
+                    except OSError:
+                        # The log is marked failed, so changes get refused from now on
+                        pass
+            self._pid = pid
+            self._reaper = threading.Thread(target=self._reap, args=(pid, lsn, log), daemon=True)
+            self._reaper.start()
+        return pid
+
+    def _reap(self, pid, lsn, log):
+        """
+        Waits for a child to finish, then deletes the old snapshots and the
+        log segments every kept snapshot covers, so load_store can still
+        fall back to the oldest kept one.
+
+        Args:
+            pid (int): pid of the child.
+            lsn (int): LSN the child is saving.
+            log (WriteAheadLog): the store's log, None if it doesn't have one.
+        """
+        _, status = os.waitpid(pid, 0)
+        code = os.waitstatus_to_exitcode(status)
+        if code == 0:
+            self.lastSavedLsn = lsn
+            self.lastError = None
+            paths = list_snapshots(self.folder)
+            for path in paths[:-self.keep]:
+                os.remove(path)
+            if log is not None:
+                log.drop_segments(min(snapshot_lsn(path) for path in paths[-self.keep:]))
+        else:
+            self.lastError = f"Snapshot process exited with {code}"
+        with self._lock:
+            self._pid = None
+
+    def is_saving(self):
+        """
+        Returns whether a save is running.
+
+        Returns:
+            bool: True if a child is saving.
+        """
+        with self._lock:
+            return self._pid is not None
+
+    def wait(self):
+        """
+        Blocks until the running save (if any) is done.
+        """
+        reaper = self._reaper
+        if reaper is not None:
+            reaper.join()
+
+
+def load_store(store, folder):
+    """
+    Loads the newest snapshot in a folder into a store, or the newest one
+    before it that isn't damaged.
+
+    Args:
+        store (OrderStore): store to load into.
+        folder (str): folder with the snapshots.
+
+    Returns:
+        int: LSN of the snapshot, 0 if there wasn't one.
+
+    Raises:
+        ValueError: if there are snapshots but all of them are damaged,
+            since the log before them may already be deleted.
+    """
+    paths = list_snapshots(folder)
+    for path in reversed(paths):
+        try:
+            reader = SnapshotReader(path)
+        except ValueError:
+            continue
+        with reader:
+            store.restore(reader)
+            return reader.lsn
+    if paths:
+        raise ValueError(f"Every snapshot in {folder} is damaged")
+    return 0
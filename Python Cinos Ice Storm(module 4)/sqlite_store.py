@@ -0,0 +1,688 @@
+# SQLite backend for the order store, for keeping orders on a single box.
+#
+# SqliteStore has the same methods the routes use on main.OrderStore, and
+# its checkout gives a SqliteOrder with the same methods the routes use on
+# main.Order, so the app runs on it unchanged once it's swapped in for
+# main.store. Since everything is in the database file, the pre-fork
+# server's workers can all share one.
+#
+# Connections come from a small pool in each process, in WAL journal mode
+# so readers don't block the writer. A connection is only lent out for one
+# statement or checkout, so a server that starts a thread per request
+# reuses a handful of them instead of opening one per thread. The SQL is kept in constants so
+# sqlite3's statement cache reuses the prepared statements, and adding
+# several items is one executemany instead of one insert per item.
+#
+# Idempotency-Key responses are kept in the database too, since a retry can
+# reach any worker. The key is claimed in the same transaction as the
+# request's changes, so the changes are never made twice.
+#
+# Command to run it: python sqlite_store.py orders.db
+# Command to compare it with the in-memory store: python benchmarks/bench_sqlite.py
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import main
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id TEXT PRIMARY KEY,
+    token TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    next_item_id INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS items (
+    order_id TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    price INTEGER NOT NULL,
+    fields TEXT NOT NULL,
+    PRIMARY KEY (order_id, item_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS items_by_type ON items (order_id, type, item_id);
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    fingerprint BLOB NOT NULL,
+    expires REAL NOT NULL,
+    status INTEGER,
+    body BLOB
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idempotency_keys_by_expiry ON idempotency_keys (expires);
+"""
+
+INSERT_ORDER = "INSERT OR IGNORE INTO orders (id, token) VALUES (?, ?)"
+SELECT_ORDER = "SELECT token, version, next_item_id FROM orders WHERE id = ?"
+UPDATE_ORDER = "UPDATE orders SET version = ?, next_item_id = ? WHERE id = ?"
+DELETE_ORDER = "DELETE FROM orders WHERE id = ?"
+COUNT_ORDERS = "SELECT COUNT(*) FROM orders"
+
+INSERT_ITEM = "INSERT INTO items (order_id, item_id, type, price, fields) VALUES (?, ?, ?, ?, ?)"
+DELETE_ITEM = "DELETE FROM items WHERE order_id = ? AND item_id = ?"
+DELETE_ITEMS_OF_TYPE = "DELETE FROM items WHERE order_id = ? AND type = ?"
+DELETE_ORDER_ITEMS = "DELETE FROM items WHERE order_id = ?"
+COUNT_ITEMS = "SELECT COUNT(*) FROM items WHERE order_id = ?"
+COUNT_ITEMS_BEFORE = "SELECT COUNT(*) FROM items WHERE order_id = ? AND item_id < ?"
+SELECT_ITEM_IDS = "SELECT item_id FROM items WHERE order_id = ? ORDER BY item_id"
+SELECT_ITEM_AT = "SELECT item_id FROM items WHERE order_id = ? ORDER BY item_id LIMIT 1 OFFSET ?"
+SELECT_ITEMS = "SELECT item_id, type, price, fields FROM items WHERE order_id = ? ORDER BY item_id"
+SELECT_PAGE = (
+    "SELECT item_id, type, price, fields FROM items"
+    " WHERE order_id = ? AND item_id >= ? ORDER BY item_id LIMIT ?"
+)
+# Filtered pages still need each item's index in the whole order
+SELECT_TYPE_PAGE = (
+    "SELECT item_id, type, price, fields, i FROM ("
+    "SELECT item_id, type, price, fields, ROW_NUMBER() OVER (ORDER BY item_id) - 1 AS i"
+    " FROM items WHERE order_id = ?)"
+    " WHERE item_id >= ? AND type = ? ORDER BY item_id LIMIT ?"
+)
+SUM_BY_TYPE = "SELECT type, SUM(price) FROM items WHERE order_id = ? GROUP BY type"
+
+INSERT_KEY = "INSERT OR IGNORE INTO idempotency_keys (key, fingerprint, expires, status, body) VALUES (?, ?, ?, ?, ?)"
+SELECT_KEY = "SELECT fingerprint, status, body FROM idempotency_keys WHERE key = ? AND expires > ?"
+SAVE_RESPONSE = "UPDATE idempotency_keys SET status = ?, body = ? WHERE key = ?"
+DELETE_EXPIRED_KEYS = "DELETE FROM idempotency_keys WHERE expires <= ?"
+
+# Idempotency-Key the request running in this thread or task can claim in
+# its next write checkout, as [key, fingerprint, expiry time, claimed yet]
+pendingClaim = ContextVar("pendingClaim", default=None)
+
+
+class KeyTaken(Exception):
+    """
+    Raised by a checkout when another request claimed its Idempotency-Key
+    first, after rolling back.
+    """
+
+
+def receipt_line(i, itemId, itemType, price, fields):
+    """
+    Makes the receipt entry for one item row, like Order._receipt_line.
+
+    Args:
+        i (int): index of the item in the order.
+        itemId (int): id of the item in the order.
+        itemType (str): type tag of the item.
+        price (int): price of the item in cents.
+        fields (str): the item's receipt fields as JSON.
+
+    Returns:
+        dict: information for the item.
+    """
+    line = json.loads(fields)
+    line["index"] = i
+    line["id"] = itemId
+    line["type"] = itemType
+    line["total"] = main.to_dollars(price)
+    return line
+
+
+class SqliteOrder:
+    """
+    An order kept in SQLite, with the same methods as main.Order.
+
+    It's only good inside the checkout that made it, since every method
+    runs in that checkout's transaction.
+
+    Attributes:
+        _conn (Connection): connection of the checkout.
+        _orderId (str): id of the order.
+        _token (str): random id for the order, used in ETags.
+        _version (int): goes up by one every time the order changes.
+        _nextId (int): id the next added item gets.
+        _changed (bool): whether the order row needs to be written back.
+    """
+
+    def __init__(self, conn, order_id, token, version, nextId):
+        """
+        Initializes the order from its row.
+
+        Args:
+            conn (Connection): connection of the checkout.
+            order_id (str): id of the order.
+            token (str): the order's token.
+            version (int): the order's version.
+            nextId (int): id the next added item gets.
+        """
+        self._conn = conn
+        self._orderId = order_id
+        self._token = token
+        self._version = version
+        self._nextId = nextId
+        self._changed = False
+
+    def __len__(self):
+        """
+        Returns the number of items in the order.
+
+        Returns:
+            int: number of items.
+        """
+        return self._conn.execute(COUNT_ITEMS, (self._orderId,)).fetchone()[0]
+
+    def add_item(self, item):
+        """
+        Adds an item to the order.
+
+        Args:
+            item: item to add.
+
+        Returns:
+            int: id of the item in the order.
+        """
+        return self.add_items([item])[0]
+
+    def add_items(self, items):
+        """
+        Adds several items to the order in one batched insert.
+
+        Args:
+            items (list): items to add.
+
+        Returns:
+            list: ids of the items in the order.
+        """
+        ids = list(range(self._nextId, self._nextId + len(items)))
+        self._conn.executemany(INSERT_ITEM, [
+            (self._orderId, itemId, item.itemType, item.get_total_cents(), json.dumps(item.to_receipt()))
+            for itemId, item in zip(ids, items)
+        ])
+        self._nextId += len(items)
+        self._version += len(items)
+        self._changed = True
+        return ids
+
+    def remove_item(self, index):
+        """
+        Removes an item from the order using the list index.
+
+        Args:
+            index (int): item to remove based on index.
+
+        Returns:
+            str: "Invalid index" if the number isn't in the correct range.
+        """
+        row = self._conn.execute(SELECT_ITEM_AT, (self._orderId, index)).fetchone() if index >= 0 else None
+        if row is None:
+            return "Invalid index"
+        self.remove_item_by_id(row[0])
+
+    def remove_item_by_id(self, itemId):
+        """
+        Removes an item from the order using its id.
+
+        Args:
+            itemId (int): id of the item to remove.
+
+        Returns:
+            str: "Invalid item id" if there's no item with that id.
+        """
+        if self._conn.execute(DELETE_ITEM, (self._orderId, itemId)).rowcount == 0:
+            return "Invalid item id"
+        self._version += 1
+        self._changed = True
+
+    def remove_items(self, indexes=None, itemType=None):
+        """
+        Removes several items from the order at once.
+
+        Every index is checked against the order as it is before anything
+        is removed, then all of the items are deleted together.
+
+        Args:
+            indexes (list): list indexes of the items to remove.
+            itemType (str): remove every item of this type instead.
+
+        Returns:
+            str: "Invalid index" or "Invalid type" if nothing was removed because of bad input.
+        """
+        if itemType is not None:
+            if itemType not in main.itemDefinitions:
+                return "Invalid type"
+            removed = self._conn.execute(DELETE_ITEMS_OF_TYPE, (self._orderId, itemType)).rowcount
+        else:
+            ids = [row[0] for row in self._conn.execute(SELECT_ITEM_IDS, (self._orderId,))]
+            chosen = set()
+            for index in indexes:
+                if type(index) is not int or index < 0 or index >= len(ids):
+                    return "Invalid index"
+                chosen.add(ids[index])
+            self._conn.executemany(DELETE_ITEM, [(self._orderId, itemId) for itemId in chosen])
+            removed = len(chosen)
+        if removed:
+            self._version += 1
+            self._changed = True
+
+    def get_items(self):
+        """
+        Returns the items in the order, rebuilt from their receipt fields.
+
+        Returns:
+            list: the items, in the order they were added.
+        """
+        items = []
+        for _, itemType, _, fields in self._conn.execute(SELECT_ITEMS, (self._orderId,)):
+            kind = main.itemDefinitions.get(itemType)
+            if kind is not None:
+                items.append(kind.restore(json.loads(fields)))
+        return items
+
+    def get_receipt(self):
+        """
+        Makes a receipt for the order.
+
+        Returns:
+            list: information for each item in the order.
+        """
+        return [
+            receipt_line(i, *row)
+            for i, row in enumerate(self._conn.execute(SELECT_ITEMS, (self._orderId,)))
+        ]
+
+    def get_receipt_page(self, limit=None, cursor=0, itemType=None):
+        """
+        Makes part of the receipt, optionally only for one item type.
+
+        Args:
+            limit (int): most items to return, or None for all of them.
+            cursor (int): id of the item to start from.
+            itemType (str): only return items of this type, or None for all.
+
+        Returns:
+            tuple: information for each item on the page, and the cursor for
+                the next page (None if this is the last page).
+        """
+        # One extra row says whether there's another page
+        fetch = -1 if limit is None else limit + 1
+        if itemType is None:
+            start = self._conn.execute(COUNT_ITEMS_BEFORE, (self._orderId, cursor)).fetchone()[0]
+            rows = self._conn.execute(SELECT_PAGE, (self._orderId, cursor, fetch)).fetchall()
+            rows = [(start + j,) + tuple(row) for j, row in enumerate(rows)]
+        else:
+            rows = self._conn.execute(SELECT_TYPE_PAGE, (self._orderId, cursor, itemType, fetch)).fetchall()
+            rows = [(row[4],) + tuple(row[:4]) for row in rows]
+        nextCursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            nextCursor = rows[-1][1] + 1 if rows else cursor
+        return [receipt_line(*row) for row in rows], nextCursor
+
+    def iter_receipt(self):
+        """
+        Makes the receipt one item at a time.
+
+        The rows are read when this is called, so the entries can be used
+        after the checkout's transaction has ended.
+
+        Returns:
+            iterator: information for each item in the order.
+        """
+        return iter(self.get_receipt())
+
+    def get_version(self):
+        """
+        Returns the version of the order, which goes up on every change.
+
+        Returns:
+            int: version of the order.
+        """
+        return self._version
+
+    def get_etag(self):
+        """
+        Returns a strong ETag for the current contents of the order and the
+        current catalog.
+
+        Returns:
+            str: ETag, without quotes.
+        """
+        return f"{self._token}-{self._version}-{main.catalog.generation}"
+
+    def _subtotal_cents(self):
+        """
+        Adds up the item prices for each item type.
+
+        Returns:
+            dict: item type mapped to its total cost in cents.
+        """
+        subtotals = dict.fromkeys(main.itemDefinitions, 0)
+        subtotals.update(self._conn.execute(SUM_BY_TYPE, (self._orderId,)))
+        return subtotals
+
+    def get_total(self):
+        """
+        Returns the total cost of the order before tax.
+
+        Returns:
+            float: total cost of the order.
+        """
+        return main.to_dollars(sum(self._subtotal_cents().values()))
+
+    def get_subtotals(self):
+        """
+        Returns the total cost of each item type in the order before tax.
+
+        Returns:
+            dict: item type mapped to its total cost.
+        """
+        return {itemType: main.to_dollars(subtotal) for itemType, subtotal in self._subtotal_cents().items()}
+
+    def get_total_after_tax(self):
+        """
+        Calculates total cost after tax.
+
+        Returns:
+            dict: contains the subtotal, tax, and total after tax.
+        """
+        subtotal = sum(self._subtotal_cents().values())
+        tax = main.calculate_tax(subtotal)
+        return {
+            "subtotal": main.to_dollars(subtotal),
+            "tax": main.to_dollars(tax),
+            "total_after_tax": main.to_dollars(subtotal + tax)
+        }
+
+
+class SqliteStore:
+    """
+    Holds every open order in a SQLite database file.
+
+    Attributes:
+        path (str): path of the database file.
+        timeout (float): seconds to wait for another writer before giving up.
+        log (None): always None, SQLite keeps its own journal.
+        shared (bool): always True, every process using the file sees the same orders.
+        idempotency (SqliteIdempotencyCache): Idempotency-Key responses, kept in the file.
+        maxIdle (int): most connections kept open while nothing is using them.
+        _idle (list): connections waiting to be lent out.
+        _inherited (list): idle connections from before a fork, kept so
+            they're never closed (or checkpointed) from the child.
+        _pid (int): process the idle connections were made in.
+        _lock (Lock): guards _idle and _pid.
+    """
+
+    log = None
+    shared = True
+    maxIdle = 8
+
+    def __init__(self, path, timeout=5.0):
+        """
+        Opens the database, making the tables if they aren't there.
+
+        Args:
+            path (str): path of the database file.
+            timeout (float): seconds to wait for another writer.
+        """
+        self.path = path
+        self.timeout = timeout
+        self._idle = []
+        self._inherited = []
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+        self.idempotency = SqliteIdempotencyCache(self, main.idempotencyCache.ttl)
+
+    @contextmanager
+    def _connection(self):
+        """
+        Lends out a connection for one statement or transaction, making one
+        if none are idle. It goes back in the pool afterwards, or is closed
+        if the pool is full or it's still in a transaction.
+
+        A connection made before a fork isn't used in the child, since
+        SQLite connections can't be shared between processes.
+
+        Yields:
+            Connection: the connection.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._inherited += self._idle
+                self._idle = []
+                self._pid = os.getpid()
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            # Transactions are started and ended by checkout, not by sqlite3
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                   check_same_thread=False, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        pid = os.getpid()
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                keep = self._pid == pid and len(self._idle) < self.maxIdle and not conn.in_transaction
+                if keep:
+                    self._idle.append(conn)
+            if not keep:
+                conn.close()
+
+    def create_order(self, order_id=None):
+        """
+        Creates a new empty order.
+
+        Args:
+            order_id (str): id to use, a random one is made if not given.
+
+        Returns:
+            str: id of the new order, or None if the id is already taken.
+        """
+        if order_id is None:
+            order_id = uuid.uuid4().hex
+        with self._connection() as conn:
+            created = conn.execute(INSERT_ORDER, (order_id, uuid.uuid4().hex[:16])).rowcount
+        return order_id if created else None
+
+    def delete_order(self, order_id):
+        """
+        Deletes an order and its items.
+
+        Args:
+            order_id (str): id of the order.
+
+        Returns:
+            bool: True if the order existed.
+        """
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(DELETE_ORDER_ITEMS, (order_id,))
+                existed = conn.execute(DELETE_ORDER, (order_id,)).rowcount > 0
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        return existed
+
+    @contextmanager
+    def checkout(self, order_id, write=True):
+        """
+        Runs the caller's reads and changes to an order in one transaction.
+
+        A checkout for writing takes the database's write lock right away, so
+        two writers never both read and then clash, and claims the request's
+        Idempotency-Key if it has one. One only for reading starts a deferred
+        transaction instead, which reads a WAL snapshot without taking the
+        lock, so reads don't wait on writers or each other.
+
+        Args:
+            order_id (str): id of the order.
+            write (bool): whether the caller might change the order.
+
+        Yields:
+            SqliteOrder: the order, or None if there is no order with that id.
+
+        Raises:
+            KeyTaken: if another request claimed the Idempotency-Key first.
+        """
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            try:
+                if write:
+                    self._claim_key(conn)
+                row = conn.execute(SELECT_ORDER, (order_id,)).fetchone()
+                order = SqliteOrder(conn, order_id, *row) if row else None
+                yield order
+                if order is not None and order._changed:
+                    conn.execute(UPDATE_ORDER, (order._version, order._nextId, order_id))
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _claim_key(self, conn):
+        """
+        Claims the Idempotency-Key of the request running this checkout, in
+        the checkout's transaction, if it has one it hasn't claimed yet.
+
+        Args:
+            conn (Connection): connection of the checkout.
+
+        Raises:
+            KeyTaken: if another request claimed the key first.
+        """
+        claim = pendingClaim.get()
+        if claim is None or claim[3]:
+            return
+        conn.execute(DELETE_EXPIRED_KEYS, (time.time(),))
+        if conn.execute(INSERT_KEY, (claim[0], claim[1], claim[2], None, None)).rowcount == 0:
+            raise KeyTaken()
+        claim[3] = True
+
+    def __len__(self):
+        """
+        Returns the number of orders in the store.
+
+        Returns:
+            int: number of orders.
+        """
+        with self._connection() as conn:
+            return conn.execute(COUNT_ORDERS).fetchone()[0]
+
+    def close(self):
+        """
+        Closes the idle connections. The store can still be used after,
+        it just opens new ones.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class SqliteIdempotencyCache:
+    """
+    Keeps Idempotency-Key responses in the database, with the same run
+    method as main.IdempotencyCache, so every process sharing the file
+    sees the same keys.
+
+    The first write checkout a request makes claims its key, so if two
+    workers run the same request at once, the one that claims second rolls
+    back and replays the first one's response. A request that doesn't
+    change anything (like one that fails validation) saves its response
+    without a claim.
+
+    Attributes:
+        store (SqliteStore): store the keys are kept in.
+        ttl (float): seconds a key is remembered for.
+        waitSeconds (float): how long a retry waits for the response of a
+            request that claimed the key but hasn't saved it yet.
+    """
+
+    def __init__(self, store, ttl=86400, waitSeconds=10.0):
+        """
+        Initializes the cache.
+
+        Args:
+            store (SqliteStore): store to keep the keys in.
+            ttl (float): seconds a key is remembered for.
+            waitSeconds (float): how long to wait for a running request.
+        """
+        self.store = store
+        self.ttl = ttl
+        self.waitSeconds = waitSeconds
+
+    def run(self, key, fingerprint, compute):
+        """
+        Runs compute for the first request with a key, and gives every
+        later request with the key the same response.
+
+        If compute raises, its transaction is rolled back with the claim,
+        so the request can be retried.
+
+        Args:
+            key (tuple): route and Idempotency-Key.
+            fingerprint (bytes): hash of the request body.
+            compute (callable): makes the response, as the body bytes and status.
+
+        Returns:
+            tuple: the response, whether it was replayed, and an error
+                message if the key can't be used.
+        """
+        keyText = json.dumps(key)
+        deadline = time.monotonic() + self.waitSeconds
+        while True:
+            with self.store._connection() as conn:
+                row = conn.execute(SELECT_KEY, (keyText, time.time())).fetchone()
+            if row is not None:
+                if row[0] != fingerprint:
+                    return None, False, "Idempotency-Key was already used for a different request"
+                if row[1] is not None:
+                    return (row[2], row[1]), True, None
+                # Claimed by a request that hasn't saved its response yet
+                if time.monotonic() >= deadline:
+                    return None, False, "Idempotency-Key is still being used by another request"
+                time.sleep(0.01)
+                continue
+
+            claim = [keyText, fingerprint, time.time() + self.ttl, False]
+            token = pendingClaim.set(claim)
+            try:
+                response = compute()
+            except KeyTaken:
+                continue
+            finally:
+                pendingClaim.reset(token)
+            body, status = response
+            with self.store._connection() as conn:
+                if claim[3]:
+                    conn.execute(SAVE_RESPONSE, (status, body, keyText))
+                else:
+                    conn.execute(INSERT_KEY, (keyText, fingerprint, claim[2], status, body))
+            return response, False, None
+
+
+def use_sqlite(path):
+    """
+    Switches the app over to a SQLite store.
+
+    Args:
+        path (str): path of the database file.
+
+    Returns:
+        SqliteStore: the new store.
+
+    Raises:
+        ValueError: if snapshots are turned on, since they only work with
+            the in-memory store.
+    """
+    if main.snapshotSaver is not None:
+        raise ValueError("Snapshots (CINOS_SNAPSHOT_DIR) only work with the in-memory store, SQLite keeps the orders in its own file")
+    main.store = SqliteStore(path)
+    main.store.create_order(main.DEFAULT_ORDER_ID)
+    return main.store
+
+
+if __name__ == '__main__':
+    use_sqlite(sys.argv[1] if len(sys.argv) > 1 else "orders.db")
+    main.app.run()
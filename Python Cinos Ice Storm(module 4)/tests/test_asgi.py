@@ -0,0 +1,126 @@
+# Testing the ASGI version of the API
+
+import asyncio
+import json
+import time
+
+import main
+from asgi import app
+from main import OrderStore
+from wal import WriteAheadLog
+
+# Sends one request to the ASGI app and collects the response
+def call(method, path, body=None, headers=(), query=b""):
+    data = json.dumps(body).encode() if body is not None else b""
+    messages = [{"type": "http.request", "body": data[:5], "more_body": True},
+                {"type": "http.request", "body": data[5:], "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": query, "headers": list(headers)}
+    asyncio.run(app(scope, receive, send))
+    responseHeaders = dict(sent[0]["headers"])
+    text = sent[1]["body"]
+    return sent[0]["status"], json.loads(text) if text else None, responseHeaders
+
+# Testing adding items and getting the order back
+def test_asgi_order_routes():
+    status, body, _ = call("POST", "/orders")
+    order_id = body["order_id"]
+    assert call("POST", f"/orders/{order_id}", {"size": "small", "base": "water"})[0] == 201
+    assert call("POST", f"/orders/{order_id}/food", {"foodType": "hotdog", "toppings": ["chili"]})[0] == 201
+    assert call("POST", f"/orders/{order_id}/ice-storm", {"flavor": "banana"})[0] == 201
+    status, body, headers = call("GET", f"/orders/{order_id}")
+    assert status == 200
+    assert [line["type"] for line in body["items"]] == ["drink", "food", "ice storm"]
+    assert body["totals"]["subtotal"] == 7.90
+    status, _, _ = call("GET", f"/orders/{order_id}", headers=[(b"if-none-match", headers[b"etag"])])
+    assert status == 304
+
+# Testing errors and removing items
+def test_asgi_errors_and_remove():
+    order_id = call("POST", "/orders")[1]["order_id"]
+    assert call("POST", f"/orders/{order_id}/food", {"foodType": "soup"})[1] == {"error": "Invalid food type", "errors": ["Invalid food type"]}
+    assert call("POST", f"/orders/{order_id}/batch", {"items": [{"type": "food", "foodType": "corndog"}]})[0] == 201
+    assert call("POST", f"/orders/{order_id}/batch", {"items": [{"type": ["food"]}]})[1] == {"errors": [{"index": 0, "error": "Invalid item type"}]}
+    assert call("DELETE", f"/orders/{order_id}/3")[0] == 400
+    assert call("DELETE", f"/orders/{order_id}/0")[0] == 200
+    assert call("GET", "/orders/missing")[0] == 404
+    assert call("DELETE", f"/orders/{order_id}")[0] == 200
+
+# Testing the bulk remove route gives the same answers as the Flask one
+def test_asgi_remove_items():
+    client = main.app.test_client()
+    orders = [call("POST", "/orders")[1]["order_id"] for _ in range(2)]
+    for order_id in orders:
+        for foodType in ("hotdog", "corndog", "nacho chips"):
+            call("POST", f"/orders/{order_id}/food", {"foodType": foodType})
+        call("POST", f"/orders/{order_id}", {"size": "small"})
+    for body in ({"indexes": [0, 2]}, {"type": "drink"}, {"indexes": [9]}, {"type": "soup"}, {"type": ["drink"]}, [0], {}):
+        status, data, _ = call("DELETE", f"/orders/{orders[0]}/items", body)
+        response = client.delete(f"/orders/{orders[1]}/items", json=body)
+        assert (status, data) == (response.status_code, response.get_json())
+    assert call("GET", f"/orders/{orders[0]}")[1]["num_items"] == 1
+    assert call("DELETE", "/orders/missing/items", {"type": "drink"})[0] == 404
+
+# Testing that waiting on the log doesn't hold up the event loop
+def test_asgi_log_off_loop(tmp_path, monkeypatch):
+    log = WriteAheadLog(str(tmp_path / "orders.wal"))
+    monkeypatch.setattr(main, "store", OrderStore(log=log))
+    main.store.create_order("a")
+    flush = log._flush
+
+    def slow_flush(fd, goodEnd, data):
+        time.sleep(0.2)
+        flush(fd, goodEnd, data)
+
+    log._flush = slow_flush
+    body = json.dumps({"foodType": "hotdog"}).encode()
+    ticks = []
+
+    async def post():
+        sent = []
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": "/orders/a/food", "query_string": b"", "headers": []}
+        await app(scope, receive, send)
+        return sent[0]["status"]
+
+    async def tick():
+        for _ in range(10):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.02)
+
+    async def run():
+        return await asyncio.gather(*[post() for _ in range(8)], tick())
+
+    statuses = asyncio.run(run())[:8]
+    assert statuses == [201] * 8
+    assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.15
+    assert log.syncs < 8
+    log.close()
+
+# Testing that a failed log gives a 503 and the item isn't added again
+def test_asgi_failed_log(tmp_path, monkeypatch):
+    log = WriteAheadLog(str(tmp_path / "orders.wal"))
+    monkeypatch.setattr(main, "store", OrderStore(log=log))
+    main.store.create_order("a")
+
+    def fail(fd, data):
+        raise OSError(28, "No space left on device")
+
+    log._write = fail
+    assert call("POST", "/orders/a/food", {"foodType": "hotdog"})[0] == 503
+    assert call("POST", "/orders/a/food", {"foodType": "hotdog"})[0] == 503
+    assert call("GET", "/orders/a")[1]["num_items"] == 1
@@ -0,0 +1,75 @@
+# Testing the batch add route
+
+from main import app, build_items
+
+# Testing building a batch with every item type
+def test_build_items_valid():
+    items, errors = build_items([
+        {"type": "drink", "size": "small", "base": "water", "flavors": ["lemon"]},
+        {"type": "food", "foodType": "hotdog", "toppings": ["chili"]},
+        {"type": "ice storm", "flavor": "banana", "mix_ins": ["pecans"]},
+    ])
+    assert errors == []
+    assert [item.get_total() for item in items] == [1.65, 2.90, 4.00]
+
+# Testing that every bad item is reported with its position
+def test_build_items_errors():
+    items, errors = build_items([
+        {"type": "drink", "size": "small", "base": "juice"},
+        {"type": "food", "foodType": "hotdog"},
+        {"type": "soup"},
+        "hotdog",
+        {"type": "ice storm", "flavor": "banana", "mix_ins": ["gravel"]},
+        {"type": ["food"], "foodType": "hotdog"},
+        {"type": {"food": 1}, "foodType": "hotdog"},
+    ])
+    assert len(items) == 1
+    assert errors == [
+        {"index": 0, "error": "Invalid base"},
+        {"index": 2, "error": "Invalid item type"},
+        {"index": 3, "error": "Item must be an object"},
+        {"index": 4, "error": "Invalid mix in"},
+        {"index": 5, "error": "Invalid item type"},
+        {"index": 6, "error": "Invalid item type"},
+    ]
+
+# Testing that a good batch is added to the order
+def test_batch_route_adds_all():
+    client = app.test_client()
+    order_id = client.post("/orders").get_json()["order_id"]
+    response = client.post(f"/orders/{order_id}/batch", json={"items": [
+        {"type": "drink", "size": "large", "base": "sbrite"},
+        {"type": "food", "foodType": "corndog"},
+    ]})
+    assert response.status_code == 201
+    assert response.get_json()["num_added"] == 2
+    assert client.get(f"/orders/{order_id}").get_json()["num_items"] == 2
+
+# Testing that a bad batch adds nothing
+def test_batch_route_adds_none():
+    client = app.test_client()
+    order_id = client.post("/orders").get_json()["order_id"]
+    response = client.post(f"/orders/{order_id}/batch", json={"items": [
+        {"type": "food", "foodType": "corndog"},
+        {"type": "drink", "size": "large"},
+    ]})
+    assert response.status_code == 400
+    assert response.get_json()["errors"] == [{"index": 1, "error": "Invalid base"}]
+    assert client.get(f"/orders/{order_id}").get_json()["num_items"] == 0
+
+# Testing that a body that isn't a JSON object is refused
+def test_batch_route_not_object():
+    client = app.test_client()
+    order_id = client.post("/orders").get_json()["order_id"]
+    for body in ([{"type": "food", "foodType": "hotdog"}], "items", 5):
+        response = client.post(f"/orders/{order_id}/batch", json=body)
+        assert response.status_code == 400
+        assert response.get_json() == {"error": "Items are required"}
+
+# Testing that an item type that isn't a string is a 400, not a crash
+def test_batch_route_type_not_string():
+    client = app.test_client()
+    order_id = client.post("/orders").get_json()["order_id"]
+    response = client.post(f"/orders/{order_id}/batch", json={"items": [{"type": "food", "foodType": "hotdog"}, {"type": ["food"]}]})
+    assert response.status_code == 400
+    assert response.get_json() == {"errors": [{"index": 1, "error": "Invalid item type"}]}
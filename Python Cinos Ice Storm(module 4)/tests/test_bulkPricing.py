@@ -0,0 +1,71 @@
+# Testing the NumPy bulk pricer
+
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from main import Order, Drink, Food, IceStorm, catalog, calculate_tax
+from bulk_pricing import price_lines, price_orders, columns_from_orders, typeCodes
+
+# Testing pricing single lines
+def test_price_lines():
+    prices = price_lines(
+        [typeCodes["drink"], typeCodes["food"], typeCodes["ice storm"]],
+        [catalog.sizes["large"].code, catalog.foods["hotdog"].code, catalog.iceStorms["banana"].code],
+        [0b11, 1 << catalog.toppings["chili"].code, 0],
+    )
+    assert prices.tolist() == [235, 290, 350]
+
+# Testing that bad codes are caught
+def test_price_lines_invalid():
+    with pytest.raises(ValueError):
+        price_lines([3], [0], [0])
+    with pytest.raises(ValueError):
+        price_lines([typeCodes["drink"]], [len(catalog.sizes)], [0])
+    with pytest.raises(ValueError):
+        price_lines([typeCodes["drink"]], [0], [1 << len(catalog.flavors)])
+
+# Testing that bad order indexes are caught
+def test_price_orders_invalid_indexes():
+    lines = ([typeCodes["food"]] * 2, [catalog.foods["hotdog"].code] * 2, [0, 0])
+    with pytest.raises(ValueError):
+        price_orders(*lines, [0, -1])
+    with pytest.raises(ValueError):
+        price_orders(*lines, [0, 2], numOrders=2)
+    with pytest.raises(ValueError):
+        price_orders(*lines, [0])
+    with pytest.raises(ValueError):
+        price_orders(*lines, [0, 0, 1])
+    assert price_orders(*lines, [1, 1], numOrders=3)["subtotals"].tolist() == [0, 460, 0]
+
+# Testing that bulk pricing matches the Order objects exactly
+def test_price_orders_matches_objects():
+    rng = random.Random(7)
+    orders = []
+    for _ in range(50):
+        order = Order()
+        for _ in range(rng.randint(0, 20)):
+            kind = rng.randrange(3)
+            if kind == 0:
+                item = Drink(rng.choice(list(catalog.sizes)))
+                for flavor in rng.sample(list(catalog.flavors), rng.randint(0, 3)):
+                    item.add_flavor(flavor)
+            elif kind == 1:
+                item = Food(rng.choice(list(catalog.foods)))
+                for topping in rng.sample(list(catalog.toppings), rng.randint(0, 4)):
+                    item.add_topping(topping)
+            else:
+                item = IceStorm(rng.choice(list(catalog.iceStorms)))
+                for mix_in in rng.sample(list(catalog.mixIns), rng.randint(0, 4)):
+                    item.add_mix_in(mix_in)
+            order.add_item(item)
+        orders.append(order)
+
+    *columns, orderIndexes = columns_from_orders(orders)
+    result = price_orders(*columns, orderIndexes, numOrders=len(orders))
+    for i, order in enumerate(orders):
+        assert result["subtotals"][i] == order._subtotal
+        assert result["tax"][i] == calculate_tax(order._subtotal)
+        assert result["totals_after_tax"][i] == order._subtotal + calculate_tax(order._subtotal)
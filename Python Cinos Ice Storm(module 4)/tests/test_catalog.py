@@ -0,0 +1,57 @@
+# Testing the Catalog class
+
+import pytest
+
+from main import Catalog, catalog, sizes, foods, toppings, bases, drinkType, foodType
+
+# Testing that every section is built from the menu
+def test_catalog_sections():
+    assert set(catalog.sizes) == set(sizes)
+    assert set(catalog.foods) == set(foods)
+    assert set(catalog.bases) == set(bases)
+
+# Testing looking up an entry
+def test_catalog_entry():
+    entry = catalog.toppings["chili"]
+    assert entry.name == "chili"
+    assert entry.price == 60
+    assert entry.code == list(toppings).index("chili")
+
+# Testing that codes are small and unique in a section
+def test_catalog_codes():
+    codes = [entry.code for entry in catalog.mixIns.values()]
+    assert sorted(codes) == list(range(len(codes)))
+
+# Testing that names are normalized when compiled
+def test_catalog_normalizes_names():
+    menu = Catalog({"Small": 1.00}, ["Water"], ["Lemon"], 0.15, {}, {}, {}, {}, 0.05)
+    assert "small" in menu.sizes
+    assert "water" in menu.bases
+    assert menu.taxBasisPoints == 500
+
+# Testing that sections can't be changed
+def test_catalog_is_read_only():
+    with pytest.raises(TypeError):
+        catalog.foods["hotdog"] = None
+
+
+# Testing the table size for every food setup
+def test_price_table_size():
+    table = catalog.price_table(foodType)
+    assert len(table) == len(foods)
+    assert all(len(row) == 2 ** len(toppings) for row in table)
+
+# Testing the table against adding up the prices by hand
+def test_price_table_matches_sum():
+    table = catalog.price_table(foodType)
+    for food in catalog.foods.values():
+        for mask in range(2 ** len(toppings)):
+            expected = food.price + sum(
+                topping.price for topping in catalog.byCode["toppings"] if mask & (1 << topping.code)
+            )
+            assert table[food.code][mask] == expected
+
+# Testing that a new catalog gets its own tables
+def test_price_table_rebuilt():
+    menu = Catalog({"small": 1.00}, ["water"], ["lemon", "lime"], 0.25, {}, {}, {}, {}, 0.05)
+    assert menu.price_table(drinkType) == ((100, 125, 125, 150),)
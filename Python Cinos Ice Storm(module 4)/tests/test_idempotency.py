@@ -0,0 +1,124 @@
+# Testing Idempotency-Key support on the POST item routes
+
+import threading
+import time
+
+import main
+from main import IdempotencyCache, app
+from test_asgi import call
+
+# Testing that a key runs once and then replays
+def test_cache_replays():
+    cache = IdempotencyCache()
+    calls = []
+    compute = lambda: calls.append(1) or (b"ok", 201)
+    assert cache.run(("/order", "a"), b"x", compute) == ((b"ok", 201), False, None)
+    assert cache.run(("/order", "a"), b"x", compute) == ((b"ok", 201), True, None)
+    assert len(calls) == 1
+
+# Testing that a key used with a different body is refused
+def test_cache_different_request():
+    cache = IdempotencyCache()
+    cache.run(("/order", "a"), b"x", lambda: (b"ok", 201))
+    response, replayed, error = cache.run(("/order", "a"), b"y", lambda: (b"no", 201))
+    assert response is None
+    assert error
+
+# Testing that keys expire and that old ones are dropped
+def test_cache_ttl_and_lru():
+    cache = IdempotencyCache(maxEntries=2, ttl=0)
+    cache.run(("/order", "a"), b"x", lambda: (b"1", 201))
+    assert cache.run(("/order", "a"), b"x", lambda: (b"2", 201))[0] == (b"2", 201)
+
+    cache = IdempotencyCache(maxEntries=2)
+    for key in "abc":
+        cache.run(("/order", key), b"x", lambda: (b"1", 201))
+    assert len(cache) == 2
+    assert cache.run(("/order", "a"), b"x", lambda: (b"2", 201))[1] is False
+
+# Testing that a failed request isn't remembered
+def test_cache_failure_not_kept():
+    cache = IdempotencyCache()
+
+    def fail():
+        raise RuntimeError
+
+    try:
+        cache.run(("/order", "a"), b"x", fail)
+    except RuntimeError:
+        pass
+    assert cache.run(("/order", "a"), b"x", lambda: (b"ok", 201))[1] is False
+
+# Testing that requests with the same key at the same time only run once
+def test_cache_concurrent_duplicates():
+    cache = IdempotencyCache()
+    calls = []
+    start = threading.Barrier(8)
+    results = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return b"ok", 201
+
+    def request():
+        start.wait()
+        results.append(cache.run(("/order", "a"), b"x", compute)[0])
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [(b"ok", 201)] * 8
+
+# Testing that a retried POST doesn't add the item again
+def test_route_retry():
+    client = app.test_client()
+    order_id = client.post('/orders').get_json()["order_id"]
+    headers = {"Idempotency-Key": "retry-1"}
+    first = client.post(f'/orders/{order_id}/food', json={"foodType": "hotdog"}, headers=headers)
+    second = client.post(f'/orders/{order_id}/food', json={"foodType": "hotdog"}, headers=headers)
+    assert first.status_code == second.status_code == 201
+    assert second.get_json() == first.get_json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    client.post(f'/orders/{order_id}/food', json={"foodType": "hotdog"}, headers={"Idempotency-Key": "retry-2"})
+    assert client.get(f'/orders/{order_id}').get_json()["num_items"] == 2
+
+# Testing errors, batches, and requests without a key
+def test_route_errors():
+    client = app.test_client()
+    order_id = client.post('/orders').get_json()["order_id"]
+    headers = {"Idempotency-Key": "bad-1"}
+    assert client.post(f'/orders/{order_id}', json={"size": "huge"}, headers=headers).status_code == 400
+    assert client.post(f'/orders/{order_id}', json={"size": "huge"}, headers=headers).headers["Idempotent-Replayed"] == "true"
+    assert client.post(f'/orders/{order_id}', json={"size": "small"}, headers=headers).status_code == 422
+    assert client.post(f'/orders/{order_id}', json={"size": "small"}, headers={"Idempotency-Key": ""}).status_code == 400
+
+    batch = {"items": [{"type": "food", "foodType": "hotdog"}, {"type": "ice storm", "flavor": "banana"}]}
+    for _ in range(2):
+        client.post(f'/orders/{order_id}/batch', json=batch, headers={"Idempotency-Key": "batch-1"})
+        client.post(f'/orders/{order_id}/ice-storm', json={"flavor": "banana"})
+    assert client.get(f'/orders/{order_id}').get_json()["num_items"] == 4
+
+# Testing that the cache can be turned off
+def test_route_cache_off(monkeypatch):
+    monkeypatch.setattr(main, "idempotencyCache", IdempotencyCache(0))
+    client = app.test_client()
+    order_id = client.post('/orders').get_json()["order_id"]
+    for _ in range(2):
+        client.post(f'/orders/{order_id}/food', json={"foodType": "hotdog"}, headers={"Idempotency-Key": "k"})
+    assert client.get(f'/orders/{order_id}').get_json()["num_items"] == 2
+
+# Testing Idempotency-Key on the ASGI app
+def test_asgi_retry():
+    order_id = call("POST", "/orders")[1]["order_id"]
+    headers = [(b"idempotency-key", b"asgi-1")]
+    first = call("POST", f"/orders/{order_id}/ice-storm", {"flavor": "banana"}, headers=headers)
+    second = call("POST", f"/orders/{order_id}/ice-storm", {"flavor": "banana"}, headers=headers)
+    assert first[:2] == second[:2]
+    assert second[2][b"idempotent-replayed"] == b"true"
+    assert call("POST", f"/orders/{order_id}/ice-storm", {"flavor": "mango"}, headers=headers)[0] == 422
+    assert call("GET", f"/orders/{order_id}")[1]["num_items"] == 1
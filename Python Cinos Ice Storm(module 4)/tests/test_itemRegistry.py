@@ -0,0 +1,47 @@
+# Testing the item type registry and the generic item engine
+
+from main import (Order, Drink, Food, Item, ItemField, ItemType, itemDefinitions,
+                  receiptSerializers, register_item_type, drinkType, iceStorms, mixIns)
+
+# Testing that the built in item types are registered
+def test_builtin_types_registered():
+    assert set(itemDefinitions) == {"drink", "food", "ice storm"}
+    assert Drink("Small").itemType == "drink"
+
+# Testing that the compatibility classes are generic items
+def test_shims_are_items():
+    food = Food("hotdog")
+    assert isinstance(food, Item)
+    assert food.get_main() == "hotdog"
+    assert food.to_receipt() == {"foodType": "hotdog", "toppings": []}
+
+# Testing making a drink from JSON through its item type
+def test_from_json():
+    drink, error = drinkType.from_json({"size": "Large", "base": "Water", "flavors": ["lime", "lemon"]})
+    assert error is None
+    assert drink.to_receipt() == {"size": "large", "base": "water", "flavors": ["lemon", "lime"]}
+    assert drinkType.from_json({"size": "huge", "base": "water"}) == (None, "Invalid size")
+    assert drinkType.from_json({"base": "water"}) == (None, "Size is required")
+
+# Testing that a new item type plugs in with only a definition
+def test_register_new_type():
+    shakeType = register_item_type(ItemType(
+        "shake",
+        main=ItemField("flavor", "iceStorms", "Flavor is required", "Invalid flavor"),
+        modifiers=ItemField("mix_ins", "mixIns", None, "Invalid mix in"),
+    ))
+    try:
+        shake, error = shakeType.from_json({"flavor": "banana", "mix_ins": ["pecans"]})
+        assert error is None
+        assert shake.get_total() == iceStorms["banana"] + mixIns["pecans"]
+        order = Order()
+        order.add_item(Drink("Small"))
+        order.add_item(shake)
+        receipt = order.get_receipt()
+        assert receipt[1] == {"index": 1, "id": 1, "type": "shake", "flavor": "banana", "mix_ins": ["pecans"], "total": 4.00}
+        assert order.get_subtotals()["shake"] == 4.00
+        assert order.remove_items(itemType="shake") is None
+        assert len(order) == 1
+    finally:
+        del itemDefinitions["shake"]
+        del receiptSerializers["shake"]
@@ -0,0 +1,133 @@
+# Testing loading the menu from a file and swapping it in while running
+
+import json
+import os
+import threading
+
+import pytest
+
+import main
+from main import Catalog, Drink, MenuWatcher, app, drinkType, load_catalog, read_menu, reload_catalog
+
+menuFile = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "menu.toml")
+
+def write_menu(path, **changes):
+    menu = read_menu(menuFile)
+    menu.update(changes)
+    with open(path, "w") as f:
+        json.dump(menu, f)
+    return str(path)
+
+@pytest.fixture
+def keep_catalog(monkeypatch):
+    monkeypatch.setattr(main, "catalog", main.catalog)
+
+# Testing that menu.toml is the same menu as the one built in
+def test_menu_file_matches():
+    fileCatalog = load_catalog(menuFile)
+    assert fileCatalog.sections == main.catalog.sections
+    assert fileCatalog.taxBasisPoints == main.catalog.taxBasisPoints
+    for kind in main.itemDefinitions.values():
+        assert fileCatalog.price_table(kind) == main.catalog.price_table(kind)
+    assert fileCatalog.find("bases", "sprite").name == "sbrite"
+    assert fileCatalog.generation != main.catalog.generation
+
+# Testing that bad menus are refused
+def test_bad_menus(tmp_path):
+    menu = read_menu(menuFile)
+    bad = [
+        {**menu, "sizes": {"small": -1}},
+        {**menu, "sizes": {"small": True}},
+        {**menu, "bases": "water"},
+        {**menu, "taxRate": 1.5},
+        {**menu, "drinks": {}},
+        {**menu, "toppings": {"chili": 0.6, "Chili": 0.7}},
+        {**menu, "toppings": {f"topping {i}": 0.1 for i in range(Catalog.maxModifiers + 1)}},
+        {**menu, "aliases": {"bases": {"sprite": "juice"}}},
+        {k: v for k, v in menu.items() if k != "foods"},
+        ["not", "a", "menu"],
+    ]
+    for menuData in bad:
+        with pytest.raises(ValueError):
+            Catalog.from_menu(menuData)
+    path = tmp_path / "menu.json"
+    path.write_text("{not json")
+    with pytest.raises(ValueError):
+        load_catalog(str(path))
+
+# Testing that a reload changes prices for new items but not ones already made
+def test_reload_prices(tmp_path, keep_catalog):
+    before = Drink("small")
+    path = write_menu(tmp_path / "menu.json", sizes={"small": 1.00, "medium": 1.75, "large": 2.05, "mega": 2.15})
+    old = main.catalog
+    assert reload_catalog(path) is main.catalog is not old
+    assert Drink("small").get_total() == 1.00
+    assert drinkType.validate({"size": "small", "base": "water"})[0].get_total() == 1.00
+    assert before.get_total() == 1.50
+
+# Testing the reload route, and that a bad menu keeps the old one
+def test_reload_route(tmp_path, keep_catalog, monkeypatch):
+    client = app.test_client()
+    monkeypatch.setattr(main, "menuPath", None)
+    assert client.post("/admin/menu/reload").status_code == 400
+
+    path = write_menu(tmp_path / "menu.json", taxRate=0.10)
+    monkeypatch.setattr(main, "menuPath", path)
+    order_id = client.post("/orders").get_json()["order_id"]
+    client.post(f"/orders/{order_id}", json={"size": "small", "base": "water"})
+    first = client.get(f"/orders/{order_id}")
+    response = client.post("/admin/menu/reload")
+    assert response.status_code == 200
+    assert response.get_json()["generation"] == main.catalog.generation
+    second = client.get(f"/orders/{order_id}", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 200
+    assert second.get_json()["totals"]["total_after_tax"] == 1.65
+
+    current = main.catalog
+    with open(path, "w") as f:
+        f.write('{"sizes": {}}')
+    assert client.post("/admin/menu/reload").status_code == 400
+    assert main.catalog is current
+
+# Testing that the watcher reloads when the file changes
+def test_watcher(tmp_path, keep_catalog):
+    path = write_menu(tmp_path / "menu.json")
+    watcher = MenuWatcher(path)
+    assert watcher.check() is False
+    write_menu(tmp_path / "menu.json", flavorCost=0.25, taxRate=0.05)
+    os.utime(path, ns=(1, 1))
+    assert watcher.check() is True
+    assert main.catalog.flavorCost == 25
+    with open(path, "w") as f:
+        f.write("{}")
+    os.utime(path, ns=(2, 2))
+    assert watcher.check() is False
+    assert watcher.lastError
+    assert main.catalog.flavorCost == 25
+
+# Testing that requests running during reloads only ever see one whole menu
+def test_swap_while_reading(tmp_path, keep_catalog):
+    paths = [
+        write_menu(tmp_path / "a.json", sizes={"small": 1.00}, flavorCost=0.10),
+        write_menu(tmp_path / "b.json", sizes={"small": 3.00}, flavorCost=0.30),
+    ]
+    payload = {"size": "small", "base": "water", "flavors": ["lime", "lemon"]}
+    catalogs = [main.catalog] + [load_catalog(path) for path in paths]
+    expected = {menu.validator(drinkType)(payload)[0].get_total_cents() for menu in catalogs}
+    stop = threading.Event()
+    totals = set()
+
+    def read():
+        while not stop.is_set():
+            totals.add(drinkType.validate(payload)[0].get_total_cents())
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for i in range(50):
+        reload_catalog(paths[i % 2])
+    stop.set()
+    for reader in readers:
+        reader.join()
+    assert len(expected) == 3
+    assert totals <= expected
@@ -1,6 +1,6 @@
 # Testing the order class
 
-from main import Order, Drink
+from main import Order, Drink, Food
 
 # Testing retrieving the reciept while empy
 def test_get_receipt_empty():
@@ -69,4 +69,136 @@ def test_remove_drink_valid():
 def test_remove_drink_invalid():
     order = Order()
     result = order.remove_item(0)
-    assert result == "Invalid index"
\ No newline at end of file
+    assert result == "Invalid index"
+
+# Testing the subtotal after removing an item
+def test_get_total_after_remove():
+    order = Order()
+    drink1 = Drink("Small")
+    drink2 = Drink("Large")
+    order.add_item(drink1)
+    order.add_item(drink2)
+    order.remove_item(0)
+    assert order.get_total() == drink2.get_total()
+    order.remove_item(0)
+    assert order.get_total() == 0
+
+# Testing the subtotals for each item type
+def test_get_subtotals():
+    order = Order()
+    drink = Drink("Medium")
+    food = Food("hotdog")
+    food.add_topping("chili")
+    order.add_item(drink)
+    order.add_item(food)
+    subtotals = order.get_subtotals()
+    assert subtotals["drink"] == drink.get_total()
+    assert subtotals["food"] == food.get_total()
+    assert subtotals["ice storm"] == 0
+
+# Testing the one at a time receipt matches the full one
+def test_iter_receipt():
+    order = Order()
+    order.add_item(Drink("Small"))
+    order.add_item(Food("hotdog"))
+    receipt = order.iter_receipt()
+    order.remove_item(0)
+    assert [line["type"] for line in receipt] == ["drink", "food"]
+    assert list(order.iter_receipt()) == order.get_receipt()
+
+# Testing paging through the receipt
+def test_get_receipt_page():
+    order = Order()
+    for _ in range(5):
+        order.add_item(Drink("Small"))
+    page, cursor = order.get_receipt_page(limit=2)
+    assert [line["index"] for line in page] == [0, 1]
+    page, cursor = order.get_receipt_page(limit=2, cursor=cursor)
+    assert [line["index"] for line in page] == [2, 3]
+    page, cursor = order.get_receipt_page(limit=2, cursor=cursor)
+    assert [line["index"] for line in page] == [4]
+    assert cursor is None
+
+# Testing paging through one item type after a removal
+def test_get_receipt_page_by_type():
+    order = Order()
+    order.add_item(Food("hotdog"))
+    order.add_item(Drink("Small"))
+    order.add_item(Food("corndog"))
+    order.add_item(Food("ice cream"))
+    order.remove_item(1)
+    page, cursor = order.get_receipt_page(limit=2, itemType="food")
+    assert [line["index"] for line in page] == [0, 1]
+    page, cursor = order.get_receipt_page(limit=2, cursor=cursor, itemType="food")
+    assert [line["foodType"] for line in page] == ["ice cream"]
+    assert cursor is None
+    assert order.get_receipt_page(itemType="drink") == ([], None)
+
+# Testing that the version goes up on every change
+def test_version():
+    order = Order()
+    assert order.get_version() == 0
+    order.add_item(Drink("Small"))
+    etag = order.get_etag()
+    order.remove_item(0)
+    assert order.get_version() == 2
+    assert order.get_etag() != etag
+    order.remove_item(0)
+    assert order.get_version() == 2
+
+# Testing that item ids don't change when other items are removed
+def test_remove_item_by_id():
+    order = Order()
+    ids = [order.add_item(Drink("Small")) for _ in range(5)]
+    assert order.remove_item_by_id(ids[3]) is None
+    assert order.remove_item_by_id(ids[4]) is None
+    assert order.remove_item_by_id(ids[4]) == "Invalid item id"
+    assert [line["id"] for line in order.get_receipt()] == ids[:3]
+    assert [line["index"] for line in order.get_receipt()] == [0, 1, 2]
+    assert len(order) == 3
+    assert order.get_total() == 3 * Drink("Small").get_total()
+
+# Testing removing by index after removing by id
+def test_remove_item_after_remove_by_id():
+    order = Order()
+    ids = [order.add_item(Food(foodType)) for foodType in ("hotdog", "corndog", "ice cream")]
+    order.remove_item_by_id(ids[0])
+    order.remove_item(1)
+    assert [line["foodType"] for line in order.get_receipt()] == ["corndog"]
+
+# Testing that tombstones get compacted away
+def test_remove_item_by_id_compacts():
+    order = Order()
+    ids = [order.add_item(Drink("Small")) for _ in range(100)]
+    for itemId in ids[:90]:
+        order.remove_item_by_id(itemId)
+    assert len(order._items) < 100
+    assert len(order) == 10
+    assert [line["id"] for line in order.get_receipt()] == ids[90:]
+
+# Testing removing several items by index at once
+def test_remove_items_by_index():
+    order = Order()
+    for foodType in ("hotdog", "corndog", "ice cream", "tater tots"):
+        order.add_item(Food(foodType))
+    assert order.remove_items([3, 0, 3]) is None
+    assert [line["foodType"] for line in order.get_receipt()] == ["corndog", "ice cream"]
+    assert order.get_total() == Food("corndog").get_total() + Food("ice cream").get_total()
+
+# Testing that one bad index removes nothing
+def test_remove_items_invalid_index():
+    order = Order()
+    order.add_item(Drink("Small"))
+    assert order.remove_items([0, 1]) == "Invalid index"
+    assert len(order) == 1
+
+# Testing removing every item of one type
+def test_remove_items_by_type():
+    order = Order()
+    order.add_item(Drink("Small"))
+    order.add_item(Food("hotdog"))
+    order.add_item(Drink("Large"))
+    assert order.remove_items(itemType="drink") is None
+    assert [line["type"] for line in order.get_receipt()] == ["food"]
+    assert order.get_subtotals()["drink"] == 0
+    assert order.remove_items(itemType="soup") == "Invalid type"
@@ -71,4 +71,16 @@ def test_get_total_with_paid_toppings():
     food.add_topping("chili")
     food.add_topping("bacon bits")
     expected_total = foods["hotdog"] + toppings["chili"] + toppings["bacon bits"]
-    assert round(food.get_total(), 2) == round(expected_total, 2)
\ No newline at end of file
+    assert round(food.get_total(), 2) == round(expected_total, 2)
+
+# Testing that toppings come back in menu order
+def test_get_toppings_menu_order():
+    food = Food("hotdog")
+    food.add_topping("mustard")
+    food.add_topping("Ketchup")
+    assert food.get_toppings() == ["ketchup", "mustard"]
+
+# Testing that food items don't carry a dict around
+def test_food_uses_slots():
+    food = Food("hotdog")
+    assert not hasattr(food, "__dict__")
@@ -57,4 +57,13 @@ def test_get_total_with_paid_mix_ins():
     ice_storm.add_mix_in("storios")
     ice_storm.add_mix_in("t&t's")
     expected_total= iceStorms["chocolate"] + mixIns["storios"] + mixIns["t&t's"]
-    assert round(ice_storm.get_total(), 2) == round(expected_total, 2)
\ No newline at end of file
+    assert round(ice_storm.get_total(), 2) == round(expected_total, 2)
+
+# Testing that mix ins are stored as a bitmask
+def test_mix_ins_bitmask():
+    ice_storm = IceStorm("chocolate")
+    ice_storm.add_mix_in("pecans")
+    ice_storm.add_mix_in("cherry")
+    ice_storm.add_mix_in("pecans")
+    assert ice_storm.get_codes()[1] == (1 << 0) | (1 << 8)
+    assert ice_storm.get_mix_ins() == ["cherry", "pecans"]
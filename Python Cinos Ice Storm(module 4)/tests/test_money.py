@@ -0,0 +1,32 @@
+# Testing the money helpers
+
+from main import Order, Food, to_cents, to_dollars, calculate_tax
+
+# Testing turning dollars into cents
+def test_to_cents():
+    assert to_cents(2.05) == 205
+    assert to_cents(0.15) == 15
+    assert to_cents(0) == 0
+
+# Testing turning cents into dollars
+def test_to_dollars():
+    assert to_dollars(205) == 2.05
+    assert to_dollars(0) == 0
+
+# Testing that half a cent of tax rounds up
+def test_calculate_tax_rounds_half_up():
+    assert calculate_tax(230) == 17  # 16.675 cents
+    assert calculate_tax(200) == 15  # 14.5 cents
+    assert calculate_tax(0) == 0
+
+# Testing that a big order doesn't drift
+def test_large_order_total():
+    order = Order()
+    for _ in range(3000):
+        food = Food("tater tots")
+        food.add_topping("bacon bits")
+        order.add_item(food)
+    assert order.get_total() == 6000.00
+    totals = order.get_total_after_tax()
+    assert totals["tax"] == 435.00
+    assert totals["total_after_tax"] == 6435.00
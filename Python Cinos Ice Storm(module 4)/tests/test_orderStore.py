@@ -0,0 +1,155 @@
+# Testing the OrderStore class and the multi-order routes
+
+import threading
+
+from main import OrderStore, Drink, app
+
+# Testing creating an order gives back a new id
+def test_create_order():
+    store = OrderStore()
+    order_id = store.create_order()
+    assert order_id is not None
+    assert len(store) == 1
+
+# Testing creating an order with an id that is already taken
+def test_create_order_duplicate_id():
+    store = OrderStore()
+    store.create_order("register-1")
+    assert store.create_order("register-1") is None
+
+# Testing that orders are kept separate
+def test_orders_are_separate():
+    store = OrderStore()
+    first = store.create_order()
+    second = store.create_order()
+    with store.checkout(first) as order:
+        order.add_item(Drink("Small"))
+    with store.checkout(second) as order:
+        assert order.get_receipt() == []
+
+# Testing checking out an order that doesn't exist
+def test_checkout_missing_order():
+    store = OrderStore()
+    with store.checkout("missing") as order:
+        assert order is None
+
+# Testing deleting an order
+def test_delete_order():
+    store = OrderStore()
+    order_id = store.create_order()
+    assert store.delete_order(order_id) is True
+    assert store.delete_order(order_id) is False
+    assert len(store) == 0
+
+# Testing many threads adding to many orders at once
+def test_concurrent_adds():
+    store = OrderStore(numBuckets=4)
+    order_ids = [store.create_order() for _ in range(20)]
+
+    def worker(order_id):
+        for _ in range(50):
+            with store.checkout(order_id) as order:
+                order.add_item(Drink("Small"))
+
+    threads = [threading.Thread(target=worker, args=(order_id,)) for order_id in order_ids for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for order_id in order_ids:
+        with store.checkout(order_id) as order:
+            assert len(order.get_receipt()) == 150
+
+# Testing the order routes with a separate order id
+def test_order_routes():
+    client = app.test_client()
+    order_id = client.post("/orders").get_json()["order_id"]
+    response = client.post(f"/orders/{order_id}/food", json={"foodType": "hotdog", "toppings": ["chili"]})
+    assert response.status_code == 201
+    body = client.get(f"/orders/{order_id}").get_json()
+    assert body["num_items"] == 1
+    assert client.delete(f"/orders/{order_id}/0").status_code == 200
+    assert client.delete(f"/orders/{order_id}").status_code == 200
+    assert client.get(f"/orders/{order_id}").status_code == 404
+
+# Testing streaming an order gives the same JSON as the normal route
+def test_stream_order_route():
+    client = app.test_client()
+    order_id = client.post("/orders").get_json()["order_id"]
+    client.post(f"/orders/{order_id}", json={"size": "mega", "base": "water", "flavors": ["mint"]})
+    client.post(f"/orders/{order_id}/ice-storm", json={"flavor": "banana"})
+    streamed = client.get(f"/orders/{order_id}?stream=true")
+    assert streamed.is_streamed
+    assert streamed.get_json() == client.get(f"/orders/{order_id}").get_json()
+
+# Testing the paging query parameters on the order route
+def test_order_route_paging():
+    client = app.test_client()
+    order_id = client.post("/orders").get_json()["order_id"]
+    for foodType in ("hotdog", "corndog", "nacho chips"):
+        client.post(f"/orders/{order_id}/food", json={"foodType": foodType})
+    client.post(f"/orders/{order_id}/ice-storm", json={"flavor": "banana"})
+    body = client.get(f"/orders/{order_id}?type=food&limit=2").get_json()
+    assert [line["foodType"] for line in body["items"]] == ["hotdog", "corndog"]
+    assert body["num_items"] == 4
+    body = client.get(f"/orders/{order_id}?type=food&limit=2&cursor={body['next_cursor']}").get_json()
+    assert [line["foodType"] for line in body["items"]] == ["nacho chips"]
+    assert body["next_cursor"] is None
+    assert client.get(f"/orders/{order_id}?limit=0").status_code == 400
+    assert client.get(f"/orders/{order_id}?type=soup").status_code == 400
+
+# Testing conditional GETs with an ETag
+def test_order_route_etag():
+    client = app.test_client()
+    order_id = client.post("/orders").get_json()["order_id"]
+    first = client.get(f"/orders/{order_id}")
+    etag = first.headers["ETag"]
+    response = client.get(f"/orders/{order_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    client.post(f"/orders/{order_id}/food", json={"foodType": "hotdog"})
+    response = client.get(f"/orders/{order_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+# Testing removing items by id on the order route
+def test_remove_item_by_id_route():
+    client = app.test_client()
+    order_id = client.post("/orders").get_json()["order_id"]
+    for foodType in ("hotdog", "corndog", "nacho chips"):
+        client.post(f"/orders/{order_id}/food", json={"foodType": foodType})
+    ids = [line["id"] for line in client.get(f"/orders/{order_id}").get_json()["items"]]
+    assert client.delete(f"/orders/{order_id}/items/{ids[0]}").status_code == 200
+    assert client.delete(f"/orders/{order_id}/items/{ids[1]}").status_code == 200
+    assert client.delete(f"/orders/{order_id}/items/{ids[1]}").status_code == 400
+    body = client.get(f"/orders/{order_id}").get_json()
+    assert [line["foodType"] for line in body["items"]] == ["nacho chips"]
+
+# Testing the bulk delete route
+def test_remove_items_route():
+    client = app.test_client()
+    order_id = client.post("/orders").get_json()["order_id"]
+    for foodType in ("hotdog", "corndog", "nacho chips"):
+        client.post(f"/orders/{order_id}/food", json={"foodType": foodType})
+    response = client.delete(f"/orders/{order_id}/items", json={"indexes": [0, 2]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["num_removed"] == 2
+    assert body["num_items"] == 1
+    assert body["totals"]["subtotal"] == 2.00
+    assert client.delete(f"/orders/{order_id}/items", json={}).status_code == 400
+    assert client.delete(f"/orders/{order_id}/items", json={"indexes": [5]}).status_code == 400
+
+# Testing that the bulk delete route turns away bodies it can't use
+def test_remove_items_route_bad_body():
+    client = app.test_client()
+    order_id = client.post("/orders").get_json()["order_id"]
+    client.post(f"/orders/{order_id}/food", json={"foodType": "hotdog"})
+    response = client.delete(f"/orders/{order_id}/items", json=[0])
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Either indexes or type is required"
+    response = client.delete(f"/orders/{order_id}/items", json={"type": ["drink"]})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Invalid type"
+    assert client.delete(f"/orders/{order_id}/items", json={"type": 5}).status_code == 400
+    assert client.get(f"/orders/{order_id}").get_json()["num_items"] == 1
@@ -0,0 +1,48 @@
+# Testing the ReceiptCache class and cached order responses
+
+import main
+from main import ReceiptCache, app
+
+# Testing a hit for the same version
+def test_cache_hit():
+    cache = ReceiptCache(100)
+    cache.put(("order", b""), 1, b"abc")
+    assert cache.get(("order", b""), 1) == b"abc"
+
+# Testing that a newer version makes the entry stale
+def test_cache_stale_version():
+    cache = ReceiptCache(100)
+    cache.put(("order", b""), 1, b"abc")
+    assert cache.get(("order", b""), 2) is None
+    assert len(cache) == 0
+
+# Testing that the least recently used entry is dropped
+def test_cache_evicts_lru():
+    cache = ReceiptCache(10)
+    cache.put(("a", b""), 1, b"aaaa")
+    cache.put(("b", b""), 1, b"bbbb")
+    cache.get(("a", b""), 1)
+    cache.put(("c", b""), 1, b"cccc")
+    assert cache.get(("b", b""), 1) is None
+    assert cache.get(("a", b""), 1) == b"aaaa"
+    assert cache.get(("c", b""), 1) == b"cccc"
+
+# Testing that a response bigger than the budget isn't kept
+def test_cache_too_big():
+    cache = ReceiptCache(2)
+    cache.put(("a", b""), 1, b"aaaa")
+    assert len(cache) == 0
+
+# Testing the order route with the cache turned on
+def test_order_route_cached(monkeypatch):
+    monkeypatch.setattr(main, "receiptCache", ReceiptCache(1 << 20))
+    client = app.test_client()
+    order_id = client.post("/orders").get_json()["order_id"]
+    client.post(f"/orders/{order_id}/food", json={"foodType": "hotdog"})
+    first = client.get(f"/orders/{order_id}")
+    assert len(main.receiptCache) == 1
+    second = client.get(f"/orders/{order_id}")
+    assert second.get_data() == first.get_data()
+    assert second.headers["ETag"] == first.headers["ETag"]
+    client.post(f"/orders/{order_id}/food", json={"foodType": "corndog"})
+    assert client.get(f"/orders/{order_id}").get_json()["num_items"] == 2
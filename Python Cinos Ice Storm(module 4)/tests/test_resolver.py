@@ -0,0 +1,87 @@
+# Testing alias and did-you-mean name resolution
+
+import pytest
+
+from main import Catalog, Drink, Food, IceStorm, NameResolver, app, catalog, drinkType, edit_distance, fold, foodType
+
+# Testing that names fold the same however they're written
+def test_fold():
+    assert fold("Mr Salt") == fold("mr. salt")
+    assert fold("tater tot") == fold("Tater Tots")
+    assert fold("S'mores") == fold("s'more")
+    assert fold("hot dog") == fold("hotdog")
+    assert fold("glass") == "glass"
+
+# Testing edit distance, with swapped letters counting once
+def test_edit_distance():
+    assert edit_distance("sbrite", "sbrite") == 0
+    assert edit_distance("sbirte", "sbrite") == 1
+    assert edit_distance("lrage", "large") == 1
+    assert edit_distance("pokacola", "pokeacola") == 1
+    assert edit_distance("", "abc") == 3
+
+# Testing that the item methods take names that aren't written exactly
+def test_item_methods():
+    drink = Drink("Large")
+    assert drink.set_base("Sbrite") is None
+    assert drink.set_base("sprite") is None
+    assert drink.get_base() == "sbrite"
+    assert drink.set_base("Mr Salt") is None
+    assert drink.get_base() == "mr. salt"
+    assert Food("tater tot").get_type() == "tater tots"
+    food = Food("Hot Dog")
+    assert food.add_topping("Bacon Bit") is None
+    assert food.get_toppings() == ["bacon bits"]
+    assert IceStorm("smores").get_flavor() == "s'more"
+
+# Testing that the validators resolve names before calling them errors
+def test_validator_resolves():
+    drink, errors = drinkType.validate({"size": "LARGE", "base": "Dr. Pepper", "flavors": ["Lemons", "lemon"]})
+    assert errors == []
+    assert drink.to_receipt() == {"size": "large", "base": "mr. salt", "flavors": ["lemon"]}
+    assert foodType.validate({"foodType": "gravel pie"})[1] == ["Invalid food type"]
+
+# Testing that close names are suggested but not used
+def test_suggest():
+    assert catalog.resolvers["bases"].suggest("pokacola") == ["pokeacola"]
+    assert catalog.resolvers["sizes"].suggest("meag") == ["mega"]
+    assert catalog.resolvers["bases"].suggest("juice") == []
+    assert catalog.resolvers["bases"].suggest("x" * 100) == []
+    assert Drink("lrage").get_size() is None
+
+# Testing that names folding the same for two entries aren't guessed
+def test_shared_fold():
+    resolver = NameResolver("foods", {"hot dog": catalog.foods["hotdog"], "hotdog": catalog.foods["corndog"]})
+    assert resolver.resolve("Hot-Dog") is None
+
+# Testing that an alias for something not on the menu is refused
+def test_bad_alias():
+    with pytest.raises(ValueError):
+        Catalog({"small": 1}, {"water": 0}, {}, 0, {}, {}, {}, {}, 0, {"bases": {"sprite": "sbrite"}})
+
+# Testing that resolved inputs are cached
+def test_lru():
+    resolver = catalog.resolvers["foods"]
+    resolver._lookup.cache_clear()
+    resolver.resolve("Tater Tot")
+    resolver.resolve("Tater Tot")
+    assert resolver._lookup.cache_info().hits == 1
+    assert resolver.resolve("x" * 10000) is None
+    assert resolver.resolve(["hotdog"]) is None
+    assert resolver._lookup.cache_info().currsize == 1
+
+# Testing suggestions in the route errors
+def test_route_suggestions():
+    client = app.test_client()
+    order_id = client.post("/orders").get_json()["order_id"]
+    response = client.post(f"/orders/{order_id}", json={"size": "lrage", "base": "sbrite", "flavors": ["limee"]})
+    assert response.status_code == 400
+    assert response.get_json() == {
+        "error": "Invalid size",
+        "errors": ["Invalid size", "Invalid flavor"],
+        "suggestions": [
+            {"field": "size", "value": "lrage", "did_you_mean": ["large"]},
+            {"field": "flavors", "value": "limee", "did_you_mean": ["lime"]},
+        ],
+    }
+    assert client.post(f"/orders/{order_id}", json={"size": "Mega", "base": "Sprite"}).status_code == 201
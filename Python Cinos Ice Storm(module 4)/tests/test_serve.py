@@ -0,0 +1,88 @@
+# Testing the pre-fork server
+
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import pytest
+
+import serve
+from wal import read_log
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+
+serveScript = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "serve.py")
+
+# Finds a port nothing is listening on
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+# Gets a URL, trying again while the server starts up
+def get(url, tries=50):
+    for _ in range(tries):
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                return response.status, json.loads(response.read())
+        except OSError:
+            time.sleep(0.1)
+    raise AssertionError("server didn't answer")
+
+# Posts JSON to a URL
+def post(url, body):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return response.status
+
+# Testing serving with worker restarts and a graceful reload
+def test_serve_workers(tmp_path):
+    port = free_port()
+    dbPath = str(tmp_path / "orders.db")
+    server = subprocess.Popen([sys.executable, serveScript, "--port", str(port), "--workers", "2", "--max-requests", "2", "--db", dbPath])
+    try:
+        for _ in range(8):
+            assert get(f"http://127.0.0.1:{port}/")[0] == 200
+        assert post(f"http://127.0.0.1:{port}/order/food", {"foodType": "hotdog"}) == 201
+        server.send_signal(signal.SIGHUP)
+        for _ in range(4):
+            status, body = get(f"http://127.0.0.1:{port}/order")
+            assert status == 200
+            assert body["num_items"] == 1
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=10) == 0
+
+# Testing that restarted workers pick up the log where the last one left off
+def test_serve_wal_restarts(tmp_path):
+    port = free_port()
+    walPath = str(tmp_path / "orders.wal")
+    env = dict(os.environ, CINOS_WAL_PATH=walPath)
+    server = subprocess.Popen(
+        [sys.executable, serveScript, "--port", str(port), "--workers", "1", "--max-requests", "2"], env=env
+    )
+    try:
+        get(f"http://127.0.0.1:{port}/")
+        for _ in range(3):
+            assert post(f"http://127.0.0.1:{port}/order/food", {"foodType": "hotdog"}) == 201
+        assert get(f"http://127.0.0.1:{port}/order")[1]["num_items"] == 3
+        server.send_signal(signal.SIGHUP)
+        assert post(f"http://127.0.0.1:{port}/order/food", {"foodType": "corndog"}) == 201
+        assert get(f"http://127.0.0.1:{port}/order")[1]["num_items"] == 4
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=10) == 0
+    lsns = [record[0] for record in read_log(walPath)]
+    assert lsns == list(range(1, len(lsns) + 1))
+
+# Testing that orders only kept in memory can't be split across or lost with workers
+def test_serve_memory_store_refused():
+    with pytest.raises(ValueError):
+        serve.serve(port=free_port(), numWorkers=2)
+    with pytest.raises(ValueError):
+        serve.serve(port=free_port(), numWorkers=1, maxRequests=10)
@@ -0,0 +1,237 @@
+# Testing background snapshots and loading them back with the log tail
+
+import os
+import threading
+
+import pytest
+
+import main
+from main import Drink, Food, IceStorm, OrderStore, app
+from snapshot import BackgroundSaver, SnapshotReader, latest_snapshot, list_snapshots, load_store, write_snapshot
+from sqlite_store import SqliteStore, use_sqlite
+from wal import WriteAheadLog, list_segments, read_log
+
+def fill(store, order_id):
+    store.create_order(order_id)
+    with store.checkout(order_id) as order:
+        drink = Drink("large")
+        drink.set_base("sbrite")
+        drink.add_flavor("lime")
+        drink.add_flavor("lemon")
+        order.add_item(drink)
+        order.add_item(Drink("small"))
+        order.add_item(IceStorm("mint chocolate chip"))
+        order.add_item(Food("hotdog"))
+        order.remove_item(2)
+
+def receipts(store):
+    result = {}
+    for order_id, *_ in store.dump():
+        with store.checkout(order_id) as order:
+            result[order_id] = (order.get_receipt(), order.get_etag(), order.get_total_after_tax())
+    return result
+
+# Testing that a snapshot reads back the same orders
+def test_write_and_read(tmp_path):
+    store = OrderStore()
+    fill(store, "a")
+    fill(store, "b")
+    path = write_snapshot(str(tmp_path), 7, list(store.dump()))
+    with SnapshotReader(path) as reader:
+        assert reader.lsn == 7
+        assert reader.numOrders == 2
+        assert sorted(reader) == sorted(store.dump())
+
+# Testing that restored items keep the price they were added at
+def test_restore_keeps_prices(tmp_path, monkeypatch):
+    store = OrderStore()
+    fill(store, "a")
+    with store.checkout("a") as order:
+        total = order.get_total()
+    path = write_snapshot(str(tmp_path), 1, list(store.dump()))
+    newSizes = {name: price + 1 for name, price in main.sizes.items()}
+    monkeypatch.setattr(main, "catalog", main.Catalog(newSizes, main.bases, main.flavors, main.flavorCost, main.foods,
+                                                      main.toppings, main.iceStorms, main.mixIns, main.taxRate))
+    restored = OrderStore()
+    with SnapshotReader(path) as reader:
+        restored.restore(reader)
+    with restored.checkout("a") as order:
+        assert order.get_total() == total
+
+    monkeypatch.setattr(main, "catalog", main.Catalog(
+        {"small": 1}, main.bases, [], main.flavorCost, main.foods, main.toppings, main.iceStorms, main.mixIns, main.taxRate,
+    ))
+    restored = OrderStore()
+    with SnapshotReader(path) as reader:
+        restored.restore(reader)
+    assert receipts(restored)["a"][0] == receipts(store)["a"][0]
+
+# Testing that a damaged snapshot isn't loaded
+def test_damaged_snapshot(tmp_path):
+    store = OrderStore()
+    fill(store, "a")
+    path = write_snapshot(str(tmp_path), 1, list(store.dump()))
+    with open(path, "r+b") as f:
+        f.seek(30)
+        f.write(b"\xff")
+    with pytest.raises(ValueError):
+        SnapshotReader(path)
+
+# Testing a background save and loading it into a new store
+def test_background_save(tmp_path):
+    store = OrderStore()
+    fill(store, "a")
+    fill(store, "b")
+    saver = BackgroundSaver(str(tmp_path))
+    assert saver.start(store) is not None
+    saver.wait()
+    assert saver.lastError is None
+    assert not saver.is_saving()
+
+    restored = OrderStore()
+    assert load_store(restored, str(tmp_path)) == 0
+    assert receipts(restored) == receipts(store)
+    with restored.checkout("a") as order:
+        assert order.add_item(Food("hotdog")) == 4
+
+# Testing that only the newest snapshots are kept
+def test_old_snapshots_deleted(tmp_path):
+    store = OrderStore()
+    saver = BackgroundSaver(str(tmp_path), keep=2)
+    for _ in range(3):
+        saver.start(store)
+        saver.wait()
+    assert len(list_snapshots(str(tmp_path))) == 2
+
+# Testing that startup loads the snapshot and replays only the log after it
+def test_snapshot_and_log_tail(tmp_path):
+    walPath = str(tmp_path / "orders.wal")
+    folder = str(tmp_path / "snapshots")
+    store = OrderStore(log=WriteAheadLog(walPath))
+    fill(store, "a")
+    saver = BackgroundSaver(folder)
+    saver.start(store)
+    saver.wait()
+    with store.checkout("a") as order:
+        order.add_item(Food("nacho chips"))
+    fill(store, "b")
+    store.log.close()
+
+    with SnapshotReader(latest_snapshot(folder)) as reader:
+        snapshotLsn = reader.lsn
+    assert snapshotLsn > 0
+    tail = list(read_log(walPath, snapshotLsn))
+    assert tail and tail[0][0] == snapshotLsn + 1
+    assert list_segments(walPath) == []
+    assert [record[0] for record in read_log(walPath)] == [record[0] for record in tail]
+
+    restored = OrderStore()
+    lsn = load_store(restored, folder)
+    restored.replay(read_log(walPath, lsn))
+    assert [line["id"] for line in receipts(restored)["a"][0]] == [0, 1, 3, 4]
+    assert [line["id"] for line in receipts(restored)["b"][0]] == [0, 1, 3]
+
+    log = WriteAheadLog(walPath, startLsn=lsn)
+    assert log.append("create", "c") == tail[-1][0] + 1
+    log.close()
+
+# Testing the snapshot route
+def test_snapshot_route(tmp_path, monkeypatch):
+    client = app.test_client()
+    monkeypatch.setattr(main, "snapshotSaver", None)
+    assert client.post('/admin/snapshot').status_code == 400
+
+    saver = BackgroundSaver(str(tmp_path))
+    monkeypatch.setattr(main, "snapshotSaver", saver)
+    assert client.post('/admin/snapshot').status_code == 202
+    saver.wait()
+    assert latest_snapshot(str(tmp_path)) is not None
+
+# Testing that segments are kept until a snapshot has their records
+def test_log_rotation(tmp_path):
+    walPath = str(tmp_path / "orders.wal")
+    log = WriteAheadLog(walPath)
+    for name in "abc":
+        log.wait(log.append("create", name))
+    assert log.rotate() == 3
+    assert log.rotate() == 3
+    log.wait(log.append("create", "d"))
+    assert log.rotate() == 4
+    assert [lsn for lsn, _ in list_segments(walPath)] == [3, 4]
+    assert [record[0] for record in read_log(walPath, 3)] == [4]
+    assert log.drop_segments(3) == 1
+    log.wait(log.append("create", "e"))
+    log.close()
+    assert [record[0] for record in read_log(walPath)] == [4, 5]
+    log = WriteAheadLog(walPath)
+    assert log.append("create", "f") == 6
+    log.close()
+
+# Testing that rotating only renames while paused and syncs the old file after
+def test_rotation_syncs_after_pause(tmp_path, monkeypatch):
+    walPath = str(tmp_path / "orders.wal")
+    log = WriteAheadLog(walPath)
+    log.wait(log.append("create", "a"))
+    log.append("create", "b")
+    syncs = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: syncs.append(fd) or fsync(fd))
+    assert log.begin_rotate() == 2
+    assert syncs == []
+    assert [lsn for lsn, _ in list_segments(walPath)] == [2]
+
+    waiter = threading.Thread(target=log.wait, args=(log.append("create", "c"),))
+    waiter.start()
+    waiter.join(0.1)
+    assert waiter.is_alive()
+    log.finish_rotate()
+    waiter.join()
+    assert syncs
+    log.close()
+    assert [record[:3] for record in read_log(walPath)] == [(1, "create", "a"), (2, "create", "b"), (3, "create", "c")]
+    assert [record[0] for record in read_log(walPath, 2)] == [3]
+
+# Testing that startup falls back to the previous snapshot when the newest is damaged
+def test_load_falls_back(tmp_path):
+    walPath = str(tmp_path / "orders.wal")
+    folder = str(tmp_path / "snapshots")
+    store = OrderStore(log=WriteAheadLog(walPath))
+    saver = BackgroundSaver(folder, keep=2)
+    fill(store, "a")
+    saver.start(store)
+    saver.wait()
+    fill(store, "b")
+    saver.start(store)
+    saver.wait()
+    fill(store, "c")
+    store.log.close()
+
+    older, newest = list_snapshots(folder)
+    with open(newest, "r+b") as f:
+        f.seek(30)
+        f.write(b"\xff")
+    restored = OrderStore()
+    lsn = load_store(restored, folder)
+    with SnapshotReader(older) as reader:
+        assert lsn == reader.lsn
+    restored.replay(read_log(walPath, lsn))
+    assert sorted(receipts(restored)) == ["a", "b", "c"]
+    for order_id, (receipt, _, totals) in receipts(store).items():
+        assert receipts(restored)[order_id][0] == receipt
+        assert receipts(restored)[order_id][2] == totals
+
+    with open(older, "r+b") as f:
+        f.seek(30)
+        f.write(b"\xff")
+    with pytest.raises(ValueError):
+        load_store(OrderStore(), folder)
+
+# Testing that snapshots are refused with the SQLite store
+def test_snapshot_sqlite_refused(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "snapshotSaver", BackgroundSaver(str(tmp_path / "snapshots")))
+    with pytest.raises(ValueError):
+        use_sqlite(str(tmp_path / "orders.db"))
+    sqliteStore = SqliteStore(str(tmp_path / "orders.db"))
+    monkeypatch.setattr(main, "store", sqliteStore)
+    assert app.test_client().post('/admin/snapshot').status_code == 400
+    sqliteStore.close()
@@ -0,0 +1,254 @@
+# Testing the SQLite order store against the in-memory one
+
+import sqlite3
+import threading
+
+import pytest
+
+import main
+from main import Drink, Food, IceStorm, OrderStore, app
+from sqlite_store import SqliteStore
+from test_asgi import call
+
+@pytest.fixture
+def sqliteStore(tmp_path):
+    store = SqliteStore(str(tmp_path / "orders.db"))
+    yield store
+    store.close()
+
+def fill(order):
+    drink = Drink("large")
+    drink.set_base("sbrite")
+    drink.add_flavor("lime")
+    food = Food("nacho chips")
+    food.add_topping("chili")
+    order.add_item(drink)
+    order.add_items([food, IceStorm("mint chocolate chip"), Food("hotdog")])
+
+# Testing that creating and deleting orders works like the in-memory store
+def test_create_and_delete(sqliteStore):
+    assert sqliteStore.create_order("a") == "a"
+    assert sqliteStore.create_order("a") is None
+    assert len(sqliteStore.create_order()) == 32
+    assert len(sqliteStore) == 2
+    assert sqliteStore.delete_order("a")
+    assert not sqliteStore.delete_order("a")
+    with sqliteStore.checkout("a") as order:
+        assert order is None
+
+# Testing that receipts, pages, and totals match the in-memory store
+def test_matches_memory_store(sqliteStore):
+    memoryStore = OrderStore()
+    for store in (memoryStore, sqliteStore):
+        store.create_order("a")
+        with store.checkout("a") as order:
+            fill(order)
+            order.remove_item(1)
+    with memoryStore.checkout("a") as expected, sqliteStore.checkout("a") as order:
+        assert len(order) == len(expected)
+        assert order.get_receipt() == expected.get_receipt()
+        assert list(order.iter_receipt()) == expected.get_receipt()
+        assert order.get_receipt_page(1, 0) == expected.get_receipt_page(1, 0)
+        assert order.get_receipt_page(1, 2) == expected.get_receipt_page(1, 2)
+        assert order.get_receipt_page(5, 0, "food") == expected.get_receipt_page(5, 0, "food")
+        assert order.get_receipt_page(None, 3, "food") == expected.get_receipt_page(None, 3, "food")
+        assert order.get_total_after_tax() == expected.get_total_after_tax()
+        assert order.get_subtotals() == expected.get_subtotals()
+        assert [item.to_receipt() for item in order.get_items()] == [item.to_receipt() for item in expected.get_items()]
+
+# Testing removing items by id and in bulk
+def test_remove_items(sqliteStore):
+    sqliteStore.create_order("a")
+    with sqliteStore.checkout("a") as order:
+        fill(order)
+        assert order.remove_item_by_id(9) == "Invalid item id"
+        assert order.remove_item(4) == "Invalid index"
+        assert order.remove_items([0, 7]) == "Invalid index"
+        assert order.remove_items(itemType="soup") == "Invalid type"
+        assert order.remove_items(itemType="food") is None
+        assert order.remove_items([1]) is None
+        assert [line["id"] for line in order.get_receipt()] == [0]
+
+# Testing that the version and ids are kept between checkouts
+def test_changes_are_saved(sqliteStore):
+    sqliteStore.create_order("a")
+    with sqliteStore.checkout("a") as order:
+        fill(order)
+        etag = order.get_etag()
+    with sqliteStore.checkout("a") as order:
+        assert order.get_etag() == etag
+        assert order.add_item(Food("hotdog")) == 4
+        assert order.get_etag() != etag
+
+# Testing that a failed checkout doesn't save anything
+def test_checkout_rolls_back(sqliteStore):
+    sqliteStore.create_order("a")
+    with pytest.raises(RuntimeError):
+        with sqliteStore.checkout("a") as order:
+            order.add_item(Food("hotdog"))
+            raise RuntimeError
+    with sqliteStore.checkout("a") as order:
+        assert len(order) == 0
+        assert order.get_version() == 0
+
+# Testing that threads adding at the same time don't lose items
+def test_concurrent_adds(sqliteStore):
+    sqliteStore.create_order("a")
+
+    def register():
+        for _ in range(10):
+            with sqliteStore.checkout("a") as order:
+                order.add_item(Food("hotdog"))
+
+    threads = [threading.Thread(target=register) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with sqliteStore.checkout("a") as order:
+        assert len(order) == 40
+        assert [line["id"] for line in order.get_receipt()] == list(range(40))
+
+# Testing that reads don't wait for a writer holding the lock
+def test_reads_during_write(sqliteStore):
+    sqliteStore.create_order("a")
+    with sqliteStore.checkout("a") as order:
+        fill(order)
+    sqliteStore.timeout = 0.1
+    writing = threading.Event()
+    done = threading.Event()
+    results = []
+
+    def writer():
+        with sqliteStore.checkout("a") as order:
+            order.add_item(Food("hotdog"))
+            writing.set()
+            done.wait()
+
+    def reader():
+        with sqliteStore.checkout("a", write=False) as order:
+            results.append(len(order))
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    writing.wait()
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    for other in readers:
+        other.start()
+    for other in readers:
+        other.join()
+    done.set()
+    thread.join()
+    assert results == [4] * 4
+    with sqliteStore.checkout("a", write=False) as order:
+        assert len(order) == 5
+
+# Testing that a thread per request reuses a few pooled connections instead of keeping one each
+def test_connection_pool(sqliteStore, monkeypatch):
+    sqliteStore.create_order("a")
+    opened = []
+    connect = sqlite3.connect
+
+    def tracked(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        opened.append(conn)
+        return conn
+
+    def is_open(conn):
+        try:
+            conn.execute("SELECT 1")
+        except sqlite3.ProgrammingError:
+            return False
+        return True
+
+    monkeypatch.setattr(sqlite3, "connect", tracked)
+    start = threading.Barrier(20)
+
+    def request():
+        start.wait()
+        with sqliteStore.checkout("a") as order:
+            order.add_item(Food("hotdog"))
+
+    threads = [threading.Thread(target=request) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(map(is_open, opened)) <= sqliteStore.maxIdle
+    numOpened = len(opened)
+
+    start = threading.Barrier(1)
+    for _ in range(50):
+        thread = threading.Thread(target=request)
+        thread.start()
+        thread.join()
+    assert len(opened) == numOpened
+    with sqliteStore.checkout("a", write=False) as order:
+        assert len(order) == 70
+
+# Testing the routes on the SQLite store
+def test_routes(sqliteStore, monkeypatch):
+    monkeypatch.setattr(main, "store", sqliteStore)
+    sqliteStore.create_order(main.DEFAULT_ORDER_ID)
+    client = app.test_client()
+    assert client.post('/order', json={"size": "small", "base": "water"}).status_code == 201
+    response = client.post('/order/batch', json={"items": [
+        {"type": "food", "foodType": "hotdog", "toppings": ["chili"]},
+        {"type": "ice storm", "flavor": "mint chocolate chip"},
+    ]})
+    assert response.get_json()["num_items"] == 3
+    assert client.delete('/order/items/1').status_code == 200
+    data = client.get('/order').get_json()
+    assert [line["type"] for line in data["items"]] == ["drink", "ice storm"]
+    assert data["num_items"] == 2
+
+    order_id = client.post('/orders').get_json()["order_id"]
+    assert client.post(f'/orders/{order_id}/food', json={"foodType": "hotdog"}).status_code == 201
+    assert client.delete(f'/orders/{order_id}').status_code == 200
+    assert client.get(f'/orders/{order_id}').status_code == 404
+
+# Testing that Idempotency-Keys are kept in the file, so a retry to another worker isn't added twice
+def test_idempotency_shared(sqliteStore, monkeypatch, tmp_path):
+    other = SqliteStore(str(tmp_path / "orders.db"))
+    order_id = sqliteStore.create_order()
+    headers = {"Idempotency-Key": "shared-1"}
+    client = app.test_client()
+    monkeypatch.setattr(main, "store", sqliteStore)
+    first = client.post(f'/orders/{order_id}/food', json={"foodType": "hotdog"}, headers=headers)
+    monkeypatch.setattr(main, "store", other)
+    second = client.post(f'/orders/{order_id}/food', json={"foodType": "hotdog"}, headers=headers)
+    assert first.status_code == second.status_code == 201
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert client.post(f'/orders/{order_id}/food', json={"foodType": "corndog"}, headers=headers).status_code == 422
+
+    status, _, responseHeaders = call("POST", f"/orders/{order_id}/food", {"foodType": "hotdog"},
+                                      headers=[(b"idempotency-key", b"shared-1")])
+    assert status == 201
+    assert responseHeaders[b"idempotent-replayed"] == b"true"
+    assert call("POST", f"/orders/{order_id}/food", {"foodType": "hotdog"}, headers=[(b"idempotency-key", b"shared-2")])[0] == 201
+    assert client.get(f'/orders/{order_id}').get_json()["num_items"] == 2
+    other.close()
+
+# Testing that when two workers run the same request at once, the one that claims the key second backs off
+def test_idempotency_race(sqliteStore, tmp_path):
+    other = SqliteStore(str(tmp_path / "orders.db"))
+    sqliteStore.create_order("a")
+    added = []
+
+    def add(store):
+        def compute():
+            with store.checkout("a") as order:
+                order.add_item(Food("hotdog"))
+            added.append(store)
+            return b"added", 201
+        return compute
+
+    def racing():
+        other.idempotency.run(("/orders/a/food", "k"), b"x", add(other))
+        return add(sqliteStore)()
+
+    assert sqliteStore.idempotency.run(("/orders/a/food", "k"), b"x", racing) == ((b"added", 201), True, None)
+    assert added == [other]
+    with sqliteStore.checkout("a", write=False) as order:
+        assert len(order) == 1
+    other.close()
@@ -0,0 +1,49 @@
+# Testing the compiled item validators
+
+from main import app, build_items, catalog, drinkType, foodType, iceStormType
+
+# Testing that a good payload makes the same item as building it step by step
+def test_valid_payload():
+    food, errors = foodType.validate({"foodType": "Nacho Chips", "toppings": ["Chili", "nacho cheese", "chili"]})
+    assert errors == []
+    expected = foodType.make("nacho chips")
+    expected.add_modifier("chili")
+    expected.add_modifier("nacho cheese")
+    assert food.to_receipt() == expected.to_receipt()
+    assert food.get_total_cents() == expected.get_total_cents()
+    assert food.get_codes() == expected.get_codes()
+
+# Testing that every problem is reported at once
+def test_collects_all_errors():
+    drink, errors = drinkType.validate({"size": "huge", "base": "juice", "flavors": ["lime", "mud", "dirt"]})
+    assert drink is None
+    assert errors == ["Invalid size", "Invalid base", "Invalid flavor"]
+    assert drinkType.validate({"flavors": ["lime"]})[1] == ["Size is required", "Invalid base"]
+
+# Testing payloads with the wrong JSON types
+def test_wrong_types():
+    assert foodType.validate({"foodType": 5})[1] == ["Invalid food type"]
+    assert foodType.validate({"foodType": "hotdog", "toppings": "chili"})[1] == ["Invalid topping"]
+    assert iceStormType.validate({"flavor": "banana", "mix_ins": [None]})[1] == ["Invalid mix in"]
+    assert iceStormType.validate(["banana"])[1] == ["Item must be an object"]
+    assert foodType.validate({"foodType": "hotdog", "toppings": None})[1] == []
+
+# Testing that from_json still gives the first error
+def test_from_json_first_error():
+    assert drinkType.from_json({"size": "huge", "base": "juice"}) == (None, "Invalid size")
+
+# Testing that each catalog compiles a validator once
+def test_validator_cached():
+    assert catalog.validator(foodType) is catalog.validator(foodType)
+    assert catalog.validator(foodType) is not catalog.validator(drinkType)
+
+# Testing that the routes and batches report every error
+def test_routes_report_all_errors():
+    client = app.test_client()
+    order_id = client.post("/orders").get_json()["order_id"]
+    response = client.post(f"/orders/{order_id}/food", json={"foodType": "soup", "toppings": ["gravel"]})
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid food type", "errors": ["Invalid food type", "Invalid topping"]}
+
+    items, errors = build_items([{"type": "drink", "size": "huge", "base": "juice"}])
+    assert errors == [{"index": 0, "error": "Invalid size"}, {"index": 0, "error": "Invalid base"}]
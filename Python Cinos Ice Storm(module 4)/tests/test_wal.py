@@ -0,0 +1,249 @@
+# Testing the write-ahead log and replaying it into an order store
+
+import os
+import threading
+
+import pytest
+
+import main
+from main import Drink, Food, Order, OrderStore, app
+from wal import WriteAheadLog, read_log
+
+# Testing that records come back in order with their LSNs
+def test_append_and_read(tmp_path):
+    path = str(tmp_path / "orders.wal")
+    log = WriteAheadLog(path)
+    log.append("create", "a")
+    lsn = log.append("add", "a", {"id": 0, "item": {"type": "food", "foodType": "hotdog"}})
+    log.wait(lsn)
+    log.close()
+    records = list(read_log(path))
+    assert records == [
+        (1, "create", "a", None),
+        (2, "add", "a", {"id": 0, "item": {"type": "food", "foodType": "hotdog"}}),
+    ]
+
+# Testing that LSNs keep going after the log is opened again
+def test_reopen_continues_lsn(tmp_path):
+    path = str(tmp_path / "orders.wal")
+    log = WriteAheadLog(path)
+    log.append("create", "a")
+    log.close()
+    log = WriteAheadLog(path)
+    assert log.append("delete", "a") == 2
+    log.close()
+
+# Testing that a torn record at the end is cut off
+def test_torn_tail_is_dropped(tmp_path):
+    path = str(tmp_path / "orders.wal")
+    log = WriteAheadLog(path)
+    log.append("create", "a")
+    log.append("create", "b")
+    log.close()
+    with open(path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 3)
+    assert [record[2] for record in read_log(path)] == ["a"]
+    log = WriteAheadLog(path)
+    log.append("create", "c")
+    log.close()
+    assert [record[2] for record in read_log(path)] == ["a", "c"]
+
+# Testing that a failed write isn't marked durable, and is written by the next leader
+def test_failed_write(tmp_path):
+    path = str(tmp_path / "orders.wal")
+    log = WriteAheadLog(path)
+    log.wait(log.append("create", "a"))
+    write = log._write
+
+    def fail(fd, data):
+        write(fd, data[:5])
+        raise OSError("disk full")
+
+    log._write = fail
+    with pytest.raises(OSError):
+        log.wait(log.append("create", "b"))
+    with pytest.raises(OSError, match="failed"):
+        log.check()
+    with pytest.raises(OSError, match="failed"):
+        log.wait(log.append("create", "c"))
+    with pytest.raises(OSError):
+        log.close()
+    assert [record[:3] for record in read_log(path)] == [(1, "create", "a")]
+
+# Testing that a failed fsync fails every later wait
+def test_failed_sync(tmp_path, monkeypatch):
+    path = str(tmp_path / "orders.wal")
+    log = WriteAheadLog(path)
+
+    def fail(fd):
+        raise OSError("I/O error")
+
+    monkeypatch.setattr(os, "fsync", fail)
+    lsn = log.append("create", "a")
+    with pytest.raises(OSError):
+        log.wait(lsn)
+    monkeypatch.undo()
+    with pytest.raises(OSError, match="failed"):
+        log.wait(log.append("create", "b"))
+    with pytest.raises(OSError):
+        log.close()
+
+# Testing that changes are refused once the log fails, instead of piling up in memory
+def test_failed_log_refuses_changes(tmp_path, monkeypatch):
+    path = str(tmp_path / "orders.wal")
+    monkeypatch.setattr(main, "store", OrderStore(log=WriteAheadLog(path)))
+    main.store.create_order(main.DEFAULT_ORDER_ID)
+    client = app.test_client()
+    assert client.post('/order/food', json={"foodType": "hotdog"}).status_code == 201
+
+    def fail(fd):
+        raise OSError(5, "Input/output error")
+
+    monkeypatch.setattr(os, "fsync", fail)
+    for _ in range(3):
+        response = client.post('/order/food', json={"foodType": "corndog"})
+        assert response.status_code == 503
+    assert client.get('/order').get_json()["num_items"] == 2
+    assert client.post('/orders').status_code == 503
+    assert client.delete('/order/0').status_code == 503
+    assert client.get('/order').get_json()["num_items"] == 2
+    monkeypatch.undo()
+    assert [record[1] for record in read_log(path)] == ["create", "add"]
+
+# Testing that concurrent writers share fsyncs
+def test_group_commit(tmp_path):
+    path = str(tmp_path / "orders.wal")
+    log = WriteAheadLog(path)
+    start = threading.Barrier(16)
+
+    def writer(n):
+        start.wait()
+        for i in range(20):
+            log.wait(log.append("create", f"{n}-{i}"))
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    log.close()
+    assert len(list(read_log(path))) == 320
+    assert log.syncs < 320
+
+# Testing that a store rebuilt from its log has the same orders
+def test_store_replay(tmp_path):
+    path = str(tmp_path / "orders.wal")
+    store = OrderStore(log=WriteAheadLog(path))
+    store.create_order("a")
+    store.create_order("b")
+    with store.checkout("a") as order:
+        drink = Drink("large")
+        drink.set_base("sbrite")
+        drink.add_flavor("lime")
+        order.add_item(drink)
+        food = Food("hotdog")
+        food.add_topping("chili")
+        order.add_item(food)
+        order.add_item(Food("tater tots"))
+        order.remove_item(1)
+        receipt = order.get_receipt()
+        total = order.get_total()
+    store.delete_order("b")
+    store.log.close()
+
+    restored = OrderStore()
+    assert restored.replay(read_log(path)) == 7
+    assert len(restored) == 1
+    with restored.checkout("a") as order:
+        assert order.get_receipt() == receipt
+        assert order.get_total() == total
+        assert order.add_item(Food("hotdog")) == 3
+
+# Testing that replaying an item id that's already used fails
+def test_replayed_id_used():
+    order = Order()
+    order.add_item(Food("hotdog"), 0)
+    with pytest.raises(ValueError):
+        order.add_item(Food("hotdog"), 0)
+
+def menu_with_foods(newFoods):
+    return main.Catalog(main.sizes, main.bases, main.flavors, main.flavorCost, newFoods, main.toppings,
+                        main.iceStorms, main.mixIns, main.taxRate, main.aliases)
+
+# Testing that replayed items keep the price they were added at
+def test_replay_keeps_prices(tmp_path, monkeypatch):
+    path = str(tmp_path / "orders.wal")
+    store = OrderStore(log=WriteAheadLog(path))
+    store.create_order("a")
+    with store.checkout("a") as order:
+        order.add_item(Food("hotdog"))
+        order.add_item(Food("corndog"))
+    store.log.close()
+
+    monkeypatch.setattr(main, "catalog", menu_with_foods(dict(main.foods, hotdog=9.99)))
+    restored = OrderStore()
+    restored.replay(read_log(path))
+    with restored.checkout("a") as order:
+        assert order.get_total() == 4.30
+
+    monkeypatch.setattr(main, "catalog", menu_with_foods({k: v for k, v in main.foods.items() if k != "corndog"}))
+    restored = OrderStore()
+    restored.replay(read_log(path))
+    with restored.checkout("a") as order:
+        assert [line["foodType"] for line in order.get_receipt()] == ["hotdog", "corndog"]
+        assert order.get_total() == 4.30
+
+# Testing that the store opens after an ordered item comes off the menu
+def test_restart_after_menu_change(tmp_path, monkeypatch):
+    path = str(tmp_path / "orders.wal")
+    monkeypatch.setattr(main, "walPath", path)
+    monkeypatch.setattr(main, "snapshotDir", None)
+    monkeypatch.setattr(main, "store", main.open_store())
+    client = app.test_client()
+    client.post('/order/food', json={"foodType": "corndog", "toppings": ["chili", "nacho cheese"]})
+    client.post('/order', json={"size": "small", "base": "water", "flavors": ["lime"]})
+    receipt = client.get('/order').get_json()
+    assert receipt["num_items"] == 2
+    main.store.log.close()
+
+    newToppings = {k: v for k, v in main.toppings.items() if k != "chili"}
+    monkeypatch.setattr(main, "catalog", main.Catalog(
+        main.sizes, main.bases, main.flavors, main.flavorCost, {k: v for k, v in main.foods.items() if k != "corndog"},
+        newToppings, main.iceStorms, main.mixIns, main.taxRate, main.aliases,
+    ))
+    monkeypatch.setattr(main, "store", main.open_store())
+    assert client.get('/order').get_json() == receipt
+    assert client.post('/order/food', json={"foodType": "corndog"}).status_code == 400
+    main.store.log.close()
+
+# Testing that bulk removes are logged as one record
+def test_store_replay_bulk_remove(tmp_path):
+    path = str(tmp_path / "orders.wal")
+    store = OrderStore(log=WriteAheadLog(path))
+    store.create_order("a")
+    with store.checkout("a") as order:
+        order.add_items([Food("hotdog"), Food("nacho chips"), Drink("small")])
+        order.remove_items(itemType="food")
+    store.log.close()
+    assert list(read_log(path))[-1][1:] == ("remove", "a", {"ids": [0, 1]})
+
+    restored = OrderStore()
+    restored.replay(read_log(path))
+    with restored.checkout("a") as order:
+        assert [item.itemType for item in order.get_items()] == ["drink"]
+
+# Testing that items added through the routes are in the log
+def test_route_changes_logged(tmp_path, monkeypatch):
+    path = str(tmp_path / "orders.wal")
+    monkeypatch.setattr(main, "store", OrderStore(log=WriteAheadLog(path)))
+    main.store.create_order(main.DEFAULT_ORDER_ID)
+    client = app.test_client()
+    client.post('/order/food', json={"foodType": "hotdog", "toppings": ["chili"]})
+    client.post('/order/batch', json={"items": [{"type": "drink", "size": "small", "base": "water"}]})
+    client.delete('/order/0')
+    main.store.log.close()
+
+    restored = OrderStore()
+    restored.replay(read_log(path))
+    with restored.checkout(main.DEFAULT_ORDER_ID) as order:
+        assert [item.itemType for item in order.get_items()] == ["drink"]
@@ -0,0 +1,491 @@
+# Append-only write-ahead log for the order store.
+#
+# Every change to an order is written to the log before the request that
+# made it gets its response, so the orders can be rebuilt after a restart
+# by replaying the log from the start, or from the newest snapshot (see
+# snapshot.py).
+#
+# Each record is one frame:
+#   header   payload length (4 bytes), crc32 (4 bytes), LSN (8 bytes), op (1 byte)
+#   payload  JSON list of the order id and the op's data
+# The crc covers the LSN, op, and payload. A frame that's cut short or has a
+# bad crc marks the end of the log (a crash in the middle of a write), and
+# it's cut off when the log is opened again.
+#
+# Group commit: appending only copies the frame into a buffer. Whoever waits
+# for durability first becomes the leader, writes everything in the buffer,
+# and calls fsync once for all of it, while the records that come in during
+# that fsync pile up for the next leader. So many requests at once share one
+# fsync instead of each paying for their own.
+#
+# If a write or fsync fails, the file is cut back to the end of the last
+# good write and the log is marked failed: every later wait raises, and
+# check lets the store refuse changes before making them, since they could
+# never be saved. Restarting replays only what's really on disk.
+#
+# Segments: when a snapshot starts, the log is rotated, so the file at the
+# log's path is renamed to "<path>.<last LSN>" and a new empty one is started.
+# Rotating is split in two, so the store only has to be paused for the
+# rename: begin_rotate swaps in the new file, and finish_rotate then writes
+# the records that were still buffered to the old one and syncs it, while
+# new records pile up for the new file.
+# Once the snapshot is saved, the segments it covers are deleted, so the log
+# doesn't grow forever, and startup only reads the segments after the
+# newest snapshot.
+#
+# Only one process should write to a log file at a time.
+
+import json
+import os
+import struct
+import threading
+import zlib
+
+# Op codes for each kind of record
+CREATE_ORDER = 1
+DELETE_ORDER = 2
+ADD_ITEM = 3
+REMOVE_ITEMS = 4
+
+opNames = {
+    CREATE_ORDER: "create",
+    DELETE_ORDER: "delete",
+    ADD_ITEM: "add",
+    REMOVE_ITEMS: "remove",
+}
+opCodes = {name: code for code, name in opNames.items()}
+
+# Payload length, crc32, LSN, op code
+header = struct.Struct("<IIQB")
+
+
+def encode_frame(lsn, op, order_id, data):
+    """
+    Makes the bytes for one record.
+
+    Args:
+        lsn (int): log sequence number of the record.
+        op (str): kind of record, a key of opCodes.
+        order_id (str): id of the order the record is for.
+        data: JSON-able data for the op.
+
+    Returns:
+        bytes: the framed record.
+    """
+    payload = json.dumps([order_id, data], separators=(",", ":")).encode()
+    code = opCodes[op]
+    crc = zlib.crc32(payload, zlib.crc32(struct.pack("<QB", lsn, code)))
+    return header.pack(len(payload), crc, lsn, code) + payload
+
+
+def scan_frames(buffer, start=0, afterLsn=0):
+    """
+    Reads the good frames from a buffer of log bytes.
+
+    Frames up to afterLsn (ones a snapshot already has) are stepped over
+    without being checked or decoded.
+
+    Args:
+        buffer (bytes): log bytes, or anything that supports slicing them (like mmap).
+        start (int): offset of the first frame.
+        afterLsn (int): only yield frames with a higher LSN than this.
+
+    Yields:
+        tuple: LSN, op name, order id, data, and the offset just past the frame.
+    """
+    offset = start
+    end = len(buffer)
+    while offset + header.size <= end:
+        length, crc, lsn, code = header.unpack_from(buffer, offset)
+        bodyStart = offset + header.size
+        if code not in opNames or bodyStart + length > end:
+            return
+        if lsn <= afterLsn:
+            offset = bodyStart + length
+            continue
+        payload = bytes(buffer[bodyStart:bodyStart + length])
+        if zlib.crc32(payload, zlib.crc32(struct.pack("<QB", lsn, code))) != crc:
+            return
+        order_id, data = json.loads(payload)
+        offset = bodyStart + length
+        yield lsn, opNames[code], order_id, data, offset
+
+
+def segment_path(path, lastLsn):
+    """
+    Makes the path a log file is renamed to when it's rotated.
+
+    Args:
+        path (str): path of the log.
+        lastLsn (int): LSN of the last record in the segment.
+
+    Returns:
+        str: path of the segment.
+    """
+    return f"{path}.{lastLsn:020d}"
+
+
+def list_segments(path):
+    """
+    Finds the rotated segments of a log.
+
+    Args:
+        path (str): path of the log.
+
+    Returns:
+        list: last LSN and path of each segment, oldest first.
+    """
+    folder = os.path.dirname(path) or "."
+    prefix = os.path.basename(path) + "."
+    if not os.path.isdir(folder):
+        return []
+    segments = []
+    for name in os.listdir(folder):
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and len(suffix) == 20 and suffix.isdigit():
+            segments.append((int(suffix), os.path.join(folder, name)))
+    return sorted(segments)
+
+
+def read_log(path, afterLsn=0):
+    """
+    Reads the good records in a log, from the segments that have records
+    after afterLsn and then the current file.
+
+    Args:
+        path (str): path of the log.
+        afterLsn (int): only read records with a higher LSN than this, like
+            the LSN of the snapshot the orders were loaded from.
+
+    Yields:
+        tuple: LSN, op name, order id, and data of each record.
+    """
+    paths = [segment for lastLsn, segment in list_segments(path) if lastLsn > afterLsn]
+    if os.path.exists(path):
+        paths.append(path)
+    for filePath in paths:
+        with open(filePath, "rb") as f:
+            buffer = f.read()
+        for lsn, op, order_id, data, _ in scan_frames(buffer, afterLsn=afterLsn):
+            yield lsn, op, order_id, data
+
+
+def sync_folder(path):
+    """
+    Makes renames and deletes in the folder of a file durable.
+
+    Args:
+        path (str): path of a file in the folder.
+    """
+    fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    """
+    Append-only log file with group commit.
+
+    Attributes:
+        path (str): path of the log file.
+        sync (bool): whether to fsync, turning it off keeps the ordering but not crash safety.
+        _fd (int): the log file, opened for appending.
+        _goodEnd (int): size of the file after the last good write.
+        _failed (OSError): why the log can't save records anymore, None if it can.
+        _lock (Lock): guards everything below.
+        _flushed (Condition): notified every time a group of records is durable.
+        _buffer (bytearray): frames that haven't been written yet.
+        _nextLsn (int): LSN the next record gets.
+        _durableLsn (int): every record up to this LSN is on disk.
+        _flushing (bool): whether a leader is writing right now.
+        _rotation (tuple): old file, its buffered frames, and its last LSN,
+            between begin_rotate and finish_rotate, None otherwise.
+        syncs (int): number of fsyncs done, for seeing how well commits group.
+    """
+
+    def __init__(self, path, sync=True, startLsn=0):
+        """
+        Opens the log, cutting off any torn record at the end. Only the
+        current file is read, the segments before it are already whole.
+
+        Args:
+            path (str): path of the log file, made if it doesn't exist.
+            sync (bool): whether to fsync.
+            startLsn (int): lowest LSN already used, like a snapshot's, so new
+                records never get an LSN the snapshot covers.
+        """
+        self.path = path
+        self.sync = sync
+        lastLsn = 0
+        goodEnd = 0
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                buffer = f.read()
+            for lsn, _, _, _, goodEnd in scan_frames(buffer):
+                lastLsn = lsn
+            if goodEnd < len(buffer):
+                with open(path, "r+b") as f:
+                    f.truncate(goodEnd)
+        segments = list_segments(path)
+        if segments:
+            lastLsn = max(lastLsn, segments[-1][0])
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._goodEnd = os.fstat(self._fd).st_size
+        self._failed = None
+        self._lock = threading.Lock()
+        self._flushed = threading.Condition(self._lock)
+        self._buffer = bytearray()
+        lastLsn = max(lastLsn, startLsn)
+        self._nextLsn = lastLsn + 1
+        self._durableLsn = lastLsn
+        self._flushing = False
+        self._rotation = None
+        self.syncs = 0
+
+    def append(self, op, order_id, data=None):
+        """
+        Adds a record to the log without waiting for it to be on disk.
+
+        Records are written in the order append is called, so callers that
+        need an order between records should append while holding the lock
+        that orders their changes.
+
+        Args:
+            op (str): kind of record, a key of opCodes.
+            order_id (str): id of the order the record is for.
+            data: JSON-able data for the op.
+
+        Returns:
+            int: LSN of the record, to pass to wait.
+        """
+        with self._lock:
+            lsn = self._nextLsn
+            self._nextLsn += 1
+            self._buffer += encode_frame(lsn, op, order_id, data)
+            return lsn
+
+    def wait(self, lsn):
+        """
+        Blocks until the record with this LSN (and every one before it) is
+        on disk.
+
+        Args:
+            lsn (int): LSN returned by append.
+
+        Raises:
+            OSError: if writing the log failed, or it failed before.
+        """
+        with self._flushed:
+            while self._durableLsn < lsn:
+                if self._failed is not None:
+                    raise OSError(f"Write-ahead log failed: {self._failed}")
+                if self._flushing or self._rotation is not None:
+                    self._flushed.wait()
+                    continue
+                # Become the leader and write out everything buffered so far
+                self._flushing = True
+                data = bytes(self._buffer)
+                self._buffer.clear()
+                target = self._nextLsn - 1
+                fd = self._fd
+                goodEnd = self._goodEnd
+                self._lock.release()
+                error = None
+                try:
+                    self._flush(fd, goodEnd, data)
+                except OSError as e:
+                    error = e
+                finally:
+                    self._lock.acquire()
+                self._flushing = False
+                if error is None:
+                    # The file may have been rotated away while writing
+                    if fd == self._fd:
+                        self._goodEnd += len(data)
+                    self._durableLsn = target
+                    self.syncs += 1
+                self._flushed.notify_all()
+                if error is not None:
+                    raise error
+
+    def _write(self, fd, data):
+        """
+        Writes bytes to the end of a file.
+
+        Args:
+            fd (int): the file.
+            data (bytes): bytes to write.
+        """
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+
+    def _flush(self, fd, goodEnd, data):
+        """
+        Writes a group of frames and syncs them. If either fails, the file
+        is cut back to where it was and the log is marked failed. Called by
+        the leader without the lock.
+
+        Args:
+            fd (int): the file, which may have been rotated away since.
+            goodEnd (int): size of the file after its last good write.
+            data (bytes): the frames.
+
+        Raises:
+            OSError: if the frames aren't durable.
+        """
+        try:
+            self._write(fd, data)
+            if self.sync:
+                os.fsync(fd)
+        except OSError as error:
+            self._failed = error
+            try:
+                os.ftruncate(fd, goodEnd)
+            except OSError:
+                pass
+            raise
+
+    def check(self):
+        """
+        Makes sure the log can still save records, so callers can refuse a
+        change before making it.
+
+        Raises:
+            OSError: if the log has failed.
+        """
+        if self._failed is not None:
+            raise OSError(f"Write-ahead log failed: {self._failed}")
+
+    def rotate(self):
+        """
+        Moves the current file aside as a segment and starts a new one,
+        waiting until the segment is durable.
+
+        Returns:
+            int: LSN of the last record before the new file.
+
+        Raises:
+            OSError: if the log failed, or the file can't be moved or synced.
+        """
+        lastLsn = self.begin_rotate()
+        self.finish_rotate()
+        return lastLsn
+
+    def begin_rotate(self):
+        """
+        Moves the current file aside as a segment and starts a new one, so
+        the records up to now can be deleted once a snapshot has them. It
+        only renames and opens files, so it's quick enough to call with the
+        store paused. Call finish_rotate after, since nothing after the
+        rotation is written until then.
+
+        Returns:
+            int: LSN of the last record before the new file.
+
+        Raises:
+            OSError: if the log failed or the file can't be moved, in which
+                case nothing changed.
+        """
+        with self._lock:
+            self.check()
+            if self._rotation is not None:
+                raise OSError("Write-ahead log is already being rotated")
+            lastLsn = self._nextLsn - 1
+            if not self._goodEnd and not self._buffer and not self._flushing:
+                return lastLsn
+            segment = segment_path(self.path, lastLsn)
+            os.rename(self.path, segment)
+            try:
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            except OSError:
+                os.rename(segment, self.path)
+                raise
+            self._rotation = (self._fd, bytes(self._buffer), lastLsn)
+            self._buffer.clear()
+            self._fd = fd
+            self._goodEnd = 0
+            return lastLsn
+
+    def finish_rotate(self):
+        """
+        Writes the records that were still buffered when begin_rotate ran to
+        the segment, syncs it and the rename, and closes it. Records after
+        the rotation wait for it, so they're never durable before the ones
+        in the segment.
+
+        Raises:
+            OSError: if the segment can't be written or synced, which marks
+                the log failed.
+        """
+        with self._flushed:
+            if self._rotation is None:
+                return
+            # A leader that started before the rotation may still be writing to the old file
+            while self._flushing:
+                self._flushed.wait()
+            oldFd, data, lastLsn = self._rotation
+            self._flushing = True
+            self._lock.release()
+            error = None
+            try:
+                if self._failed is None:
+                    self._write(oldFd, data)
+                    if self.sync:
+                        os.fsync(oldFd)
+                        sync_folder(self.path)
+            except OSError as e:
+                self._failed = error = e
+            finally:
+                os.close(oldFd)
+                self._lock.acquire()
+            self._flushing = False
+            self._rotation = None
+            if self._failed is None:
+                self._durableLsn = max(self._durableLsn, lastLsn)
+                self.syncs += 1
+            self._flushed.notify_all()
+            if error is not None:
+                raise error
+
+    def drop_segments(self, upToLsn):
+        """
+        Deletes the segments whose records are all at or below an LSN, like
+        the ones a saved snapshot has.
+
+        Args:
+            upToLsn (int): LSN of the snapshot.
+
+        Returns:
+            int: number of segments deleted.
+        """
+        dropped = 0
+        for lastLsn, segment in list_segments(self.path):
+            if lastLsn <= upToLsn:
+                os.remove(segment)
+                dropped += 1
+        if dropped:
+            sync_folder(self.path)
+        return dropped
+
+    def last_lsn(self):
+        """
+        Returns the LSN of the newest record, written or not.
+
+        Returns:
+            int: the LSN, 0 if the log is empty.
+        """
+        with self._lock:
+            return self._nextLsn - 1
+
+    def close(self):
+        """
+        Writes anything still buffered and closes the file.
+        """
+        try:
+            self.finish_rotate()
+            self.wait(self.last_lsn())
+        finally:
+            os.close(self._fd)